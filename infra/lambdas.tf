@@ -49,6 +49,13 @@ module "search_lambda" {
   api_gw_id            = aws_apigatewayv2_api.lambda.id
   api_gw_execution_arn = aws_apigatewayv2_api.lambda.execution_arn
   enable_authorizer    = false
+  # The username index (search/index.py) is built in the container on its
+  # first search: about 450 MiB and 11 s of CPU at 1M users. 1769 MB is one
+  # full vCPU, and 30 s is as long as API Gateway waits for the first search.
+  # At 10 ms per query a million searches cost about $0.27, and each cold
+  # start about $0.0005, more than at 128 MB.
+  memory_size = 1769
+  timeout     = 30
 
   env_var = {
     DB_NAME     = var.cockroach_sql_database
@@ -92,12 +99,16 @@ module "popcorn_lambda" {
   enable_authorizer    = false
 
   env_var = {
-    DB_NAME      = var.cockroach_sql_database
-    DB_USER      = var.db_popcorn_user
-    DB_PASSWORD  = var.db_popcorn_password
-    DB_HOST      = var.cockroach_sql_host
-    DB_PORT      = var.cockroach_sql_port
-    app_base_url = var.app_base_url
+    DB_NAME              = var.cockroach_sql_database
+    DB_USER              = var.db_popcorn_user
+    DB_PASSWORD          = var.db_popcorn_password
+    DB_HOST              = var.cockroach_sql_host
+    DB_PORT              = var.cockroach_sql_port
+    DB_ASYNC             = "false"
+    INVITE_CODE_TASK_ID  = var.invite_code_task_id
+    INVITE_CODE_KEY      = var.invite_code_key
+    SOCIAL_JOB_QUEUE_URL = aws_sqs_queue.social_jobs.url
+    app_base_url         = var.app_base_url
   }
 }
 
@@ -160,6 +171,8 @@ resource "aws_apigatewayv2_authorizer" "lambda_authorizer" {
   authorizer_credentials_arn = aws_iam_role.apig_lambda_role.arn
   authorizer_uri = module.authorizer_lambda.invoke_arn
   authorizer_payload_format_version = "2.0"
+  # Policies cover the whole stage, so one cached result serves every route
+  authorizer_result_ttl_in_seconds = 300
 }
 
 data "aws_iam_policy_document" "apig_lambda_policy" {
@@ -201,6 +214,95 @@ resource "aws_iam_role_policy_attachment" "apig_lambda_role_to_policy" {
   policy_arn = aws_iam_policy.apig_lambda.arn
 }
 
+####################################
+# SOCIAL CALLBACK JOBS
+####################################
+# The popcorn callbacks queue jobs here (popcorn/jobs.py) and the social
+# worker drains them (popcorn/worker.py). Jobs that still fail after
+# maxReceiveCount deliveries end up in the dead letter queue.
+resource "aws_sqs_queue" "social_jobs_dead_letter" {
+  name                      = "sw-social-jobs-dead-letter"
+  message_retention_seconds = 1209600
+}
+
+resource "aws_sqs_queue" "social_jobs" {
+  name = "sw-social-jobs"
+  # At least six times the worker's timeout
+  visibility_timeout_seconds = 360
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.social_jobs_dead_letter.arn
+    maxReceiveCount     = 5
+  })
+}
+
+data "aws_iam_policy_document" "social_jobs_send" {
+  statement {
+    actions   = ["sqs:SendMessage"]
+    effect    = "Allow"
+    resources = [aws_sqs_queue.social_jobs.arn]
+  }
+}
+
+resource "aws_iam_role_policy" "popcorn_social_jobs_send" {
+  name   = "social-jobs-send"
+  role   = module.popcorn_lambda.role_name
+  policy = data.aws_iam_policy_document.social_jobs_send.json
+}
+
+# Same package as the popcorn Lambda, without an API route
+data "aws_s3_object" "popcorn_package" {
+  bucket = var.bucket_name
+  key    = "lambda-packages/popcorn.zip"
+}
+
+resource "aws_iam_role" "social_worker" {
+  name = format("%s_%s", var.aws_region, "social_worker")
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Action = "sts:AssumeRole"
+      Effect = "Allow"
+      Principal = {
+        Service = "lambda.amazonaws.com"
+      }
+    }]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "social_worker_sqs" {
+  role       = aws_iam_role.social_worker.name
+  policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaSQSQueueExecutionRole"
+}
+
+resource "aws_lambda_function" "social_worker" {
+  function_name    = "social_worker"
+  handler          = "popcorn.worker.sqs_handler"
+  role             = aws_iam_role.social_worker.arn
+  runtime          = "python3.12"
+  s3_bucket        = var.bucket_name
+  s3_key           = data.aws_s3_object.popcorn_package.key
+  source_code_hash = data.aws_s3_object.popcorn_package.etag
+  timeout          = 60
+
+  environment {
+    variables = {
+      DB_NAME     = var.cockroach_sql_database
+      DB_USER     = var.db_popcorn_user
+      DB_PASSWORD = var.db_popcorn_password
+      DB_HOST     = var.cockroach_sql_host
+      DB_PORT     = var.cockroach_sql_port
+    }
+  }
+}
+
+resource "aws_lambda_event_source_mapping" "social_jobs" {
+  event_source_arn        = aws_sqs_queue.social_jobs.arn
+  function_name           = aws_lambda_function.social_worker.arn
+  batch_size              = 50
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
 ####################################
 # LAMBDA LAYERS 
 ####################################
@@ -6,6 +6,8 @@ resource "aws_lambda_function" "this" {
     s3_bucket           = data.aws_s3_bucket.lambda_bucket.id
     s3_key              = "lambda-packages/${var.function_name}.zip"
     source_code_hash = data.aws_s3_object.lambda_package.etag
+    memory_size         = var.memory_size
+    timeout             = var.timeout
 
     # Only update if the S3 object is not empty
     # lifecycle {
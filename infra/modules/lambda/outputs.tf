@@ -18,4 +18,9 @@ output "function_name" {
 output "lambda_bucket_name" {
   description = "Name of the S3 bucket used to store function code."
   value = data.aws_s3_bucket.lambda_bucket.id
-}
\ No newline at end of file
+}
+
+output "role_name" {
+  description = "Name of the function's execution role"
+  value = aws_iam_role.lambda_exec.name
+}
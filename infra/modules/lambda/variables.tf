@@ -56,4 +56,16 @@ variable "authorizer_id" {
   description = "Authorizer for the lambda"
   type        = string
   default     = null
-}
\ No newline at end of file
+}
+
+variable "memory_size" {
+  description = "Memory of the lambda function in MB, CPU scales with it"
+  type        = number
+  default     = 128
+}
+
+variable "timeout" {
+  description = "Timeout of the lambda function in seconds"
+  type        = number
+  default     = 3
+}
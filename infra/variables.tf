@@ -185,4 +185,14 @@ variable "twitter_secret" {
 variable "app_base_url" {
   description = "frontend app url"
   type        = string
-}
\ No newline at end of file
+}
+variable "invite_code_task_id" {
+  description = "multiplier_tasks id awarded for applying a user invite code"
+  type        = string
+}
+
+variable "invite_code_key" {
+  description = "Key of the invite code permutation, must never change once codes exist"
+  type        = string
+  sensitive   = true
+}
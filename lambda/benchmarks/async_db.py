@@ -0,0 +1,123 @@
+"""Popcorn reads over psycopg2 vs asyncpg (``DB_ASYNC``) at equal concurrency.
+
+Both modes keep ``--concurrency`` requests in flight: the sync path on that
+many threads, the async path as coroutines on one event loop, where the
+queries of a request that don't depend on each other run at the same time.
+Both pools are capped at ``DB_POOL_MAX_CONNECTIONS`` (32 unless set).
+Compares current and historical ``/popcorn`` reads and
+``/leaderboard?user_id=`` against existing users in the configured database.
+
+Usage: python benchmarks/async_db.py [--requests 2000] [--concurrency 1,8,32]
+                                     [--users 200] [--days-back 7]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from common import add_function_paths, report
+
+os.environ.setdefault("DB_POOL_MAX_CONNECTIONS", "32")
+add_function_paths("popcorn")
+
+from shared.aiodb import close_async_pool, run  # noqa: E402
+from shared.db import get_db_connection, get_pool  # noqa: E402
+from popcorn.ledger import popcorn_at, popcorn_at_async  # noqa: E402
+from popcorn.leaderboard import leaderboard_async, top_users, user_rank  # noqa: E402
+
+
+def sync_popcorn(user_id, at):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            return popcorn_at(cur, user_id, at)
+
+
+def sync_leaderboard(user_id, at):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            return top_users(cur, at, 10), user_rank(cur, user_id, at)
+
+
+def run_sync(read, requests, concurrency):
+    def timed(args):
+        start = time.perf_counter()
+        read(*args)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, requests))
+    return latencies, time.perf_counter() - start
+
+
+async def run_async(read, requests, concurrency):
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def timed(args):
+        async with in_flight:
+            start = time.perf_counter()
+            await read(*args)
+            return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(args) for args in requests))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--days-back", type=float, default=7)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM users ORDER BY id LIMIT %s", (args.users,))
+            user_ids = [row[0] for row in cur.fetchall()]
+    rng = random.Random(args.seed)
+    sample = [rng.choice(user_ids) for _ in range(args.requests)]
+    now = datetime.now(timezone.utc)
+    past = now - timedelta(days=args.days_back)
+
+    workloads = [
+        (
+            "popcorn current",
+            sync_popcorn,
+            popcorn_at_async,
+            [(user_id, now) for user_id in sample],
+        ),
+        (
+            "popcorn historical",
+            sync_popcorn,
+            lambda user_id, at: popcorn_at_async(user_id, at, historical=True),
+            [(user_id, past) for user_id in sample],
+        ),
+        (
+            "leaderboard",
+            sync_leaderboard,
+            lambda user_id, at: leaderboard_async(at, 10, user_id),
+            [(user_id, now) for user_id in sample],
+        ),
+    ]
+    for concurrency in [int(level) for level in args.concurrency.split(",")]:
+        for name, sync_read, async_read, requests in workloads:
+            for mode, latencies, elapsed in [
+                ("sync", *run_sync(sync_read, requests, concurrency)),
+                ("async", *run(run_async(async_read, requests, concurrency))),
+            ]:
+                report(f"{name} {mode} c={concurrency}", latencies)
+                print(f"{'':<32} {len(latencies) / elapsed:10.0f} req/s")
+
+    run(close_async_pool())
+    get_pool().close_all()
+
+
+if __name__ == "__main__":
+    main()
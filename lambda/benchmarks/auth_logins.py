@@ -0,0 +1,120 @@
+"""Wallet login throughput: one signature and one user insert at a time vs the
+batched /access_token/bulk path.
+
+Signatures are checked with a fresh VerifyKey per call (the old path), with
+the per-address key cache, and with the parallel batch verifier. With --db,
+N single-row user inserts are also compared with one multi-row insert (the
+inserted wallets are deleted again afterwards).
+
+Usage: python benchmarks/auth_logins.py [--logins 2000] [--db]
+"""
+
+import argparse
+import time
+
+from common import add_function_paths, use_placeholder_env
+
+use_placeholder_env()
+
+add_function_paths("auth")
+
+import base58  # noqa: E402
+from nacl.signing import SigningKey, VerifyKey  # noqa: E402
+
+from auth import signatures  # noqa: E402
+
+
+def verify_uncached(pairs):
+    results = []
+    for signature, public_key in pairs:
+        key = VerifyKey(base58.b58decode(public_key))
+        key.verify(signatures.MESSAGE_TO_SIGN, base58.b58decode(signature))
+        results.append(True)
+    return results
+
+
+def verify_cached(pairs):
+    return [signatures.verify_signature(*pair) for pair in pairs]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def make_logins(count):
+    pairs = []
+    for _ in range(count):
+        signing_key = SigningKey.generate()
+        signature = signing_key.sign(signatures.MESSAGE_TO_SIGN).signature
+        pairs.append(
+            (
+                base58.b58encode(signature).decode(),
+                base58.b58encode(bytes(signing_key.verify_key)).decode(),
+            )
+        )
+    return pairs
+
+
+def compare_inserts(public_keys):
+    from auth.handler import create_users
+    from shared.db import get_db_connection
+
+    def single_inserts():
+        for public_key in public_keys:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    create_users(cur, [public_key])
+
+    def one_insert():
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                create_users(cur, public_keys)
+
+    def delete_users():
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM user_popcorn_ledger WHERE user_id IN "
+                    "(SELECT id FROM users WHERE wallet_address = ANY(%s))",
+                    (public_keys,),
+                )
+                cur.execute(
+                    "DELETE FROM users WHERE wallet_address = ANY(%s)", (public_keys,)
+                )
+
+    for name, fn in [
+        ("single-row inserts", single_inserts),
+        ("one insert", one_insert),
+    ]:
+        _, ms = timed(fn)
+        delete_users()
+        print(f"{name:<28} {ms:10.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--db", action="store_true", help="also compare inserts")
+    args = parser.parse_args()
+
+    pairs = make_logins(args.logins)
+    _, uncached_ms = timed(verify_uncached, pairs)
+    _, cold_ms = timed(signatures.verify_signatures, pairs)
+    _, warm_ms = timed(verify_cached, pairs)
+    valid, parallel_ms = timed(signatures.verify_signatures, pairs)
+    assert all(valid)
+
+    print(f"logins={len(pairs)} workers={signatures.VERIFY_WORKERS}")
+    print(f"{'fresh VerifyKey per call':<28} {uncached_ms:10.1f}ms")
+    print(f"{'batch, cold key cache':<28} {cold_ms:10.1f}ms")
+    print(f"{'sequential, warm key cache':<28} {warm_ms:10.1f}ms")
+    print(f"{'batch, warm key cache':<28} {parallel_ms:10.1f}ms")
+
+    if args.db:
+        compare_inserts([public_key for _, public_key in pairs])
+
+
+if __name__ == "__main__":
+    main()
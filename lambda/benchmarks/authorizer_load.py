@@ -0,0 +1,83 @@
+"""Authorizer token verification: jwt.decode on every call vs the token cache.
+
+Replays a stream of requests in which each client reuses its token, the way
+API Gateway calls the authorizer, and reports wall-clock latency percentiles
+and CPU time per request for both paths.
+
+Usage: python benchmarks/authorizer_load.py [--clients 1000] [--requests 50000]
+"""
+
+import argparse
+import os
+import random
+import time
+
+from common import add_function_paths, report
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-of-at-least-32-bytes")
+
+add_function_paths("authorizer")
+
+import jwt  # noqa: E402
+
+from authorizer import tokens  # noqa: E402
+
+
+def decode_every_time(token):
+    return tokens.decode_token(token).principal_id
+
+
+def cached(token):
+    return tokens.verify_token(token).principal_id
+
+
+def run(verify, stream):
+    """Verify every token of ``stream``, returning (latencies in ms, CPU
+    microseconds per request)."""
+    samples = []
+    cpu_start = time.process_time()
+    for token in stream:
+        start = time.perf_counter()
+        verify(token)
+        samples.append((time.perf_counter() - start) * 1000)
+    cpu_us = (time.process_time() - cpu_start) * 1e6 / len(stream)
+    return samples, cpu_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    exp = int(time.time()) + 3600
+    client_tokens = [
+        jwt.encode(
+            {"principalId": f"client-{i}", "exp": exp},
+            tokens.JWT_SECRET,
+            algorithm="HS256",
+        )
+        for i in range(args.clients)
+    ]
+    # A few clients make most of the requests
+    weights = [1 / (rank + 1) for rank in range(args.clients)]
+    stream = rng.choices(client_tokens, weights=weights, k=args.requests)
+
+    for token in client_tokens[:10]:
+        assert decode_every_time(token) == cached(token)
+    tokens.token_cache.clear()
+
+    for name, verify in [
+        ("jwt.decode per call", decode_every_time),
+        ("cached", cached),
+    ]:
+        samples, cpu_us = run(verify, stream)
+        report(name, samples)
+        print(f"{'':<32} cpu={cpu_us:.2f}us/request")
+    print(f"cache hits={tokens.token_cache.hits} misses={tokens.token_cache.misses}")
+
+
+if __name__ == "__main__":
+    main()
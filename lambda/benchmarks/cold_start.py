@@ -0,0 +1,102 @@
+"""Import time of every Lambda handler, as measured by ``python -X importtime``.
+
+Each handler is imported in a fresh interpreter, the way a cold start would,
+and the script exits non-zero when a handler exceeds its budget in
+``IMPORT_BUDGETS_MS``.
+
+Usage: python benchmarks/cold_start.py [--eager] [--top 10] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from common import FUNCTIONS_DIR, IMPORT_ENV
+
+# Cumulative import time of <function>.handler in milliseconds, measured on a
+# developer machine. Most of it is aws_xray_sdk (Tracer), powertools and psycopg2.
+IMPORT_BUDGETS_MS = {
+    "auth": 850,
+    "authorizer": 300,
+    "connections": 850,
+    "popcorn": 900,
+    "search": 850,
+    "seat": 850,
+    "user": 850,
+}
+
+
+def parse_importtime(stderr):
+    """Return ``{module: (self_us, cumulative_us)}`` from ``-X importtime``."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure_function(name, eager):
+    env = dict(os.environ, **IMPORT_ENV)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [FUNCTIONS_DIR, os.path.join(FUNCTIONS_DIR, name)]
+    )
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    env["COLD_START_LAZY_IMPORTS"] = "false" if eager else "true"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {name}.handler"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    modules = parse_importtime(result.stderr)
+    if result.returncode != 0 or f"{name}.handler" not in modules:
+        return {"error": result.stderr.strip().splitlines()[-1:]}
+    return {
+        "total_ms": modules[f"{name}.handler"][1] / 1000,
+        "modules_ms": {
+            module: cumulative / 1000 for module, (_, cumulative) in modules.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--eager", action="store_true", help="disable lazy imports")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results, over_budget = {}, []
+    for name, budget in IMPORT_BUDGETS_MS.items():
+        result = results[name] = measure_function(name, args.eager)
+        if "error" in result:
+            print(f"{name:<12} failed to import: {result['error']}")
+            over_budget.append(name)
+            continue
+
+        status = "ok" if result["total_ms"] <= budget else "OVER BUDGET"
+        print(f"{name:<12} {result['total_ms']:8.1f}ms (budget {budget}ms) {status}")
+        top_level = {
+            module: ms
+            for module, ms in result["modules_ms"].items()
+            if "." not in module
+        }
+        for module, ms in sorted(top_level.items(), key=lambda m: -m[1])[: args.top]:
+            print(f"    {module:<40} {ms:8.1f}ms")
+        if status != "ok":
+            over_budget.append(name)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if over_budget:
+        print(f"Import budget exceeded: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
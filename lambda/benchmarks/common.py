@@ -0,0 +1,144 @@
+"""Helpers shared by the benchmark scripts in this directory.
+
+The scripts are run from the ``lambda`` directory against a local Postgres or
+CockroachDB, configured through the same ``DB_*`` environment variables the
+Lambdas use, e.g.::
+
+    DB_NAME=sandwatch DB_USER=postgres DB_PASSWORD=postgres \\
+    DB_HOST=localhost DB_PORT=5432 python benchmarks/db_pool.py
+"""
+
+import importlib
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+FUNCTIONS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "functions"
+)
+
+# Placeholder configuration so the handlers can be imported without AWS
+IMPORT_ENV = {
+    "DB_NAME": "sandwatch",
+    "DB_USER": "sandwatch",
+    "DB_PASSWORD": "sandwatch",
+    "DB_HOST": "localhost",
+    "DB_PORT": "26257",
+    "APP_BASE_URL": "http://localhost",
+    "BASE_URL": "http://localhost",
+    "JWT_SECRET": "secret",
+    "JWT_REFRESH_SECRET": "refresh-secret",
+    "TELEGRAM_CLIENT_ID": "id",
+    "TELEGRAM_SECRET": "secret",
+    "DISCORD_CLIENT_ID": "id",
+    "DISCORD_SECRET": "secret",
+    "INSTAGRAM_CLIENT_ID": "id",
+    "INSTAGRAM_SECRET": "secret",
+    "TWITTER_CLIENT_ID": "id",
+    "TWITTER_SECRET": "secret",
+    "USERNAME_FILTER_PRELOAD": "false",
+    "METRICS_MODE": "off",
+    "INVITE_CODE_KEY": "benchmark-invite-code-key",
+}
+
+
+def use_placeholder_env():
+    """Fill in ``IMPORT_ENV`` for anything not configured, so handlers can be
+    imported in-process."""
+    for key, value in IMPORT_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "true")
+
+
+def add_function_paths(*names):
+    """Make ``shared`` and the given Lambda packages importable."""
+    paths = [FUNCTIONS_DIR] + [os.path.join(FUNCTIONS_DIR, name) for name in names]
+    for path in paths:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+CONTEXT = SimpleNamespace(
+    function_name="benchmark",
+    memory_limit_in_mb=128,
+    invoked_function_arn="arn:aws:lambda:us-east-1:000000000000:function:benchmark",
+    aws_request_id="benchmark",
+)
+
+
+def api_gateway_event(method, path, body=None, query=None):
+    """A REST API proxy event for ``path`` relative to the /v1 stage."""
+    return {
+        "resource": "/{proxy+}",
+        "path": "/v1" + path,
+        "httpMethod": method,
+        "headers": {"Content-Type": "application/json"},
+        "multiValueHeaders": {},
+        "queryStringParameters": query,
+        "multiValueQueryStringParameters": (
+            {key: [value] for key, value in query.items()} if query else None
+        ),
+        "pathParameters": None,
+        "stageVariables": None,
+        "requestContext": {
+            "stage": "v1",
+            "requestId": "benchmark",
+            "httpMethod": method,
+            "path": "/v1" + path,
+        },
+        "body": body,
+        "isBase64Encoded": False,
+    }
+
+
+def load_handler(name, allow_missing=False):
+    """The ``lambda_handler`` of function ``name``. A handler that fails to
+    import ends the run with a non-zero status, unless ``allow_missing``: then
+    it is reported as skipped and None is returned."""
+    try:
+        return importlib.import_module(f"{name}.handler").lambda_handler
+    except Exception as e:
+        if not allow_missing:
+            sys.exit(f"{name} handler failed to import: {e!r}")
+        print(f"{name:<12} skipped, handler failed to import: {e!r}")
+        return None
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(fn, iterations, warmup=0):
+    """Call ``fn`` repeatedly and return per-call latencies in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "mean_ms": sum(samples) / len(samples) if samples else 0.0,
+    }
+
+
+def report(name, samples):
+    stats = summarize(samples)
+    print(
+        f"{name:<32} n={stats['count']:<6} p50={stats['p50_ms']:8.3f}ms "
+        f"p95={stats['p95_ms']:8.3f}ms p99={stats['p99_ms']:8.3f}ms"
+    )
+    return stats
@@ -0,0 +1,52 @@
+"""Latency of a trivial query with a fresh connection per request vs the pool.
+
+Usage: python benchmarks/db_pool.py [--requests 500]
+"""
+
+import argparse
+
+from common import add_function_paths, measure, report
+
+add_function_paths()
+
+import psycopg2  # noqa: E402
+
+from shared import constants  # noqa: E402
+from shared.db import get_db_connection, get_pool  # noqa: E402
+
+
+def query_with_fresh_connection():
+    conn = psycopg2.connect(
+        dbname=constants.DB_NAME,
+        user=constants.DB_USER,
+        password=constants.DB_PASSWORD,
+        host=constants.DB_HOST,
+        port=constants.DB_PORT,
+    )
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+            cur.fetchone()
+    finally:
+        conn.close()
+
+
+def query_with_pool():
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+            cur.fetchone()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    report("fresh connection", measure(query_with_fresh_connection, args.requests))
+    report("pooled connection", measure(query_with_pool, args.requests, warmup=1))
+    get_pool().close_all()
+
+
+if __name__ == "__main__":
+    main()
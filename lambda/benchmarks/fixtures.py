@@ -0,0 +1,441 @@
+"""Synthetic users, tasks, seats and invite codes at production-like volumes.
+
+Rows are generated ``--chunk-size`` users at a time and streamed into the
+tables with ``COPY FROM STDIN``, one transaction per chunk, so memory stays
+flat at millions of users and an interrupted run can be resumed. Fixture user
+``n`` has id ``FIXTURE_ID_BASE + n`` and wallet address ``loadtest-<n>``, and
+its username, signup date and tasks only depend on ``--seed`` and ``n``.
+Re-running with a larger ``--users`` adds the missing users; the invite codes
+and seats are topped up the same way.
+
+The distributions are skewed like real sign-ups:
+
+- signup dates lean towards the end of the last year (the user base grows),
+- tasks per user follow a Pareto distribution averaging ``--tasks-per-user``:
+  most users have a handful, a few have hundreds,
+- tasks are performed soon after signup rather than evenly since, and popular
+  tasks are picked far more often than others (Zipf),
+- some users have no username, and only some have a USR- invite code.
+
+The popcorn ledger and its checkpoints are folded from the generated tasks
+with ``popcorn.ledger.fold_events``, as the Lambdas would have written them.
+multiplier_tasks and seat_types are only filled in when they are empty.
+
+Usage: python benchmarks/fixtures.py --users 1000000 [--tasks-per-user 5] [--seed 0]
+"""
+
+import argparse
+import io
+import random
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from common import add_function_paths, use_placeholder_env
+
+use_placeholder_env()
+add_function_paths("popcorn", "seat")
+
+from psycopg2.extras import execute_values  # noqa: E402
+
+from shared.db import get_db_connection  # noqa: E402
+from popcorn.ledger import fold_events, initial_state, popcorn_intercept  # noqa: E402
+from seat.allocator import SEAT_ROWS, SEATS_PER_ROW, seat_position  # noqa: E402
+from seat.seat_types import SEAT_HIERARCHY  # noqa: E402
+
+WALLET_PREFIX = "loadtest-"
+# Far above serial ids and below CockroachDB's unique_rowid() values
+FIXTURE_ID_BASE = 10**12
+
+SIGNUP_WINDOW = timedelta(days=365)
+# Exponent on uniform draws that bunches signups at the recent end and tasks
+# shortly after signup
+SIGNUP_SKEW = 3
+TASK_SKEW = 2
+TASKS_PARETO_ALPHA = 1.5
+MAX_TASKS_PER_USER = 1000
+USERNAME_SHARE = 0.8
+USER_INVITE_CODE_SHARE = 0.3
+SANDWATCH_CODES_USED_SHARE = 0.5
+
+# Catalog used when multiplier_tasks is empty: (name, multiplier)
+DEFAULT_TASKS = [
+    ("Follow on Twitter", 1.1),
+    ("Join Discord", 1.1),
+    ("Join Telegram", 1.1),
+    ("Follow on Instagram", 1.1),
+    ("Invite a friend", 1.2),
+    ("Claim a seat", 1.25),
+    ("Upgrade seat", 1.5),
+    ("Attend a premiere", 2.0),
+]
+
+FixtureUser = namedtuple("FixtureUser", ["id", "username", "wallet_address"])
+
+ADJECTIVES = [
+    "amber", "brave", "crisp", "dusty", "eager", "fuzzy", "golden", "hazy",
+    "icy", "jolly", "lucky", "misty", "noble", "quiet", "rapid", "salty",
+    "sunny", "swift", "tiny", "wild",
+]  # fmt: skip
+NOUNS = [
+    "badger", "comet", "dune", "falcon", "gecko", "harbor", "kernel", "lynx",
+    "meadow", "otter", "pebble", "popcorn", "raven", "ripple", "sparrow",
+    "summit", "tiger", "willow", "yak", "zephyr",
+]  # fmt: skip
+
+
+def fixture_code(prefix, index):
+    """Invite code ``index`` of a type, apart from the random 5 character
+    codes the Lambdas generate."""
+    return f"{prefix}-LT{index:X}"
+
+
+def _copy_value(value):
+    if value is None:
+        return r"\N"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(cur, table, columns, rows):
+    """Stream ``rows`` into ``table`` with one ``COPY FROM STDIN``."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(_copy_value, row)))
+        buffer.write("\n")
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+class Generator:
+    def __init__(self, seed, now, task_multipliers, tasks_per_user):
+        self.seed = seed
+        self.now = now
+        self.task_ids = sorted(task_multipliers)
+        self.multipliers = task_multipliers
+        # Task k is picked with weight 1 / (k + 1)
+        self.task_weights = list(
+            accumulate(1 / rank for rank in range(1, len(self.task_ids) + 1))
+        )
+        # The mean of paretovariate(alpha) - 1 is 1 / (alpha - 1)
+        self.tasks_scale = tasks_per_user * (TASKS_PARETO_ALPHA - 1)
+
+    def user(self, index):
+        """The users row of fixture user ``index``, its ``(task_id,
+        performed_at)`` tasks oldest first and whether it has a USR- code."""
+        rng = random.Random(f"{self.seed}:{index}")
+        created_date = self.now - SIGNUP_WINDOW * rng.random() ** SIGNUP_SKEW
+        username = None
+        if rng.random() < USERNAME_SHARE:
+            username = f"{rng.choice(ADJECTIVES)}{rng.choice(NOUNS)}{index}"
+        task_count = min(
+            MAX_TASKS_PER_USER,
+            int(self.tasks_scale * (rng.paretovariate(TASKS_PARETO_ALPHA) - 1)),
+        )
+        since_signup = self.now - created_date
+        tasks = sorted(
+            (
+                (task_id, created_date + since_signup * rng.random() ** TASK_SKEW)
+                for task_id in rng.choices(
+                    self.task_ids, cum_weights=self.task_weights, k=task_count
+                )
+            ),
+            key=lambda task: task[1],
+        )
+        user_row = (
+            FIXTURE_ID_BASE + index,
+            f"{WALLET_PREFIX}{index}",
+            username,
+            created_date,
+        )
+        return user_row, tasks, rng.random() < USER_INVITE_CODE_SHARE
+
+    def write_users(self, cur, start, stop):
+        """COPY fixture users ``start`` to ``stop - 1`` with their tasks,
+        ledger rows and USR- invite codes. Returns the number of tasks."""
+        users, tasks, ledgers, checkpoints, codes = [], [], [], [], []
+        multipliers = set()
+        for index in range(start, stop):
+            user_row, user_tasks, has_code = self.user(index)
+            user_id, created_date = user_row[0], user_row[3]
+            users.append(user_row)
+            tasks.extend(
+                (user_id, task_id, performed_at) for task_id, performed_at in user_tasks
+            )
+            state, event_count, user_checkpoints = fold_events(
+                user_id,
+                initial_state(created_date),
+                0,
+                [
+                    (performed_at, self.multipliers[task_id])
+                    for task_id, performed_at in user_tasks
+                ],
+            )
+            ledgers.append((user_id, *state, event_count, popcorn_intercept(state)))
+            checkpoints.extend(user_checkpoints)
+            multipliers.add(state.current_multiplier)
+            if has_code:
+                codes.append((fixture_code("USR", index), user_id))
+
+        copy_rows(
+            cur, "users", ["id", "wallet_address", "username", "created_date"], users
+        )
+        copy_rows(
+            cur,
+            "user_to_multiplier",
+            ["user_id", "multiplier_task_id", "performed_at"],
+            tasks,
+        )
+        copy_rows(
+            cur,
+            "user_popcorn_ledger",
+            [
+                "user_id",
+                "total_popcorn",
+                "current_multiplier",
+                "last_event_at",
+                "event_count",
+                "popcorn_intercept",
+            ],
+            ledgers,
+        )
+        copy_rows(
+            cur,
+            "user_popcorn_checkpoints",
+            ["user_id", "total_popcorn", "current_multiplier", "last_event_at"],
+            checkpoints,
+        )
+        copy_rows(cur, "user_invite_codes", ["code", "user_id"], codes)
+        execute_values(
+            cur,
+            """
+            INSERT INTO popcorn_multiplier_groups (current_multiplier) VALUES %s
+            ON CONFLICT (current_multiplier) DO NOTHING
+            """,
+            [(multiplier,) for multiplier in sorted(multipliers)],
+        )
+        return len(tasks)
+
+
+def seeded_count(cur):
+    cur.execute(
+        "SELECT count(*) FROM users WHERE wallet_address LIKE %s",
+        (WALLET_PREFIX + "%",),
+    )
+    return cur.fetchone()[0]
+
+
+def _code_count(cur, table, prefix):
+    cur.execute(
+        f"SELECT count(*) FROM {table} WHERE code LIKE %s",
+        (f"{prefix}-LT%",),
+    )
+    return cur.fetchone()[0]
+
+
+def ensure_catalogs(cur):
+    """Fill multiplier_tasks and seat_types if they are empty and return
+    ``({task_id: multiplier}, [seat_type_id])``."""
+    cur.execute("SELECT count(*) FROM multiplier_tasks")
+    if cur.fetchone()[0] == 0:
+        execute_values(
+            cur,
+            "INSERT INTO multiplier_tasks (name, multiplier) VALUES %s",
+            DEFAULT_TASKS,
+        )
+    cur.execute("SELECT count(*) FROM seat_types")
+    if cur.fetchone()[0] == 0:
+        execute_values(
+            cur,
+            "INSERT INTO seat_types (name) VALUES %s",
+            [(name,) for name in SEAT_HIERARCHY],
+        )
+    cur.execute("SELECT id, multiplier FROM multiplier_tasks ORDER BY id")
+    multipliers = {task_id: float(multiplier) for task_id, multiplier in cur.fetchall()}
+    cur.execute("SELECT id FROM seat_types ORDER BY id")
+    return multipliers, [row[0] for row in cur.fetchall()]
+
+
+def write_invite_codes(cur, seed, general_codes, sandwatch_codes, seat_type_ids):
+    """Top up the GEN- codes in invite_codes (spread over the seat types,
+    mostly the first) and the SW- codes in sandwatch_invite_codes."""
+    rng = random.Random(f"{seed}:codes")
+    weights = list(accumulate(1 / rank for rank in range(1, len(seat_type_ids) + 1)))
+    start = _code_count(cur, "invite_codes", "GEN")
+    copy_rows(
+        cur,
+        "invite_codes",
+        ["code", "seat_type_id"],
+        (
+            (
+                fixture_code("GEN", index),
+                rng.choices(seat_type_ids, cum_weights=weights)[0],
+            )
+            for index in range(start, general_codes)
+        ),
+    )
+    start = _code_count(cur, "sandwatch_invite_codes", "SW")
+    copy_rows(
+        cur,
+        "sandwatch_invite_codes",
+        ["code", "used"],
+        (
+            (fixture_code("SW", index), rng.random() < SANDWATCH_CODES_USED_SHARE)
+            for index in range(start, sandwatch_codes)
+        ),
+    )
+
+
+def write_seats(cur, seed, users, occupancy, seat_type_ids):
+    """Seat random fixture users in every section that has no seats taken
+    yet, until ``occupancy`` of it is. A user gets at most one seat."""
+    rng = random.Random(f"{seed}:seats")
+    section_size = SEAT_ROWS * SEATS_PER_ROW
+    cur.execute("SELECT DISTINCT seat_type_id FROM seat_to_user")
+    occupied = {row[0] for row in cur.fetchall()}
+    cur.execute(
+        "SELECT user_id FROM seat_to_user WHERE user_id >= %s", (FIXTURE_ID_BASE,)
+    )
+    seated = {row[0] - FIXTURE_ID_BASE for row in cur.fetchall()}
+    sections = [
+        seat_type_id for seat_type_id in seat_type_ids if seat_type_id not in occupied
+    ]
+    wanted = int(section_size * occupancy) * len(sections)
+    indexes = [
+        index
+        for index in rng.sample(range(users), min(wanted + len(seated), users))
+        if index not in seated
+    ][:wanted]
+    rows = []
+    for seat_type_id in sections:
+        section_users = indexes[: int(section_size * occupancy)]
+        indexes = indexes[len(section_users) :]
+        seats = rng.sample(range(section_size), len(section_users))
+        rows.extend(
+            (FIXTURE_ID_BASE + index, seat_type_id, *seat_position(seat))
+            for index, seat in zip(section_users, seats)
+        )
+    copy_rows(
+        cur,
+        "seat_to_user",
+        ["user_id", "seat_type_id", "seat_row", "seat_number"],
+        rows,
+    )
+    return len(rows)
+
+
+def generate(
+    users,
+    tasks_per_user=5,
+    seed=0,
+    chunk_size=10_000,
+    general_codes=None,
+    sandwatch_codes=None,
+    seat_occupancy=0.6,
+):
+    """Make sure fixture users ``0`` to ``users - 1`` and the codes and seats
+    exist. Returns the number of users and tasks created."""
+    now = datetime.now(timezone.utc)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            multipliers, seat_type_ids = ensure_catalogs(cur)
+            start = seeded_count(cur)
+    generator = Generator(seed, now, multipliers, tasks_per_user)
+
+    created_users, created_tasks = 0, 0
+    started = time.perf_counter()
+    for chunk_start in range(start, users, chunk_size):
+        chunk_stop = min(users, chunk_start + chunk_size)
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                created_tasks += generator.write_users(cur, chunk_start, chunk_stop)
+        created_users += chunk_stop - chunk_start
+        elapsed = time.perf_counter() - started
+        print(
+            f"{chunk_stop}/{users} users, {created_tasks} tasks"
+            f" ({(created_users + created_tasks) / elapsed:.0f} rows/s)",
+            flush=True,
+        )
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            write_invite_codes(
+                cur,
+                seed,
+                users // 100 if general_codes is None else general_codes,
+                users // 1000 if sandwatch_codes is None else sandwatch_codes,
+                seat_type_ids,
+            )
+            seats = write_seats(cur, seed, users, seat_occupancy, seat_type_ids)
+    print(f"Seated {seats} users")
+    return created_users, created_tasks
+
+
+def sample_users(cur, count, seed=0):
+    """Up to ``count`` random fixture users with a username, the same ones
+    for a seed."""
+    seeded = seeded_count(cur)
+    indexes = random.Random(seed).sample(range(seeded), min(count, seeded))
+    cur.execute(
+        """
+        SELECT id, username, wallet_address FROM users
+        WHERE id = ANY(%s) AND username IS NOT NULL
+        ORDER BY id
+        """,
+        ([FIXTURE_ID_BASE + index for index in indexes],),
+    )
+    return [FixtureUser(*row) for row in cur.fetchall()]
+
+
+def table_sizes(cur):
+    """Row counts of the tables the routes read, for the results file."""
+    sizes = {}
+    for table in (
+        "users",
+        "user_to_multiplier",
+        "user_popcorn_checkpoints",
+        "seat_to_user",
+        "invite_codes",
+    ):
+        cur.execute(f"SELECT count(*) FROM {table}")
+        sizes[table] = cur.fetchone()[0]
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--tasks-per-user", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument(
+        "--general-codes", type=int, help="GEN- codes (default: users / 100)"
+    )
+    parser.add_argument(
+        "--sandwatch-codes", type=int, help="SW- codes (default: users / 1000)"
+    )
+    parser.add_argument("--seat-occupancy", type=float, default=0.6)
+    args = parser.parse_args()
+
+    users, tasks = generate(
+        args.users,
+        args.tasks_per_user,
+        args.seed,
+        args.chunk_size,
+        args.general_codes,
+        args.sandwatch_codes,
+        args.seat_occupancy,
+    )
+    print(f"Created {users} fixture users and {tasks} tasks")
+
+
+if __name__ == "__main__":
+    main()
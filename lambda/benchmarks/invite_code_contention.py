@@ -0,0 +1,182 @@
+"""Throughput and retry rate of many users redeeming one GEN- code at once.
+
+Distinct fixture users redeem the same benchmark code on ``--workers``
+threads, each with its own pooled connection, through ``claim_code`` (the GEN-
+redemption statement of popcorn/redemption.py, without the award). A
+redemption that fails with SQLSTATE 40001 is retried with backoff, as
+``redeem`` does. This is repeated for every ``--shards`` value. With 1 shard,
+all redemptions increment the same counter row, which is the single-row design.
+
+Reports redemptions per second, retries per redemption and latency including
+retries. It also checks that the summed counters match the redemptions. The
+code and its rows are deleted afterwards. Seed the fixtures first::
+
+    python benchmarks/fixtures.py --users 10000
+    python benchmarks/invite_code_contention.py --workers 200 --shards 1 4 16
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+
+import psycopg2
+
+from common import add_function_paths, summarize, use_placeholder_env
+
+use_placeholder_env()
+add_function_paths("popcorn")
+# One connection per worker thread
+os.environ.setdefault("DB_POOL_MAX_CONNECTIONS", "1000")
+
+from shared.db import get_db_connection  # noqa: E402
+from popcorn.redemption import (  # noqa: E402
+    REDEEM_RETRY_DELAY,
+    claim_code,
+    code_usage,
+    is_retryable,
+)
+from fixtures import FIXTURE_ID_BASE  # noqa: E402
+
+BENCHMARK_CODE = "GEN-CONTENTION"
+MAX_RETRIES = 50
+
+
+def fixture_user_ids(count):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT id FROM users WHERE id >= %s ORDER BY id LIMIT %s",
+                (FIXTURE_ID_BASE, count),
+            )
+            return [row[0] for row in cur.fetchall()]
+
+
+def reset_code():
+    """Create the benchmark code without any redemptions or uses."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT min(id) FROM seat_types")
+            seat_type_id = cur.fetchone()[0]
+            cur.execute(
+                """
+                INSERT INTO invite_codes (code, seat_type_id) VALUES (%s, %s)
+                ON CONFLICT (code) DO NOTHING
+                """,
+                (BENCHMARK_CODE, seat_type_id),
+            )
+            for table in ("invite_code_redemptions", "invite_code_usage"):
+                cur.execute(f"DELETE FROM {table} WHERE code = %s", (BENCHMARK_CODE,))
+
+
+def drop_code():
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            for table in (
+                "invite_code_redemptions",
+                "invite_code_usage",
+                "invite_codes",
+            ):
+                cur.execute(f"DELETE FROM {table} WHERE code = %s", (BENCHMARK_CODE,))
+
+
+def redeem_with_retries(user_id, shards, rng):
+    """Redeem the code for ``user_id`` and return the number of retries."""
+    retries = 0
+    while True:
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    redemption = claim_code(
+                        cur, BENCHMARK_CODE, user_id, rng.randrange(shards)
+                    )
+            if redemption.refusal is not None:
+                raise RuntimeError(
+                    f"User {user_id} could not redeem the code: {redemption.refusal}"
+                )
+            return retries
+        except psycopg2.Error as e:
+            if not is_retryable(e) or retries == MAX_RETRIES:
+                raise
+            retries += 1
+            time.sleep(rng.uniform(0, REDEEM_RETRY_DELAY * 2 ** min(retries, 6)))
+
+
+def run(user_ids, shards, workers):
+    reset_code()
+    pending = iter(user_ids)
+    lock = threading.Lock()
+    barrier = threading.Barrier(workers + 1)
+    samples, retries, errors = [], [], []
+
+    def worker(index):
+        rng = random.Random(index)
+        # Open the connection before the clock starts
+        with get_db_connection():
+            pass
+        barrier.wait()
+        while True:
+            with lock:
+                user_id = next(pending, None)
+            if user_id is None:
+                return
+            start = time.perf_counter()
+            try:
+                count = redeem_with_retries(user_id, shards, rng)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                samples.append(elapsed)
+                retries.append(count)
+
+    threads = [
+        threading.Thread(target=worker, args=(index,)) for index in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            uses = code_usage(cur, [BENCHMARK_CODE]).get(BENCHMARK_CODE, 0)
+    stats = summarize(samples)
+    print(
+        f"shards={shards:<4} redeemed={len(samples):<6}"
+        f" {len(samples) / elapsed:8.1f}/s"
+        f" retries/redemption={sum(retries) / max(len(samples), 1):6.3f}"
+        f" p50={stats['p50_ms']:8.2f}ms p99={stats['p99_ms']:8.2f}ms"
+        f" errors={len(errors)}"
+    )
+    if uses != len(samples):
+        print(f"  counted {uses} uses for {len(samples)} redemptions")
+    for error in sorted(set(errors))[:5]:
+        print(f"  {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--redemptions", type=int, default=5000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    user_ids = fixture_user_ids(args.redemptions)
+    if len(user_ids) < args.redemptions:
+        print(f"Only {len(user_ids)} fixture users, seed more with fixtures.py")
+    try:
+        for shards in args.shards:
+            run(user_ids, shards, args.workers)
+    finally:
+        drop_code()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Time, memory and collisions of invite code generation.
+
+Compares the single-code generator (5 hex characters of a UUID per call) with
+the bulk one in popcorn/invite_codes.py (keyed permutation of a sequence,
+vectorized). Reports the time and peak memory per ``--codes`` codes and how
+many of them collide. With --db, ``mint_codes`` is also run against the
+configured database, ``--batch`` codes per call as the bulk endpoint would,
+and rolled back afterwards.
+
+Usage: python benchmarks/invite_codes.py [--codes 100000] [--db] [--batch 10000]
+"""
+
+import argparse
+import time
+import tracemalloc
+import uuid
+
+from common import add_function_paths, use_placeholder_env
+
+use_placeholder_env()
+add_function_paths("popcorn")
+
+from popcorn.invite_codes import make_codes, mint_codes  # noqa: E402
+
+
+def uuid_codes(count):
+    return [f"GEN-{uuid.uuid4().hex[:5].upper()}" for _ in range(count)]
+
+
+def bulk_codes(count):
+    return make_codes("general", 0, count)
+
+
+def profile(generate, count):
+    """Return the codes, the time in ms and the peak traced memory in MiB.
+    tracemalloc slows allocations down, so memory is measured in a second
+    run."""
+    start = time.perf_counter()
+    codes = generate(count)
+    elapsed = (time.perf_counter() - start) * 1000
+    tracemalloc.start()
+    generate(count)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return codes, elapsed, peak / 2**20
+
+
+def mint_in_database(count, batch):
+    from shared.db import get_db_connection
+
+    start = time.perf_counter()
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            for offset in range(0, count, batch):
+                mint_codes(cur, "general", min(batch, count - offset))
+        conn.rollback()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--codes", type=int, default=100_000)
+    parser.add_argument("--db", action="store_true")
+    parser.add_argument("--batch", type=int, default=10_000)
+    args = parser.parse_args()
+
+    for name, generate in (("uuid hex[:5]", uuid_codes), ("bulk", bulk_codes)):
+        codes, elapsed, peak = profile(generate, args.codes)
+        collisions = len(codes) - len(set(codes))
+        print(
+            f"{name:<14} {elapsed:9.1f}ms {elapsed * 1000 / args.codes:7.3f}us/code"
+            f" peak={peak:7.2f}MiB collisions={collisions}"
+        )
+
+    if args.db:
+        elapsed = mint_in_database(args.codes, args.batch)
+        print(
+            f"{'bulk + insert':<14} {elapsed:9.1f}ms"
+            f" {elapsed * 1000 / args.codes:7.3f}us/code"
+            f" ({args.batch} codes per call, rolled back)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""Throughput and latency of the Lambda routes under concurrent load.
+
+Every concurrency level starts that many worker processes. Each one stands in
+for a warm Lambda container: it imports the handlers, keeps its own pools and
+caches and calls ``lambda_handler`` in-process with synthetic API Gateway
+events, one request at a time, for ``--duration`` seconds. Requests cycle
+through SCENARIOS with users sampled from the fixtures, so seed those first::
+
+    python benchmarks/fixtures.py --users 100000
+    python benchmarks/load_test.py --concurrency 1 4 16 --output before.json
+    # ... change something ...
+    python benchmarks/load_test.py --concurrency 1 4 16 --baseline before.json
+
+Each worker calls every scenario once before the clock starts, so pool
+connections, caches and cold starts (see cold_start.py) stay out of the
+numbers. Responses with a 5xx status count as errors; 4xx ones, such as a
+fixture user without a seat, are expected answers and are measured like any
+other.
+
+The results are written as JSON: throughput and p50/p95/p99 latency per level
+and scenario, tagged with the git commit, the table sizes and the settings of
+the run. With ``--baseline`` the run is compared with an earlier results file
+and the script exits non-zero when a scenario's p95 grew, or its throughput
+dropped, by more than ``--threshold``. A requested scenario whose handler
+can't be imported fails the run, unless ``--allow-missing`` is given: then it
+is skipped and left out of the results and the comparison.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from common import (
+    CONTEXT,
+    add_function_paths,
+    api_gateway_event,
+    load_handler,
+    summarize,
+    use_placeholder_env,
+)
+
+use_placeholder_env()
+
+HANDLERS = ["auth", "popcorn", "search", "seat"]
+
+add_function_paths(*HANDLERS)
+
+import jwt  # noqa: E402
+
+from fixtures import sample_users, table_sizes  # noqa: E402
+from shared.db import get_db_connection, get_pool  # noqa: E402
+
+# Settings that change what is measured, recorded with the results
+RECORDED_ENV = [
+    "DB_ASYNC",
+    "DB_PREPARE_STATEMENTS",
+    "DB_POOL_MAX_CONNECTIONS",
+    "DB_HOST",
+]
+
+
+Fixtures = namedtuple("Fixtures", ["users", "task_ids"])
+
+
+# Request builders take the fixture user the request is for, a Random and all
+# of the Fixtures, and return (method, path, body, query string parameters)
+
+
+def popcorn_tasks(user, rng, fixtures):
+    return "GET", "/popcorn/tasks", None, None
+
+
+def popcorn_user_tasks(user, rng, fixtures):
+    return "GET", "/popcorn/user-tasks", None, {"user_id": str(user.id)}
+
+
+def popcorn_current(user, rng, fixtures):
+    return "GET", "/popcorn/popcorn", None, {"user_id": str(user.id)}
+
+
+def popcorn_historical(user, rng, fixtures):
+    at = datetime.now(timezone.utc) - timedelta(days=rng.randint(1, 180))
+    query = {"user_id": str(user.id), "timestamp": at.isoformat()}
+    return "GET", "/popcorn/popcorn", None, query
+
+
+def popcorn_multiplier(user, rng, fixtures):
+    return "GET", "/popcorn/multiplier", None, {"user_id": str(user.id)}
+
+
+def popcorn_history(user, rng, fixtures):
+    # A year at daily resolution, as a profile page chart would ask for
+    since = datetime.now(timezone.utc) - timedelta(days=365)
+    query = {"user_id": str(user.id), "from": since.isoformat(), "step": "86400"}
+    return "GET", "/popcorn/history", None, query
+
+
+def popcorn_batch(user, rng, fixtures):
+    users = rng.sample(fixtures.users, min(BATCH_USERS, len(fixtures.users)))
+    body = json.dumps({"user_ids": [other.id for other in users]})
+    return "POST", "/popcorn/batch", body, None
+
+
+def popcorn_leaderboard(user, rng, fixtures):
+    return "GET", "/popcorn/leaderboard", None, {"user_id": str(user.id)}
+
+
+def seat_types(user, rng, fixtures):
+    return "GET", "/seat/seat-types", None, None
+
+
+def seat_for_user(user, rng, fixtures):
+    return "GET", f"/seat/seat/{user.id}", None, None
+
+
+def search_username(user, rng, fixtures):
+    # Half taken names (database lookups), half free ones (filter hits)
+    username = user.username if rng.random() < 0.5 else f"free{user.id}"
+    return "GET", "/search/username", None, {"username": username}
+
+
+def search_users(user, rng, fixtures):
+    return "GET", "/search/users", None, {"q": user.username[: rng.randint(3, 6)]}
+
+
+def auth_refresh_token(user, rng, fixtures):
+    token = jwt.encode(
+        {"principalId": user.wallet_address, "exp": int(time.time()) + 3600},
+        os.environ["JWT_REFRESH_SECRET"],
+        algorithm="HS256",
+    )
+    return "POST", "/auth/refresh_token", json.dumps({"refreshToken": token}), None
+
+
+def popcorn_assign_task(user, rng, fixtures):
+    body = {"user_id": user.id, "multiplier_task_id": rng.choice(fixtures.task_ids)}
+    return "POST", "/popcorn/user-tasks", json.dumps(body), None
+
+
+BATCH_USERS = 50
+
+# Seconds a worker may take to import the handlers and warm up
+STARTUP_TIMEOUT = 120
+
+# Scenario name -> (function, request builder)
+SCENARIOS = {
+    "popcorn_tasks": ("popcorn", popcorn_tasks),
+    "popcorn_user_tasks": ("popcorn", popcorn_user_tasks),
+    "popcorn_current": ("popcorn", popcorn_current),
+    "popcorn_historical": ("popcorn", popcorn_historical),
+    "popcorn_multiplier": ("popcorn", popcorn_multiplier),
+    "popcorn_history": ("popcorn", popcorn_history),
+    "popcorn_batch": ("popcorn", popcorn_batch),
+    "popcorn_leaderboard": ("popcorn", popcorn_leaderboard),
+    "seat_types": ("seat", seat_types),
+    "seat_for_user": ("seat", seat_for_user),
+    "search_username": ("search", search_username),
+    "search_users": ("search", search_users),
+    "auth_refresh_token": ("auth", auth_refresh_token),
+}
+
+# Only run with --writes or --scenarios, they award tasks to fixture users
+WRITE_SCENARIOS = {
+    "popcorn_assign_task": ("popcorn", popcorn_assign_task),
+}
+
+
+def scenario(name):
+    return SCENARIOS.get(name) or WRITE_SCENARIOS[name]
+
+
+def worker(index, scenarios, fixtures, duration, seed, barrier, results):
+    """Run one container's share of a level and put its samples on
+    ``results`` as ``{scenario: (latencies in ms, errors)}``."""
+    handlers = {}
+    plan = []
+    for name in scenarios:
+        function, build = scenario(name)
+        if function not in handlers:
+            handlers[function] = load_handler(function)
+        plan.append((name, handlers[function], build))
+    rng = random.Random(seed * 1000 + index)
+
+    def invoke(handler, build):
+        method, path, body, query = build(rng.choice(fixtures.users), rng, fixtures)
+        event = api_gateway_event(method, path, body, query)
+        start = time.perf_counter()
+        response = handler(event, CONTEXT)
+        return (time.perf_counter() - start) * 1000, response["statusCode"]
+
+    for _, handler, build in plan:
+        invoke(handler, build)
+
+    latencies = {name: [] for name in scenarios}
+    errors = dict.fromkeys(scenarios, 0)
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        name, handler, build = plan[rng.randrange(len(plan))]
+        latency, status_code = invoke(handler, build)
+        latencies[name].append(latency)
+        if status_code >= 500:
+            errors[name] += 1
+    results.put({name: (latencies[name], errors[name]) for name in scenarios})
+
+
+def run_level(concurrency, scenarios, fixtures, duration, seed):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(concurrency, timeout=STARTUP_TIMEOUT)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=worker,
+            args=(index, scenarios, fixtures, duration, seed, barrier, results),
+        )
+        for index in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+    # Drain the queue before joining, a worker can't exit with unread results
+    merged, received = {}, 0
+    deadline = time.monotonic() + STARTUP_TIMEOUT + duration
+    while received < concurrency:
+        try:
+            samples = results.get(timeout=1)
+        except queue.Empty:
+            crashed = any(process.exitcode not in (None, 0) for process in processes)
+            if crashed or time.monotonic() > deadline:
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError(f"A worker failed at concurrency {concurrency}")
+            continue
+        received += 1
+        for name, (latencies, errors) in samples.items():
+            all_latencies, all_errors = merged.get(name, ([], 0))
+            merged[name] = (all_latencies + latencies, all_errors + errors)
+    for process in processes:
+        process.join()
+
+    level = {"concurrency": concurrency, "duration_s": duration, "scenarios": {}}
+    everything, total_errors = [], 0
+    for name, (latencies, errors) in sorted(merged.items()):
+        level["scenarios"][name] = _stats(latencies, errors, duration)
+        everything += latencies
+        total_errors += errors
+    level["total"] = _stats(everything, total_errors, duration)
+    return level
+
+
+def _stats(latencies, errors, duration):
+    stats = summarize(latencies)
+    stats["errors"] = errors
+    stats["throughput_rps"] = len(latencies) / duration
+    return stats
+
+
+def git_commit():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=directory,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=directory,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(dirty)
+
+
+def compare(baseline, results, threshold, min_delta_ms):
+    """Print the scenarios that got slower than ``baseline`` and return how
+    many did."""
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    regressions = 0
+    for level in results["levels"]:
+        old_level = baseline_levels.get(level["concurrency"])
+        if old_level is None:
+            continue
+        for name, new in level["scenarios"].items():
+            old = old_level["scenarios"].get(name)
+            if old is None:
+                continue
+            slower = (
+                new["p95_ms"] > old["p95_ms"] * (1 + threshold)
+                and new["p95_ms"] - old["p95_ms"] > min_delta_ms
+            )
+            fewer = new["throughput_rps"] < old["throughput_rps"] * (1 - threshold)
+            if slower or fewer:
+                regressions += 1
+                print(
+                    f"REGRESSION c={level['concurrency']:<4} {name:<24}"
+                    f" p95 {old['p95_ms']:8.3f}ms -> {new['p95_ms']:8.3f}ms"
+                    f" rps {old['throughput_rps']:8.1f} -> {new['throughput_rps']:8.1f}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=[*SCENARIOS, *WRITE_SCENARIOS],
+        help="Scenarios to run (default: all read scenarios)",
+    )
+    parser.add_argument("--writes", action="store_true")
+    parser.add_argument(
+        "--allow-missing",
+        action="store_true",
+        help="Skip scenarios whose handler can't be imported instead of failing",
+    )
+    parser.add_argument("--sample-users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="/tmp/sandwatch_load_test.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    requested = args.scenarios or [
+        *SCENARIOS,
+        *(WRITE_SCENARIOS if args.writes else []),
+    ]
+    # Checked here once, so that workers don't each report the same failure
+    functions = {scenario(name)[0] for name in requested}
+    available = {
+        name
+        for name in sorted(functions)
+        if load_handler(name, allow_missing=args.allow_missing)
+    }
+    scenarios = [name for name in requested if scenario(name)[0] in available]
+    if not scenarios:
+        sys.exit("None of the scenarios can be run here")
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            users = sample_users(cur, args.sample_users, args.seed)
+            cur.execute("SELECT id FROM multiplier_tasks ORDER BY id")
+            fixtures = Fixtures(users, [row[0] for row in cur.fetchall()])
+            sizes = table_sizes(cur)
+    get_pool().close_all()
+    if not users:
+        sys.exit("No fixture users, seed them with benchmarks/fixtures.py first")
+
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "settings": {
+            "duration_s": args.duration,
+            "scenarios": scenarios,
+            "sample_users": len(users),
+            "seed": args.seed,
+            "cpus": os.cpu_count(),
+            "env": {key: os.environ.get(key) for key in RECORDED_ENV},
+        },
+        "table_sizes": sizes,
+        "levels": [],
+    }
+    for concurrency in args.concurrency:
+        level = run_level(concurrency, scenarios, fixtures, args.duration, args.seed)
+        results["levels"].append(level)
+        print(f"concurrency {concurrency}")
+        for name, stats in [*level["scenarios"].items(), ("total", level["total"])]:
+            print(
+                f"  {name:<24} {stats['throughput_rps']:8.1f} rps"
+                f" p50={stats['p50_ms']:8.3f}ms p95={stats['p95_ms']:8.3f}ms"
+                f" p99={stats['p99_ms']:8.3f}ms errors={stats['errors']}"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline} ({baseline.get('commit')})")
+        regressions = compare(baseline, results, args.threshold, args.min_delta_ms)
+        if regressions:
+            sys.exit(f"{regressions} scenario(s) regressed")
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""N single-user popcorn reads vs one POST /popcorn/batch style calculation.
+
+Checks that both paths agree, then reports the time each takes.
+
+Usage: python benchmarks/popcorn_batch.py [--users 1000]
+"""
+
+import argparse
+import math
+import time
+from datetime import datetime, timezone
+
+from common import add_function_paths
+
+add_function_paths("popcorn")
+
+from shared.db import get_db_connection  # noqa: E402
+from popcorn.batch import calculate_batch, fetch_task_rows  # noqa: E402
+from popcorn.ledger import popcorn_at  # noqa: E402
+
+
+def single_user_calls(user_ids, at):
+    results = {}
+    for user_id in user_ids:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                state = popcorn_at(cur, user_id, at)
+        results[user_id] = (state.total_popcorn, state.current_multiplier)
+    return results
+
+
+def batch_call(user_ids, at):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            rows = fetch_task_rows(cur, user_ids, at)
+    return calculate_batch(rows, at)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM users ORDER BY id LIMIT %s", (args.users,))
+            user_ids = [row[0] for row in cur.fetchall()]
+    at = datetime.now(timezone.utc)
+
+    single, single_ms = timed(single_user_calls, user_ids, at)
+    batch, batch_ms = timed(batch_call, user_ids, at)
+
+    mismatches = [
+        user_id
+        for user_id in user_ids
+        if not math.isclose(single[user_id][0], batch[user_id][0], rel_tol=1e-9)
+        or single[user_id][1] != batch[user_id][1]
+    ]
+    print(f"users={len(user_ids)} mismatches={len(mismatches)}")
+    print(f"single-user calls: {single_ms:10.1f}ms")
+    print(f"batch call:        {batch_ms:10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
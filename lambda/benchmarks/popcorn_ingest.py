@@ -0,0 +1,94 @@
+"""Task assignment throughput: one insert and commit per assignment (what
+POST /popcorn/user-tasks does) vs the bulk ingestion path.
+
+Assigns random tasks to existing users in the configured database, reports
+rows per second for both paths, then deletes the inserted rows and rebuilds
+the affected users' ledgers.
+
+Usage: python benchmarks/popcorn_ingest.py [--rows 5000] [--users 200]
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timezone
+
+from common import add_function_paths
+
+add_function_paths("popcorn")
+
+from shared.db import get_db_connection  # noqa: E402
+from popcorn.ingest import ingest_assignments  # noqa: E402
+from popcorn.ledger import rebuild_user_ledger, record_task_events  # noqa: E402
+from popcorn.tasks import get_task_catalog  # noqa: E402
+
+
+def single_inserts(assignments):
+    ids = []
+    multipliers = get_task_catalog().multipliers
+    for user_id, task_id in assignments:
+        performed_at = datetime.now(timezone.utc)
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO user_to_multiplier
+                        (user_id, multiplier_task_id, performed_at)
+                    VALUES (%s, %s, %s) RETURNING id
+                    """,
+                    (user_id, task_id, performed_at),
+                )
+                ids.append(cur.fetchone()[0])
+                record_task_events(cur, user_id, [(performed_at, multipliers[task_id])])
+    return ids
+
+
+def bulk_ingest(assignments):
+    body = "\n".join(
+        json.dumps({"user_id": user_id, "multiplier_task_id": task_id})
+        for user_id, task_id in assignments
+    )
+    results = ingest_assignments(body, "application/x-ndjson")
+    failed = [result for result in results if result["status"] != "created"]
+    assert not failed, failed[:5]
+    return [result["id"] for result in results]
+
+
+def clean_up(ids, user_ids):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM user_to_multiplier WHERE id = ANY(%s)", (ids,))
+    for user_id in sorted(user_ids):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                rebuild_user_ledger(cur, user_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM users ORDER BY id LIMIT %s", (args.users,))
+            user_ids = [row[0] for row in cur.fetchall()]
+            task_ids = list(get_task_catalog(cur).multipliers)
+    assignments = [
+        (rng.choice(user_ids), rng.choice(task_ids)) for _ in range(args.rows)
+    ]
+
+    for name, write in [("single inserts", single_inserts), ("bulk", bulk_ingest)]:
+        start = time.perf_counter()
+        ids = write(assignments)
+        elapsed = time.perf_counter() - start
+        clean_up(ids, {user_id for user_id, _ in assignments})
+        print(f"{name:<16} {len(ids) / elapsed:10.0f} rows/s ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Parse and plan time saved by running the hot statements by name.
+
+Every statement registered in shared/queries.py is run ``--iterations`` times
+as plain SQL and as ``EXECUTE`` of the statement the pool prepared, on the
+same pooled connection, with parameters sampled from the configured database.
+Reports the client-side latency of both and the time saved per query. On
+CockroachDB the server's own parse and plan latencies for both runs are read
+from crdb_internal.node_statement_statistics as well.
+
+Usage: python benchmarks/prepared_statements.py [--iterations 1000]
+"""
+
+import argparse
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from common import add_function_paths, measure, percentile, use_placeholder_env
+
+use_placeholder_env()
+add_function_paths("popcorn", "seat", "search")
+
+import psycopg2  # noqa: E402
+
+from shared.db import get_db_connection, get_pool  # noqa: E402
+from shared.queries import get_statement, statement_stats  # noqa: E402
+
+# Imported for the statements they register
+import popcorn.ledger  # noqa: E402, F401
+import search.handler  # noqa: E402, F401
+import seat.handler  # noqa: E402, F401
+
+
+def sample_params(cur):
+    """Parameters for each statement, from rows that exist."""
+    params = {}
+    now = datetime.now(timezone.utc)
+    cur.execute(
+        """
+        SELECT user_id, max(performed_at) FROM user_to_multiplier
+        GROUP BY user_id ORDER BY count(*) DESC LIMIT 1
+        """
+    )
+    row = cur.fetchone()
+    if row is not None:
+        user_id, last_event_at = row
+        params["popcorn_latest"] = (user_id,)
+        params["popcorn_ledger_for_update"] = (user_id,)
+        params["popcorn_checkpoint"] = (user_id, last_event_at)
+        params["popcorn_events"] = (user_id, now)
+        params["popcorn_events_after"] = (user_id, now, now - timedelta(days=1))
+    queries = {
+        "seat_for_user": "SELECT user_id FROM seat_to_user LIMIT 1",
+        "invite_code_seat_type": "SELECT code FROM invite_codes LIMIT 1",
+        "username_exists": "SELECT username FROM users WHERE username IS NOT NULL"
+        " LIMIT 1",
+    }
+    for name, query in queries.items():
+        cur.execute(query)
+        row = cur.fetchone()
+        if row is not None:
+            params[name] = (row[0],)
+    return params
+
+
+def server_latencies(cur, application_name):
+    """Mean parse and plan latency in ms that CockroachDB recorded for the
+    statements run under ``application_name``, or None elsewhere."""
+    try:
+        cur.execute(
+            """
+            SELECT sum(parse_lat_avg * count) / sum(count),
+                   sum(plan_lat_avg * count) / sum(count)
+            FROM crdb_internal.node_statement_statistics
+            WHERE application_name = %s
+            """,
+            (application_name,),
+        )
+    except psycopg2.Error:
+        cur.connection.rollback()
+        return None
+    parse, plan = cur.fetchone()
+    if parse is None:
+        return None
+    return float(parse) * 1000, float(plan) * 1000
+
+
+def run(statement, params, iterations, mode, run_id):
+    application_name = f"bench_{run_id}_{statement.name}_{mode}"
+    with get_db_connection() as conn:
+        if mode == "prepared" and statement.name not in conn.prepared:
+            return None, None
+        sql = statement.execute_sql if mode == "prepared" else statement.sql
+        with conn.cursor() as cur:
+            cur.execute("SET application_name = %s", (application_name,))
+
+            def query():
+                cur.execute(sql, params)
+                cur.fetchall()
+
+            samples = measure(query, iterations, warmup=10)
+            cur.execute("RESET application_name")
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            return samples, server_latencies(cur, application_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            params = sample_params(cur)
+    run_id = uuid.uuid4().hex[:8]
+
+    print(
+        f"{'statement':<28} {'plain p50':>10} {'prep p50':>10} {'saved/query':>12}"
+        f" {'server parse+plan plain -> prepared':>38}"
+    )
+    for name in statement_stats():
+        if name not in params:
+            print(f"{name:<28} skipped, no sample row")
+            continue
+        statement = get_statement(name)
+        plain, plain_server = run(
+            statement, params[name], args.iterations, "plain", run_id
+        )
+        prepared, prepared_server = run(
+            statement, params[name], args.iterations, "prepared", run_id
+        )
+        if prepared is None:
+            print(f"{name:<28} skipped, not prepared on this server")
+            continue
+        saved = sum(plain) / len(plain) - sum(prepared) / len(prepared)
+        server = ""
+        if plain_server and prepared_server:
+            server = (
+                f"{sum(plain_server):8.3f}ms -> {sum(prepared_server):8.3f}ms"
+                f" (parse {plain_server[0]:.3f} -> {prepared_server[0]:.3f},"
+                f" plan {plain_server[1]:.3f} -> {prepared_server[1]:.3f})"
+            )
+        print(
+            f"{name:<28} {percentile(plain, 50):8.3f}ms {percentile(prepared, 50):8.3f}ms"
+            f" {saved:10.3f}ms {server}"
+        )
+    get_pool().close_all()
+
+
+if __name__ == "__main__":
+    main()
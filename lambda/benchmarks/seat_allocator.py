@@ -0,0 +1,85 @@
+"""Seat allocation latency as a section fills up to 99%.
+
+Compares the allocator's free list with picking random seats until a free one
+comes up (what random.randint does once collisions are checked), reporting
+latency per occupancy band.
+
+Usage: python benchmarks/seat_allocator.py [--fill 0.99] [--sections 20]
+"""
+
+import argparse
+import random
+import time
+
+from common import add_function_paths, summarize, use_placeholder_env
+
+use_placeholder_env()
+add_function_paths("seat")
+
+from seat.allocator import SeatMap  # noqa: E402
+
+BANDS = [0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+
+
+def allocate_free_list(seat_map, rng):
+    index = seat_map.pick(rng)
+    seat_map.mark_taken(index)
+    return index
+
+
+def allocate_with_retries(seat_map, rng):
+    while True:
+        index = rng.randrange(seat_map.size)
+        if not seat_map.is_taken(index):
+            seat_map.mark_taken(index)
+            return index
+
+
+def fill(allocate, sections, fill_to, seed):
+    """Per-band latencies (ms) of filling ``sections`` sections."""
+    rng = random.Random(seed)
+    samples = {band: [] for band in BANDS}
+    for _ in range(sections):
+        seat_map = SeatMap()
+        target = int(seat_map.size * fill_to)
+        taken = set()
+        for allocation in range(target):
+            occupancy = allocation / seat_map.size
+            start = time.perf_counter()
+            index = allocate(seat_map, rng)
+            elapsed = (time.perf_counter() - start) * 1000
+            assert index not in taken
+            taken.add(index)
+            band = next(band for band in BANDS if occupancy < band)
+            samples[band].append(elapsed)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fill", type=float, default=0.99)
+    parser.add_argument("--sections", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for name, allocate in [
+        ("free list", allocate_free_list),
+        ("random with retries", allocate_with_retries),
+    ]:
+        print(f"\n{name}")
+        samples = fill(allocate, args.sections, args.fill, args.seed)
+        lower = 0.0
+        for band in BANDS:
+            if samples[band]:
+                stats = summarize(samples[band])
+                print(
+                    f"  occupancy {lower:4.0%}-{band:4.0%} "
+                    f"p50={stats['p50_ms'] * 1000:7.2f}us "
+                    f"p99={stats['p99_ms'] * 1000:7.2f}us "
+                    f"mean={stats['mean_ms'] * 1000:7.2f}us"
+                )
+            lower = band
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""JSON serializations per request, counted through ``shared.utils.dumps``.
+
+Each handler is invoked in-process with synthetic API Gateway events. Routes
+that need the database answer with their error response when none is
+configured, which still has to be serialized exactly once. The script exits
+non-zero when any request is serialized more than once.
+
+Usage: python benchmarks/serialization.py [--requests 200] [--allow-missing]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from common import (
+    CONTEXT,
+    add_function_paths,
+    api_gateway_event,
+    load_handler,
+    measure,
+    report,
+    use_placeholder_env,
+)
+
+use_placeholder_env()
+
+HANDLERS = ["auth", "connections", "popcorn", "search", "seat", "user"]
+
+add_function_paths(*HANDLERS)
+
+import jwt  # noqa: E402
+
+from shared import utils  # noqa: E402
+
+# (function, method, path, body) relative to the /v1 stage
+REQUESTS = [
+    (
+        "auth",
+        "POST",
+        "/auth/refresh_token",
+        '{"refreshToken": "%s"}'
+        % jwt.encode(
+            {"principalId": "benchmark", "exp": int(time.time()) + 3600},
+            os.environ["JWT_REFRESH_SECRET"],
+            algorithm="HS256",
+        ),
+    ),
+    ("auth", "POST", "/auth/refresh_token", '{"refreshToken": "invalid"}'),
+    ("connections", "GET", "/connections/discord", None),
+    ("popcorn", "GET", "/popcorn/tasks", None),
+    ("popcorn", "GET", "/popcorn/leaderboard", None),
+    ("search", "GET", "/search/username", None),
+    ("seat", "GET", "/seat/seat-types", None),
+    ("user", "GET", "/user/1", None),
+    ("user", "GET", "/user/unknown/route", None),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--allow-missing",
+        action="store_true",
+        help="Skip functions whose handler can't be imported instead of failing",
+    )
+    args = parser.parse_args()
+
+    handlers = {
+        name: load_handler(name, allow_missing=args.allow_missing) for name in HANDLERS
+    }
+    failures = []
+    for name, method, path, body in REQUESTS:
+        handler = handlers[name]
+        if handler is None:
+            continue
+        event = api_gateway_event(method, path, body)
+
+        utils.serialization_count = 0
+        response = handler(event, CONTEXT)
+        per_request = utils.serialization_count
+        label = f"{method} {path}"
+        print(f"{label:<32} status={response['statusCode']} dumps={per_request}")
+        if per_request > 1:
+            failures.append(label)
+
+        report(label, measure(lambda: handler(event, CONTEXT), args.requests))
+
+    if failures:
+        print(f"Serialized more than once: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""/users?q= search: the in-process username index vs a naive scan.
+
+The naive scan is what ``username ILIKE '%q%'`` does, a substring test of
+every username followed by the same ranking. Both run on random usernames at
+each size, for prefix, substring and misspelt queries, and must return the
+same first page for prefix and substring queries.
+
+Usage: python benchmarks/user_search.py [--sizes 100000 1000000] [--queries 200]
+"""
+
+import argparse
+import random
+import resource
+import string
+import time
+
+from common import add_function_paths, measure, report, use_placeholder_env
+
+use_placeholder_env()
+add_function_paths("search")
+
+from search.index import UsernameIndex  # noqa: E402
+
+WORDS = ["sand", "watch", "pop", "corn", "moon", "sol", "degen", "ape", "whale"]
+
+
+def random_usernames(rng, count):
+    alphabet = string.ascii_lowercase + string.digits
+    names = set()
+    while len(names) < count:
+        word = rng.choice(WORDS)
+        suffix = "".join(rng.choices(alphabet, k=rng.randint(2, 10)))
+        names.add(word + suffix if rng.random() < 0.5 else suffix + word)
+    return list(names)
+
+
+def naive_search(names, query, offset, limit):
+    key = query.lower()
+    matches = []
+    for user_id, name in enumerate(names):
+        at = name.lower().find(key)
+        if at >= 0:
+            lower = name.lower()
+            if lower == key:
+                rank = (0, 0, len(lower), lower)
+            elif at == 0:
+                rank = (1, 0, 0, lower)
+            else:
+                rank = (2, at, len(lower), lower)
+            matches.append((rank, user_id))
+    matches.sort()
+    return [
+        (user_id, names[user_id]) for _, user_id in matches[offset : offset + limit]
+    ]
+
+
+def make_queries(rng, names, count):
+    queries = {"prefix": [], "substring": [], "misspelt": []}
+    for name in rng.sample(names, count):
+        queries["prefix"].append(name[: rng.randint(2, 4)])
+        start = rng.randint(0, max(0, len(name) - 4))
+        queries["substring"].append(name[start : start + 4])
+        position = rng.randrange(len(name))
+        queries["misspelt"].append(
+            name[:position] + rng.choice(string.ascii_lowercase) + name[position + 1 :]
+        )
+    return queries
+
+
+def max_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        names = random_usernames(rng, size)
+        rss_before = max_rss_mib()
+        start = time.perf_counter()
+        index = UsernameIndex.build(enumerate(names))
+        build_s = time.perf_counter() - start
+        print(
+            f"\nusers={size} build={build_s:.2f}s trigrams={len(index.postings)} "
+            f"max RSS +{max_rss_mib() - rss_before:.0f}MiB"
+        )
+
+        queries = make_queries(rng, names, args.queries)
+        for kind in ("prefix", "substring"):
+            for query in queries[kind][:20]:
+                expected = naive_search(names, query, 0, 20)
+                page = index.search(query, 0, 20, budget_ms=10_000)
+                got = [(user_id, name) for user_id, name, _ in page.users]
+                # A truncated search only ranks the matches it collected
+                assert page.truncated or got == expected, (kind, query)
+
+        for kind, kind_queries in queries.items():
+            it = iter(kind_queries)
+            report(
+                f"index {kind}",
+                measure(lambda: index.search(next(it)), len(kind_queries)),
+            )
+        naive_queries = queries["substring"][: max(1, args.queries // 10)]
+        it = iter(naive_queries)
+        report(
+            "naive scan substring",
+            measure(lambda: naive_search(names, next(it), 0, 20), len(naive_queries)),
+        )
+
+
+if __name__ == "__main__":
+    main()
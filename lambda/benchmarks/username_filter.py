@@ -0,0 +1,80 @@
+"""Username Bloom filter at 1M names: build time, memory, lookup latency and
+false positive rate, without a database.
+
+Taken names are random lowercase handles; the false positive rate is measured
+against the same number of names that were never added.
+
+Usage: python benchmarks/username_filter.py [--names 1000000] [--error-rate 0.01]
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+
+from common import add_function_paths, measure, report, use_placeholder_env
+
+use_placeholder_env()
+add_function_paths("search")
+
+from search.bloom import BloomFilter  # noqa: E402
+
+
+def random_names(rng, count, prefix):
+    alphabet = string.ascii_lowercase + string.digits + "_"
+    return [
+        prefix + "".join(rng.choices(alphabet, k=rng.randint(5, 14)))
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--names", type=int, default=1_000_000)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Disjoint prefixes keep the taken and free sets apart
+    taken = random_names(rng, args.names, "t")
+    free = random_names(rng, args.names, "f")
+
+    bloom = BloomFilter.for_capacity(args.names, args.error_rate)
+    start = time.perf_counter()
+    bloom.update(taken)
+    build_s = time.perf_counter() - start
+
+    missed = sum(1 for name in taken if name not in bloom)
+    false_positives = sum(1 for name in free if name in bloom)
+
+    print(
+        f"names={args.names} bits={bloom.bit_count} hashes={bloom.hash_count} "
+        f"memory={bloom.memory_bytes / 2**20:.2f}MiB "
+        f"({bloom.memory_bytes * 8 / args.names:.1f} bits/name)"
+    )
+    print(f"build: {build_s:.2f}s ({build_s / args.names * 1e6:.2f}us/name)")
+    print(
+        f"false positive rate: measured={false_positives / args.names:.4%} "
+        f"estimated={bloom.estimated_false_positive_rate():.4%} "
+        f"target={args.error_rate:.4%}"
+    )
+
+    taken_sample = iter(rng.choices(taken, k=args.lookups))
+    free_sample = iter(rng.choices(free, k=args.lookups))
+    report(
+        "lookup taken name", measure(lambda: next(taken_sample) in bloom, args.lookups)
+    )
+    report(
+        "lookup free name", measure(lambda: next(free_sample) in bloom, args.lookups)
+    )
+
+    if missed:
+        print(f"{missed} added names are missing from the filter")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
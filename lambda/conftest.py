@@ -0,0 +1,37 @@
+"""pytest setup for the unit tests in functions/<name>/tests.
+
+The tests run without AWS or a database: ``shared`` and every function
+package are made importable and the configuration the modules read at import
+is filled in with placeholders, as benchmarks/common.py does for the
+benchmarks. Run from the lambda directory::
+
+    python -m pytest -q
+"""
+
+import os
+import sys
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "functions")
+
+TEST_ENV = {
+    "DB_NAME": "sandwatch",
+    "DB_USER": "sandwatch",
+    "DB_PASSWORD": "sandwatch",
+    "DB_HOST": "localhost",
+    "DB_PORT": "26257",
+    "APP_BASE_URL": "http://localhost",
+    "INVITE_CODE_KEY": "test-invite-code-key",
+    "JWT_SECRET": "test-jwt-secret-of-at-least-32-bytes",
+    "USERNAME_FILTER_PRELOAD": "false",
+    "METRICS_MODE": "off",
+    "POWERTOOLS_TRACE_DISABLED": "true",
+}
+
+for key, value in TEST_ENV.items():
+    os.environ.setdefault(key, value)
+
+for name in sorted(os.listdir(FUNCTIONS_DIR)):
+    path = os.path.join(FUNCTIONS_DIR, name)
+    if name != "shared" and os.path.isdir(path) and path not in sys.path:
+        sys.path.insert(0, path)
+sys.path.insert(0, FUNCTIONS_DIR)
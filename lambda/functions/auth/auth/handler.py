@@ -1,42 +1,32 @@
 # force build comment 2683534908
+from shared.db import get_db_connection, DatabaseError
+from shared.utils import dumps, error_response, json_response, resolve
+from .signatures import verify_signature, verify_signatures
+
 import datetime
 import json
+from typing import List
 import jwt
-import base58
 
 # from solana.message import Message
 # from solana.transaction import Transaction
 # from solana.publickey import PublicKey
 # from solana.transaction import Signature
-import nacl.signing
-import nacl.encoding
 
 import os
-import traceback
 
 # from datetime import datetime, timezone
-from decimal import Decimal
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import execute_values
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.event_handler import APIGatewayRestResolver
-from aws_lambda_powertools.event_handler.api_gateway import Response
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.logging import correlation_paths
-from aws_lambda_powertools.utilities.parser import BaseModel
+from aws_lambda_powertools.utilities.parser import BaseModel, ValidationError
 from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
 
-# Database connection parameters
-DB_NAME = os.environ["DB_NAME"]
-DB_USER = os.environ["DB_USER"]
-DB_PASSWORD = os.environ["DB_PASSWORD"]
-DB_HOST = os.environ["DB_HOST"]
-DB_PORT = os.environ["DB_PORT"]
-
-MESSAGE_TO_SIGN = b"Log in to Sandwatch"
-
 # Keys
 JWT_SECRET = os.environ["JWT_SECRET"]
 JWT_REFRESH_SECRET = os.environ["JWT_REFRESH_SECRET"]
@@ -45,17 +35,13 @@ JWT_REFRESH_SECRET = os.environ["JWT_REFRESH_SECRET"]
 JWT_EXPIRATION = 3600  # 1 hour
 REFRESH_TOKEN_EXPIRATION = 604800  # 7 days
 
+# Most logins accepted by one /access_token/bulk request
+MAX_BULK_LOGINS = 500
+
 logger = Logger()
 tracer = Tracer()
 
-app = APIGatewayRestResolver(strip_prefixes=["/v1/auth"])
-
-
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+app = APIGatewayRestResolver(strip_prefixes=["/v1/auth"], serializer=dumps)
 
 
 class MessagePayload(BaseModel):
@@ -63,66 +49,24 @@ class MessagePayload(BaseModel):
     publicKey: str
 
 
-class RefreshToken(BaseModel):
-    refreshToken: str
-
+class BulkLoginRequest(BaseModel):
+    logins: List[MessagePayload]
 
-class DatabaseError(Exception):
-    """Custom exception for database-related errors."""
 
-    pass
-
-
-@tracer.capture_method
-def get_db_connection():
-    try:
-        return psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT,
-        )
-    except psycopg2.Error as e:
-        logger.error(f"Failed to connect to the database: {str(e)}")
-        raise DatabaseError("Unable to establish database connection") from e
+class RefreshToken(BaseModel):
+    refreshToken: str
 
 
 @app.exception_handler(Exception)
 def handle_general_exception(e):
     logger.exception("An unexpected error occurred")
-    return {
-        "statusCode": 500,
-        "body": "An unexpected error occurred. Please try again later.",
-    }
+    return error_response(500, "An unexpected error occurred. Please try again later.")
 
 
 @app.exception_handler(DatabaseError)
 def handle_database_error(e):
     logger.error(f"Database error: {str(e)}")
-    return {
-        "statusCode": 500,
-        "body": "A database error occurred. Please try again later.",
-    }
-
-
-@tracer.capture_method
-def verify_signature(signature_str, public_key_str):
-    # public_key is the wallet address
-    try:
-        # Decode the public key and signature from base58
-        public_key_bytes = base58.b58decode(public_key_str)
-        signature_bytes = base58.b58decode(signature_str)
-        # Create a VerifyKey object from the public key bytes
-        verify_key = nacl.signing.VerifyKey(public_key_bytes)
-        verify_key.verify(MESSAGE_TO_SIGN, signature_bytes)
-        return True
-    except nacl.exceptions.BadSignatureError as ex:
-        print(f"BadSignatureError error: {ex}")
-        return False
-    except Exception as e:
-        print(f"Verification error: {e}")
-        return False
+    return error_response(500, "A database error occurred. Please try again later.")
 
 
 @tracer.capture_method
@@ -151,29 +95,55 @@ def generate_refresh_token(public_key):
     )
 
 
+@tracer.capture_method
+def create_users(cur, public_keys):
+    """Create the users that don't exist yet, one per wallet address, with a
+    single multi-row insert. New users start on the popcorn leaderboard at the
+    base rate."""
+    # Sorted so concurrent logins lock rows in the same order
+    public_keys = sorted(set(public_keys))
+    execute_values(
+        cur,
+        """
+        WITH new_users AS (
+            INSERT INTO users (wallet_address, created_date)
+            VALUES %s
+            ON CONFLICT (wallet_address) DO NOTHING
+            RETURNING id, created_date
+        )
+        INSERT INTO user_popcorn_ledger
+            (user_id, total_popcorn, current_multiplier, last_event_at,
+             event_count, popcorn_intercept)
+        SELECT id, 0, 1, created_date, 0, -extract(epoch FROM created_date)
+        FROM new_users
+        """,
+        [(public_key,) for public_key in public_keys],
+        template="(%s, NOW())",
+        page_size=len(public_keys),
+    )
+
+
 @tracer.capture_method
 def try_create_new_user(public_key):
     # create a new user in the database
     # if one doesn't already exist
     # use the public key as the user ID
     # public key should be the wallet address
+    try_create_new_users([public_key])
+
+
+@tracer.capture_method
+def try_create_new_users(public_keys):
+    public_keys = list(public_keys)
+    if not public_keys:
+        return
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                INSERT INTO users (wallet_address, created_date)
-                VALUES (%s, NOW())
-                ON CONFLICT (wallet_address) DO NOTHING
-                """,
-                (public_key,),
-            )
-            conn.commit()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                create_users(cur, public_keys)
     except psycopg2.Error as e:
         logger.error(f"Failed to create user: {str(e)}")
         raise DatabaseError("Unable to create user") from e
-    finally:
-        conn.close()
 
 
 @logger.inject_lambda_context(correlation_id_path=correlation_paths.API_GATEWAY_REST)
@@ -181,29 +151,7 @@ def try_create_new_user(public_key):
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     logger.info("Auth Lambda handler invoked")
 
-    try:
-        response = app.resolve(event, context)
-        if isinstance(response.get("body"), str):
-            try:
-                body = json.loads(response["body"])
-                response["body"] = json.dumps(body, cls=DecimalEncoder)
-            except json.JSONDecodeError:
-                pass  # If it's not JSON, leave it as is
-        return response
-    except Exception as e:
-        logger.error(f"An error occurred in the lambda handler: {str(e)}")
-        logger.error(f"Exception type: {type(e).__name__}")
-        logger.error(f"Exception traceback: {traceback.format_exc()}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps(
-                {
-                    "error": "An internal server error occurred",
-                    "details": str(e),
-                    "type": type(e).__name__,
-                }
-            ),
-        }
+    return resolve(app, event, context)
 
 
 @app.post("/access_token")
@@ -219,24 +167,12 @@ def get_token():
             try_create_new_user(message_payload.publicKey)
             token = generate_token(message_payload.publicKey)
             refresh_token = generate_refresh_token(message_payload.publicKey)
-            return {
-                "statusCode": 200,
-                "body": json.dumps({"token": token, "refresh_token": refresh_token}),
-            }
+            return json_response(200, {"token": token, "refresh_token": refresh_token})
         else:
-            return {
-                "statusCode": 401,
-                "body": json.dumps({"error": "Invalid signature"}),
-            }
+            return error_response(401, "Invalid signature")
     except Exception as e:
         logger.error(f"Error generating token: {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps(
-                {"error": "An error occurred while attempting to authenticate"}
-            ),
-        )
+        return error_response(500, "An error occurred while attempting to authenticate")
 
 
 @app.post("/refresh_token")
@@ -256,26 +192,48 @@ def new_token():
             print(f"principal_id: {principal_id}")
             token = generate_token(principal_id)
             refresh_token = generate_refresh_token(principal_id)
-            return {
-                "statusCode": 200,
-                "body": json.dumps({"token": token, "refresh_token": refresh_token}),
-            }
+            return json_response(200, {"token": token, "refresh_token": refresh_token})
         except jwt.ExpiredSignatureError:
-            return {
-                "statusCode": 401,
-                "body": json.dumps({"error": "Refresh token expired"}),
-            }
+            return error_response(401, "Refresh token expired")
         except jwt.InvalidTokenError:
-            return {
-                "statusCode": 401,
-                "body": json.dumps({"error": "Invalid refresh token"}),
-            }
+            return error_response(401, "Invalid refresh token")
     except Exception as e:
         logger.error(f"Error generating token: {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps(
-                {"error": "An error occurred while attempting to authenticate"}
-            ),
+        return error_response(500, "An error occurred while attempting to authenticate")
+
+
+@app.post("/access_token/bulk")
+@tracer.capture_method
+def get_tokens():
+    """Log in many wallets at once, e.g. for a relay during a mint. Signatures
+    are verified in parallel and all new users are created in one insert."""
+    logger.info("Authenticating users in bulk")
+    try:
+        request = BulkLoginRequest(**json.loads(app.current_event.body or "{}"))
+    except (json.JSONDecodeError, ValidationError) as e:
+        return error_response(400, f"Invalid request body: {str(e)}")
+    if len(request.logins) > MAX_BULK_LOGINS:
+        return error_response(
+            400, f"At most {MAX_BULK_LOGINS} logins can be sent at once"
         )
+
+    valid = verify_signatures(
+        (login.signedMessage, login.publicKey) for login in request.logins
+    )
+    try_create_new_users(
+        login.publicKey for login, ok in zip(request.logins, valid) if ok
+    )
+
+    results = []
+    for login, ok in zip(request.logins, valid):
+        if ok:
+            results.append(
+                {
+                    "publicKey": login.publicKey,
+                    "token": generate_token(login.publicKey),
+                    "refresh_token": generate_refresh_token(login.publicKey),
+                }
+            )
+        else:
+            results.append({"publicKey": login.publicKey, "error": "Invalid signature"})
+    return json_response(200, {"results": results})
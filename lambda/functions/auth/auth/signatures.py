@@ -0,0 +1,73 @@
+"""Ed25519 verification of signed login messages.
+
+Wallet addresses are base58 public keys. ``VerifyKey`` objects are cached per
+address so returning wallets skip the decode and key setup, and
+``verify_signatures`` checks many logins at once on a thread pool (libsodium
+releases the GIL while it verifies).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock
+
+from shared.lazy import lazy_import
+
+# Signature verification is only needed by the /access_token routes
+base58 = lazy_import("base58")
+nacl_signing = lazy_import("nacl.signing")
+nacl_exceptions = lazy_import("nacl.exceptions")
+
+MESSAGE_TO_SIGN = b"Log in to Sandwatch"
+
+VERIFY_KEY_CACHE_SIZE = int(os.environ.get("VERIFY_KEY_CACHE_SIZE", "4096"))
+VERIFY_WORKERS = int(os.environ.get("VERIFY_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+_executor = None
+_executor_lock = Lock()
+
+
+@lru_cache(maxsize=VERIFY_KEY_CACHE_SIZE)
+def verify_key(public_key_str):
+    """``VerifyKey`` for a base58 wallet address, cached per address."""
+    return nacl_signing.VerifyKey(base58.b58decode(public_key_str))
+
+
+def verify_signature(signature_str, public_key_str):
+    """Whether ``signature_str`` (base58) signs ``MESSAGE_TO_SIGN`` with the
+    key ``public_key_str``. Malformed input counts as an invalid signature."""
+    try:
+        verify_key(public_key_str).verify(
+            MESSAGE_TO_SIGN, base58.b58decode(signature_str)
+        )
+        return True
+    except nacl_exceptions.BadSignatureError as ex:
+        print(f"BadSignatureError error: {ex}")
+        return False
+    except Exception as e:
+        print(f"Verification error: {e}")
+        return False
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=VERIFY_WORKERS, thread_name_prefix="verify"
+            )
+        return _executor
+
+
+def verify_signatures(pairs):
+    """Verify ``(signature, public_key)`` pairs, returning one bool per pair in
+    the same order."""
+    pairs = list(pairs)
+    if len(pairs) <= 1 or VERIFY_WORKERS <= 1:
+        return [verify_signature(*pair) for pair in pairs]
+    chunk_size = -(-len(pairs) // VERIFY_WORKERS)
+    chunks = [pairs[i : i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    results = _get_executor().map(
+        lambda chunk: [verify_signature(*pair) for pair in chunk], chunks
+    )
+    return [valid for chunk in results for valid in chunk]
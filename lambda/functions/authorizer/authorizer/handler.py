@@ -1,12 +1,20 @@
 # force build comment 2683534907
-import os
 import jwt
 from aws_lambda_powertools import Logger
 
-logger = Logger()
+from .tokens import build_policy, token_from_event, verify_token
 
-JWT_SECRET = os.getenv("JWT_SECRET")
+logger = Logger()
 
 
 def lambda_handler(event, context):
-    # private
\ No newline at end of file
+    """Allow the bearer of a valid token on every route of the stage, deny
+    anyone else. The policy is cached by API Gateway per Authorization header,
+    see build_policy."""
+    route_arn = event.get("routeArn") or event.get("methodArn")
+    try:
+        principal = verify_token(token_from_event(event))
+    except jwt.InvalidTokenError as e:
+        logger.info(f"Denying request: {str(e)}")
+        return build_policy("anonymous", "Deny", route_arn)
+    return build_policy(str(principal.principal_id), "Allow", route_arn)
@@ -0,0 +1,125 @@
+"""Verification of the HS256 access tokens issued by the auth Lambda.
+
+API Gateway calls the authorizer for every request to a protected route, and a
+client presents the same token many times during its one hour life. Tokens
+verified by ``jwt.decode`` are therefore kept in a bounded LRU cache keyed by
+the SHA-256 of the token until their ``exp``. Errors are the ``jwt`` exception
+types, so callers can keep catching ``jwt.InvalidTokenError``.
+
+``JWT_SECRET`` must be set: an empty key would accept any token signed with
+it, so the module refuses to load without one.
+"""
+
+import hashlib
+import os
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+import jwt
+
+JWT_SECRET = os.environ["JWT_SECRET"]
+if not JWT_SECRET:
+    raise RuntimeError("JWT_SECRET must not be empty")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+Principal = namedtuple("Principal", ["principal_id", "expires_at"])
+
+
+class TokenCache:
+    """LRU of ``sha256(token) -> Principal``, holding at most ``maxsize``
+    tokens. Expired entries are dropped when they are read."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            principal = self._entries.get(key)
+            if principal is None or principal.expires_at <= now:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return principal
+
+    def put(self, key, principal):
+        with self._lock:
+            self._entries[key] = principal
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+
+def decode_token(token):
+    """Verify an HS256 ``token`` and return its ``Principal``, without the
+    cache. Raises ``jwt.InvalidTokenError`` (or a subclass)."""
+    payload = jwt.decode(
+        token, JWT_SECRET, algorithms=["HS256"], options={"require": ["exp"]}
+    )
+    if "principalId" not in payload:
+        raise jwt.MissingRequiredClaimError("principalId")
+    return Principal(payload["principalId"], payload["exp"])
+
+
+def verify_token(token):
+    """``decode_token`` behind the LRU cache. Only valid tokens are cached, an
+    invalid one is decoded every time it is presented."""
+    now = time.time()
+    key = hashlib.sha256(token.encode()).digest()
+    principal = token_cache.get(key, now)
+    if principal is None:
+        principal = decode_token(token)
+        token_cache.put(key, principal)
+    return principal
+
+
+def token_from_event(event):
+    """The bearer token of an API Gateway REQUEST authorizer event. Raises
+    ``jwt.DecodeError`` without one, including for any other scheme."""
+    headers = event.get("headers") or {}
+    authorization = headers.get("authorization") or headers.get("Authorization")
+    if not authorization:
+        raise jwt.DecodeError("Missing Authorization header")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise jwt.DecodeError("Authorization header is not a bearer token")
+    return token.strip()
+
+
+def build_policy(principal_id, effect, route_arn):
+    """IAM policy response for ``principal_id``.
+
+    The resource is every route of the stage rather than the route that was
+    called: API Gateway caches the policy per Authorization header (see
+    ``authorizer_result_ttl_in_seconds`` in infra/lambdas.tf) and reuses it for
+    other routes, which a single-route policy would then deny.
+    """
+    api_and_stage = "/".join(route_arn.split("/")[:2])
+    return {
+        "principalId": principal_id,
+        "policyDocument": {
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    "Action": "execute-api:Invoke",
+                    "Effect": effect,
+                    "Resource": f"{api_and_stage}/*",
+                }
+            ],
+        },
+        "context": {"principalId": principal_id},
+    }
@@ -0,0 +1,75 @@
+import time
+
+import jwt
+import pytest
+
+from authorizer import tokens
+from authorizer.handler import lambda_handler
+from authorizer.tokens import token_from_event
+
+ROUTE_ARN = "arn:aws:execute-api:us-east-1:123456789012:abcdef/prod/GET/v1/user"
+
+
+def make_token(**claims):
+    claims = {"principalId": 7, "exp": int(time.time()) + 3600, **claims}
+    return jwt.encode(claims, tokens.JWT_SECRET, algorithm="HS256")
+
+
+def event(authorization):
+    return {"headers": {"Authorization": authorization}, "methodArn": ROUTE_ARN}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    tokens.token_cache.clear()
+
+
+def test_bearer_token_is_read_from_either_header_case():
+    assert token_from_event(event("Bearer abc")) == "abc"
+    assert token_from_event({"headers": {"authorization": "bearer abc"}}) == "abc"
+
+
+@pytest.mark.parametrize("authorization", [None, "", "abc", "Basic abc", "Bearer "])
+def test_anything_but_a_bearer_token_is_rejected(authorization):
+    with pytest.raises(jwt.DecodeError):
+        token_from_event(event(authorization))
+
+
+def test_valid_tokens_are_allowed_on_the_whole_stage():
+    policy = lambda_handler(event(f"Bearer {make_token()}"), None)
+    assert policy["principalId"] == "7"
+    (statement,) = policy["policyDocument"]["Statement"]
+    assert statement["Effect"] == "Allow"
+    assert (
+        statement["Resource"]
+        == "arn:aws:execute-api:us-east-1:123456789012:abcdef/prod/*"
+    )
+
+
+def test_a_token_without_the_bearer_scheme_is_denied():
+    policy = lambda_handler(event(make_token()), None)
+    assert policy["policyDocument"]["Statement"][0]["Effect"] == "Deny"
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        make_token(exp=int(time.time()) - 10),
+        jwt.encode({"principalId": 7}, tokens.JWT_SECRET, algorithm="HS256"),
+        jwt.encode(
+            {"principalId": 7, "exp": 2**40}, "another-secret-of-32-bytes-or-more"
+        ),
+    ],
+    ids=["expired", "no exp", "wrong key"],
+)
+def test_invalid_tokens_are_denied_and_not_cached(token):
+    policy = lambda_handler(event(f"Bearer {token}"), None)
+    assert policy["policyDocument"]["Statement"][0]["Effect"] == "Deny"
+    assert len(tokens.token_cache._entries) == 0
+
+
+def test_valid_tokens_are_decoded_once():
+    token = make_token()
+    for _ in range(3):
+        assert tokens.verify_token(token).principal_id == 7
+    assert (tokens.token_cache.hits, tokens.token_cache.misses) == (2, 1)
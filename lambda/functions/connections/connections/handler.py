@@ -1,12 +1,11 @@
 # force build comment 2683534907
-import json
+from shared.utils import dumps, error_response, json_response, resolve
+from shared.db import DatabaseError
+
 
 import os
-import traceback
 import secrets
 
-import psycopg2
-
 # from psycopg2.extras import RealDictCursor
 
 from aws_lambda_powertools import Logger, Tracer
@@ -18,13 +17,6 @@ from aws_lambda_powertools.utilities.parser import BaseModel
 from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
 import urllib.parse
 
-# Database connection parameters
-DB_NAME = os.environ["DB_NAME"]
-DB_USER = os.environ["DB_USER"]
-DB_PASSWORD = os.environ["DB_PASSWORD"]
-DB_HOST = os.environ["DB_HOST"]
-DB_PORT = os.environ["DB_PORT"]
-
 # Keys
 TELEGRAM_CLIENT_ID = os.environ["TELEGRAM_CLIENT_ID"]
 TELEGRAM_SECRET = os.environ["TELEGRAM_SECRET"]
@@ -43,50 +35,23 @@ BASE_URL = os.environ["BASE_URL"]
 logger = Logger()
 tracer = Tracer()
 
-app = APIGatewayRestResolver(strip_prefixes=["/v1/connections"])
+app = APIGatewayRestResolver(strip_prefixes=["/v1/connections"], serializer=dumps)
 
 
 class Connection(BaseModel):
     id: str
 
 
-class DatabaseError(Exception):
-    """Custom exception for database-related errors."""
-
-    pass
-
-
-@tracer.capture_method
-def get_db_connection():
-    try:
-        return psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT,
-        )
-    except psycopg2.Error as e:
-        logger.error(f"Failed to connect to the database: {str(e)}")
-        raise DatabaseError("Unable to establish database connection") from e
-
-
 @app.exception_handler(Exception)
 def handle_general_exception(e):
     logger.exception("An unexpected error occurred")
-    return {
-        "statusCode": 500,
-        "body": "An unexpected error occurred. Please try again later.",
-    }
+    return error_response(500, "An unexpected error occurred. Please try again later.")
 
 
 @app.exception_handler(DatabaseError)
 def handle_database_error(e):
     logger.error(f"Database error: {str(e)}")
-    return {
-        "statusCode": 500,
-        "body": "A database error occurred. Please try again later.",
-    }
+    return error_response(500, "A database error occurred. Please try again later.")
 
 
 @logger.inject_lambda_context(correlation_id_path=correlation_paths.API_GATEWAY_REST)
@@ -94,29 +59,7 @@ def handle_database_error(e):
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     logger.info("Auth Lambda handler invoked")
 
-    try:
-        response = app.resolve(event, context)
-        if isinstance(response.get("body"), str):
-            try:
-                body = json.loads(response["body"])
-                response["body"] = json.dumps(body)
-            except json.JSONDecodeError:
-                pass  # If it's not JSON, leave it as is
-        return response
-    except Exception as e:
-        logger.error(f"An error occurred in the lambda handler: {str(e)}")
-        logger.error(f"Exception type: {type(e).__name__}")
-        logger.error(f"Exception traceback: {traceback.format_exc()}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps(
-                {
-                    "error": "An internal server error occurred",
-                    "details": str(e),
-                    "type": type(e).__name__,
-                }
-            ),
-        }
+    return resolve(app, event, context)
 
 
 @app.get("/discord")
@@ -128,7 +71,6 @@ def get_discord_redirect():
         # Generate a random state parameter
         state = secrets.token_urlsafe(16)
 
-
         # oath2 url to redirect to discord
         # TODO: prompt=none?
         encoded_callback_route = urllib.parse.quote(
@@ -141,12 +83,8 @@ def get_discord_redirect():
         )
     except Exception as e:
         logger.error(f"Error redirecting to discord {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps(
-                {"error": "An error occurred while attempting to redirect to discord"}
-            ),
+        return error_response(
+            500, "An error occurred while attempting to redirect to discord"
         )
 
 
@@ -170,12 +108,8 @@ def get_telegram_redirect():
         )
     except Exception as e:
         logger.error(f"Error redirecting to telegram {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps(
-                {"error": "An error occurred while attempting to redirect to telegram"}
-            ),
+        return error_response(
+            500, "An error occurred while attempting to redirect to telegram"
         )
 
 
@@ -198,12 +132,8 @@ def get_twitter_redirect():
         )
     except Exception as e:
         logger.error(f"Error redirecting to twitter {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps(
-                {"error": "An error occurred while attempting to redirect to twitter"}
-            ),
+        return error_response(
+            500, "An error occurred while attempting to redirect to twitter"
         )
 
 
@@ -227,30 +157,18 @@ def get_instagram_redirect():
         )
     except Exception as e:
         logger.error(f"Error redirecting to instagram {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps(
-                {"error": "An error occurred while attempting to redirect to instagram"}
-            ),
+        return error_response(
+            500, "An error occurred while attempting to redirect to instagram"
         )
 
 
 @app.get("/instagram/deauthorize")
 @tracer.capture_method
 def deauthorize_instagram():
-    return Response(
-        status_code=200,
-        content_type="application/json",
-        body=json.dumps({"success": "User deauthorized Instagram"}),
-    )
+    return json_response(200, {"success": "User deauthorized Instagram"})
 
 
 @app.get("/instagram/delete-data")
 @tracer.capture_method
 def delete_data_instagram():
-    return Response(
-        status_code=200,
-        content_type="application/json",
-        body=json.dumps({"success": "User deleted Instagram data"}),
-    )
+    return json_response(200, {"success": "User deleted Instagram data"})
@@ -0,0 +1,109 @@
+"""Popcorn for many users at once.
+
+All users and their tasks up to the calculation time come back from one
+set-based query, sorted by user and time. The balances are then folded for
+every user in a single vectorized pass: each task closes a segment that earned
+``(performed_at - previous event) * multiplier so far`` and the segments are
+summed per user with ``np.add.reduceat``. The result matches the replay in
+ledger.py up to float rounding.
+"""
+
+from shared.lazy import lazy_import
+
+from .ledger import MULTIPLIER_PRECISION, ensure_utc
+from .tasks import task_multipliers
+
+# numpy is only needed by the batch route, keep it out of the cold start
+np = lazy_import("numpy")
+
+MAX_BATCH_SIZE = 5000
+
+
+def fetch_task_rows(cur, user_ids, until):
+    """``(user_id, created_date, performed_at, multiplier)`` per task, or a
+    single row with NULL task columns for users without tasks, ordered by user
+    and time. Multipliers come from the cached task catalog."""
+    cur.execute(
+        """
+        SELECT u.id, u.created_date, utm.performed_at, utm.multiplier_task_id
+        FROM users u
+        LEFT JOIN user_to_multiplier utm
+          ON utm.user_id = u.id AND utm.performed_at <= %s
+        WHERE u.id = ANY(%s)
+        ORDER BY u.id, utm.performed_at
+        """,
+        (until, list(user_ids)),
+    )
+    rows = cur.fetchall()
+    multipliers = task_multipliers(cur, {row[3] for row in rows if row[3] is not None})
+    return [
+        (user_id, created_at, performed_at, multipliers.get(task_id))
+        for user_id, created_at, performed_at, task_id in rows
+    ]
+
+
+def calculate_batch(rows, until):
+    """Return ``{user_id: (total_popcorn, current_multiplier)}`` at ``until``
+    for rows shaped like ``fetch_task_rows`` output."""
+    if not rows:
+        return {}
+
+    user_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    created = np.fromiter(
+        (ensure_utc(row[1]).timestamp() for row in rows),
+        dtype=np.float64,
+        count=len(rows),
+    )
+    has_task = np.fromiter(
+        (row[2] is not None for row in rows), dtype=bool, count=len(rows)
+    )
+    performed = np.where(
+        has_task,
+        np.fromiter(
+            (
+                ensure_utc(row[2]).timestamp() if row[2] is not None else 0.0
+                for row in rows
+            ),
+            dtype=np.float64,
+            count=len(rows),
+        ),
+        created,
+    )
+    increments = np.where(
+        has_task,
+        np.fromiter(
+            (float(row[3]) if row[3] is not None else 1.0 for row in rows),
+            dtype=np.float64,
+            count=len(rows),
+        )
+        - 1,
+        0.0,
+    )
+
+    # Boundaries of each user's run of rows
+    starts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+    ends = np.r_[starts[1:], len(rows)] - 1
+    run_lengths = np.diff(np.r_[starts, len(rows)])
+
+    # Multiplier in force before each task: 1 + increments so far in the run
+    cumulative = np.cumsum(increments)
+    run_offset = np.repeat(cumulative[starts] - increments[starts], run_lengths)
+    multiplier_before = np.round(
+        1 + cumulative - increments - run_offset, MULTIPLIER_PRECISION
+    )
+
+    previous = np.r_[0.0, performed[:-1]]
+    previous[starts] = created[starts]
+    earned = np.add.reduceat((performed - previous) * multiplier_before, starts)
+
+    final_multiplier = np.round(
+        1 + cumulative[ends] - run_offset[ends], MULTIPLIER_PRECISION
+    )
+    totals = earned + (until.timestamp() - performed[ends]) * final_multiplier
+
+    return {
+        int(user_id): (float(total), float(multiplier))
+        for user_id, total, multiplier in zip(
+            user_ids[starts], totals, final_multiplier
+        )
+    }
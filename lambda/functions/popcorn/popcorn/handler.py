@@ -3,10 +3,53 @@ import json
 import os
 import traceback
 from datetime import datetime, timezone
-from decimal import Decimal
 from enum import Enum
+from typing import List, Optional
 import uuid
 
+from shared.aiodb import run
+from shared.constants import DB_ASYNC
+from shared.db import get_db_connection, DatabaseError
+from shared.utils import dumps, error_response, json_response, resolve
+from .ledger import (
+    ensure_utc,
+    popcorn_at,
+    popcorn_at_async,
+    record_task_events,
+    replay_window,
+    user_multiplier,
+)
+from .leaderboard import (
+    MAX_LEADERBOARD_SIZE,
+    leaderboard_async,
+    top_users,
+    user_rank,
+)
+from .batch import MAX_BATCH_SIZE, calculate_batch, fetch_task_rows
+from .history import (
+    DEFAULT_HISTORY_STEP,
+    DEFAULT_HISTORY_WINDOW,
+    MAX_HISTORY_SAMPLES,
+    MAX_JSON_HISTORY_SAMPLES,
+    history_samples,
+    popcorn_series,
+    sample_times,
+    to_ndjson,
+)
+from .tasks import get_task_catalog, task_multipliers
+from .ingest import award_tasks, ingest_assignments
+from .invite_codes import MAX_BULK_INVITE_CODES, mint_codes
+from .redemption import (
+    ALREADY_APPLIED,
+    ALREADY_USED,
+    NOT_FOUND,
+    OWN_CODE,
+    code_usage,
+    invalid_codes,
+    redeem,
+)
+from .jobs import enqueue_social_callback
+
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from aws_lambda_powertools import Logger, Tracer
@@ -14,31 +57,26 @@ from aws_lambda_powertools.event_handler import APIGatewayRestResolver
 from aws_lambda_powertools.event_handler.api_gateway import Response
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.logging import correlation_paths
-from aws_lambda_powertools.utilities.parser import BaseModel
+from aws_lambda_powertools.utilities.parser import BaseModel, ValidationError
 from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
 
-# Database connection parameters
-DB_NAME = os.environ["DB_NAME"]
-DB_USER = os.environ["DB_USER"]
-DB_PASSWORD = os.environ["DB_PASSWORD"]
-DB_HOST = os.environ["DB_HOST"]
-DB_PORT = os.environ["DB_PORT"]
-
 APP_BASE_URL = os.environ["APP_BASE_URL"]
 PROFILE_URL = f"{APP_BASE_URL}/profile"
+# multiplier_tasks row awarded for applying a user invite code
+INVITE_CODE_TASK_ID = os.environ.get("INVITE_CODE_TASK_ID")
+# Status and message of each reason an invite code isn't redeemed
+REDEMPTION_ERRORS = {
+    NOT_FOUND: (404, "Invite code not found"),
+    ALREADY_USED: (409, "Invite code already used"),
+    ALREADY_APPLIED: (409, "Invite code already applied"),
+    OWN_CODE: (403, "Cannot redeem your own invite code"),
+}
 
 logger = Logger()
 tracer = Tracer()
 
 # Set up app with API Gateway resolver
-app = APIGatewayRestResolver(strip_prefixes=["/v1/popcorn"])
-
-
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+app = APIGatewayRestResolver(strip_prefixes=["/v1/popcorn"], serializer=dumps)
 
 
 # Enum for invite code types
@@ -77,10 +115,21 @@ class PopcornCalculation(BaseModel):
     calculated_at: datetime
 
 
-class DatabaseError(Exception):
-    """Custom exception for database-related errors."""
+class PopcornBatchRequest(BaseModel):
+    user_ids: List[int]
+    timestamp: Optional[datetime] = None
 
-    pass
+
+class BulkInviteCodeRequest(BaseModel):
+    code_type: str
+    count: int
+    user_id: Optional[int] = None
+    seat_type_id: Optional[int] = None
+
+
+class RedeemInviteCodeRequest(BaseModel):
+    user_id: int
+    invite_code: str
 
 
 class CalculationError(Exception):
@@ -89,134 +138,74 @@ class CalculationError(Exception):
     pass
 
 
-@tracer.capture_method
-def get_db_connection():
-    try:
-        return psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT,
-        )
-    except psycopg2.Error as e:
-        logger.error(f"Failed to connect to the database: {str(e)}")
-        raise DatabaseError("Unable to establish database connection") from e
-
-
 @app.exception_handler(Exception)
 def handle_general_exception(e):
     logger.exception("An unexpected error occurred")
-    return {
-        "statusCode": 500,
-        "body": "An unexpected error occurred. Please try again later.",
-    }
+    return error_response(500, "An unexpected error occurred. Please try again later.")
 
 
 @app.exception_handler(DatabaseError)
 def handle_database_error(e):
     logger.error(f"Database error: {str(e)}")
-    return {
-        "statusCode": 500,
-        "body": "A database error occurred. Please try again later.",
-    }
+    return error_response(500, "A database error occurred. Please try again later.")
 
 
 @app.exception_handler(CalculationError)
 def handle_calculation_error(e):
     logger.error(f"Calculation error: {str(e)}")
-    return {"statusCode": 400, "body": str(e)}
+    return error_response(400, str(e))
 
 
 @app.get("/discord/callback")
 @tracer.capture_method
 def handle_discord_callback():
-    social = "discord"
-    logger.info(f"Handling {social} callback")
-    query_params = app.current_event.query_string_parameters
-    print_social_query_string_values(social, query_params)
-    # verify nonce / user
-    # update tasks
-    return Response(
-        status_code=302,
-        headers={"Location": PROFILE_URL},
-    )
+    return queue_social_callback("discord")
 
 
 @app.get("/instagram/callback")
 @tracer.capture_method
 def handle_instagram_callback():
-    social = "instagram"
-    logger.info(f"Handling {social} callback")
-    query_params = app.current_event.query_string_parameters
-    print_social_query_string_values(social, query_params)
-    # verify nonce / user
-    # update tasks
-    return Response(
-        status_code=302,
-        headers={"Location": PROFILE_URL},
-    )
+    return queue_social_callback("instagram")
 
 
 @app.get("/telegram/callback")
 @tracer.capture_method
 def handle_telegram_callback():
-    social = "telegram"
-    logger.info(f"Handling {social} callback")
-    query_params = app.current_event.query_string_parameters
-    print_social_query_string_values(social, query_params)
-    # verify nonce / user
-    # update tasks
-    return Response(
-        status_code=302,
-        headers={"Location": PROFILE_URL},
-    )
+    return queue_social_callback("telegram")
 
 
 @app.get("/twitter/callback")
 @tracer.capture_method
 def handle_twitter_callback():
-    social = "twitter"
+    return queue_social_callback("twitter")
+
+
+def queue_social_callback(social):
+    """Queue the callback for the worker (see worker.py) and send the user
+    back to their profile straight away. A callback that can't be queued is
+    an error rather than a redirect, since its award would be lost."""
     logger.info(f"Handling {social} callback")
-    query_params = app.current_event.query_string_parameters
-    print_social_query_string_values(social, query_params)
-    # verify nonce / user
-    # update tasks
+    query_params = app.current_event.query_string_parameters or {}
+    job = enqueue_social_callback(social, query_params)
+    logger.info(f"Queued {social} callback", extra={"job_key": job.key})
     return Response(
         status_code=302,
         headers={"Location": PROFILE_URL},
     )
 
 
-def print_social_query_string_values(social, query_params):
-    if query_params:
-        for key, value in query_params.items():
-            print(f"{social} callback: - {key}: {value}")
-    else:
-        print(f"No query string parameters found for {social} callback.")
-
-
 @app.get("/tasks")
 @tracer.capture_method
 def get_all_tasks():
     logger.info("Fetching all tasks")
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SELECT * FROM multiplier_tasks")
-                tasks = cur.fetchall()
-        return Response(
-            status_code=200,
-            content_type="application/json",
-            body=json.loads(json.dumps({"tasks": tasks}, cls=DecimalEncoder)),
-        )
+        catalog = get_task_catalog()
+        if app.current_event.get_header_value("If-None-Match") == catalog.etag:
+            return Response(status_code=304, headers={"ETag": catalog.etag})
+        return json_response(200, catalog.body, headers={"ETag": catalog.etag})
     except Exception as e:
         logger.error(f"Error fetching tasks: {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps({"error": "An error occurred while fetching tasks"}),
-        )
+        return error_response(500, "An error occurred while fetching tasks")
 
 
 @app.get("/user-tasks")
@@ -226,11 +215,7 @@ def get_user_tasks():
     user_id = app.current_event.get_query_string_value("user_id")
     if not user_id:
         logger.warning("User ID is required but not provided")
-        return Response(
-            status_code=400,
-            content_type="application/json",
-            body=json.dumps({"error": "User ID is required"}),
-        )
+        return error_response(400, "User ID is required")
 
     try:
         with get_db_connection() as conn:
@@ -247,29 +232,10 @@ def get_user_tasks():
                 )
                 user_tasks = cur.fetchall()
 
-        # Convert datetime objects to strings for JSON serialization
-        for task in user_tasks:
-            task["performed_at"] = task["performed_at"].isoformat()
-
-        return Response(
-            status_code=200,
-            content_type="application/json",
-            body=json.dumps({"user_id": user_id, "tasks": user_tasks}),
-        )
+        return json_response(200, {"user_id": user_id, "tasks": user_tasks})
     except Exception as e:
         logger.error(f"Error fetching user tasks: {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps({"error": "An error occurred while fetching user tasks"}),
-        )
-
-
-def ensure_utc(dt):
-    """Ensure a datetime is UTC and offset-aware."""
-    if dt.tzinfo is None:
-        return dt.replace(tzinfo=timezone.utc)
-    return dt.astimezone(timezone.utc)
+        return error_response(500, "An error occurred while fetching user tasks")
 
 
 @app.get("/popcorn")
@@ -281,6 +247,10 @@ def calculate_popcorn():
 
         if not user_id:
             raise CalculationError("User ID is required")
+        try:
+            user_id = int(user_id)
+        except ValueError:
+            raise CalculationError("User ID must be an integer")
 
         calculation_time = ensure_utc(datetime.now())
         if timestamp_str:
@@ -289,81 +259,28 @@ def calculate_popcorn():
             except ValueError:
                 raise CalculationError("Invalid timestamp format. Use ISO 8601 format.")
 
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Get user creation time
-                cur.execute("SELECT created_date FROM users WHERE id = %s", (user_id,))
-                user = cur.fetchone()
-                if not user:
-                    raise CalculationError("User not found")
-                user_created_at = ensure_utc(user["created_date"])
-
-                # Get all tasks assigned to the user
-                cur.execute(
-                    """
-                    SELECT utm.performed_at, mt.multiplier
-                    FROM user_to_multiplier utm
-                    JOIN multiplier_tasks mt ON utm.multiplier_task_id = mt.id
-                    WHERE utm.user_id = %s
-                    ORDER BY utm.performed_at
-                """,
-                    (user_id,),
+        if DB_ASYNC:
+            popcorn = run(
+                popcorn_at_async(
+                    user_id, calculation_time, historical=bool(timestamp_str)
                 )
-                tasks = cur.fetchall()
-
-                # Calculate popcorn
-                total_popcorn = 0
-                current_multiplier = 1
-                last_calculation_time = user_created_at
-
-                for task in tasks:
-                    print(task)
-                    task_performed_at = ensure_utc(task["performed_at"])
-
-                    if task_performed_at > calculation_time:
-                        break
-
-                    # Calculate popcorn up to this task assignment
-                    try:
-                        time_diff = (
-                            task_performed_at - last_calculation_time
-                        ).total_seconds()
-                        logger.debug(
-                            f"Time diff calculation: {task_performed_at} - {last_calculation_time} = {time_diff} seconds"
-                        )
-                        total_popcorn += time_diff * current_multiplier
-                    except TypeError as e:
-                        logger.error(f"TypeError in time difference calculation: {e}")
-                        logger.error(
-                            f"task_performed_at: {task_performed_at}, type: {type(task_performed_at)}, tzinfo: {task_performed_at.tzinfo}"
-                        )
-                        logger.error(
-                            f"last_calculation_time: {last_calculation_time}, type: {type(last_calculation_time)}, tzinfo: {last_calculation_time.tzinfo}"
-                        )
-                        raise CalculationError("Error in time difference calculation")
-
-                    # Update multiplier and last calculation time
-                    current_multiplier += task["multiplier"] - 1
-                    last_calculation_time = task_performed_at
-
-                # Calculate remaining popcorn up to the calculation time
-                final_time_diff = (
-                    calculation_time - last_calculation_time
-                ).total_seconds()
-                logger.debug(
-                    f"Final time diff calculation: {calculation_time} - {last_calculation_time} = {final_time_diff} seconds"
-                )
-                total_popcorn += final_time_diff * current_multiplier
-
-                return {
-                    "statusCode": 200,
-                    "body": {
-                        "user_id": int(user_id),
-                        "total_popcorn": total_popcorn,
-                        "current_multiplier": current_multiplier,
-                        "calculated_at": calculation_time.isoformat(),
-                    },
-                }
+            )
+        else:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    popcorn = popcorn_at(cur, user_id, calculation_time)
+        if popcorn is None:
+            raise CalculationError("User not found")
+
+        return json_response(
+            200,
+            {
+                "user_id": user_id,
+                "total_popcorn": popcorn.total_popcorn,
+                "current_multiplier": popcorn.current_multiplier,
+                "calculated_at": calculation_time.isoformat(),
+            },
+        )
 
     except psycopg2.Error as e:
         logger.error(f"Database error during popcorn calculation: {str(e)}")
@@ -374,6 +291,208 @@ def calculate_popcorn():
         raise
 
 
+@app.get("/multiplier")
+@tracer.capture_method
+def get_multiplier():
+    """The user's current multiplier, task count and last task time, read
+    from the ledger without touching the task history."""
+    user_id = app.current_event.get_query_string_value("user_id")
+    if not user_id:
+        raise CalculationError("User ID is required")
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        raise CalculationError("User ID must be an integer")
+
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                multiplier = user_multiplier(cur, user_id)
+    except psycopg2.Error as e:
+        logger.error(f"Database error reading the multiplier: {str(e)}")
+        raise DatabaseError("A database error occurred during calculation")
+    if multiplier is None:
+        raise CalculationError("User not found")
+
+    return json_response(
+        200,
+        {
+            "user_id": user_id,
+            "current_multiplier": multiplier.current_multiplier,
+            "task_count": multiplier.task_count,
+            "last_task_at": multiplier.last_task_at,
+        },
+    )
+
+
+@app.post("/batch")
+@tracer.capture_method
+def calculate_popcorn_batch():
+    try:
+        request = PopcornBatchRequest(**json.loads(app.current_event.body or "{}"))
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise CalculationError(f"Invalid batch request: {str(e)}")
+
+    user_ids = list(dict.fromkeys(request.user_ids))
+    if not user_ids:
+        raise CalculationError("user_ids must not be empty")
+    if len(user_ids) > MAX_BATCH_SIZE:
+        raise CalculationError(f"At most {MAX_BATCH_SIZE} user_ids per request")
+
+    calculation_time = ensure_utc(request.timestamp or datetime.now())
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                rows = fetch_task_rows(cur, user_ids, calculation_time)
+    except psycopg2.Error as e:
+        logger.error(f"Database error during batch popcorn calculation: {str(e)}")
+        raise DatabaseError("A database error occurred during calculation")
+
+    popcorn = calculate_batch(rows, calculation_time)
+    return json_response(
+        200,
+        {
+            "calculated_at": calculation_time.isoformat(),
+            "results": [
+                {
+                    "user_id": user_id,
+                    "total_popcorn": popcorn[user_id][0],
+                    "current_multiplier": popcorn[user_id][1],
+                }
+                for user_id in user_ids
+                if user_id in popcorn
+            ],
+            "not_found": [user_id for user_id in user_ids if user_id not in popcorn],
+        },
+    )
+
+
+@app.get("/history")
+@tracer.capture_method
+def get_popcorn_history():
+    """Popcorn from ``from`` to ``to`` every ``step`` seconds, as JSON or,
+    when asked for with ``Accept: application/x-ndjson`` or when the series is
+    long, as NDJSON."""
+    query_params = app.current_event.query_string_parameters or {}
+    user_id = query_params.get("user_id")
+    if not user_id:
+        raise CalculationError("User ID is required")
+    try:
+        user_id = int(user_id)
+        step = float(query_params.get("step", DEFAULT_HISTORY_STEP))
+    except ValueError:
+        raise CalculationError("user_id must be an integer and step a number")
+    try:
+        until = ensure_utc(
+            datetime.fromisoformat(query_params["to"])
+            if query_params.get("to")
+            else datetime.now()
+        )
+        since = (
+            ensure_utc(datetime.fromisoformat(query_params["from"]))
+            if query_params.get("from")
+            else until - DEFAULT_HISTORY_WINDOW
+        )
+    except ValueError:
+        raise CalculationError("Invalid from or to format. Use ISO 8601 format.")
+    if not step > 0:
+        raise CalculationError("step must be a positive number of seconds")
+    if since > until:
+        raise CalculationError("from must not be after to")
+    if (until - since).total_seconds() / step >= MAX_HISTORY_SAMPLES:
+        raise CalculationError(f"At most {MAX_HISTORY_SAMPLES} samples per request")
+
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                window = replay_window(cur, user_id, since, until)
+    except psycopg2.Error as e:
+        logger.error(f"Database error during popcorn history: {str(e)}")
+        raise DatabaseError("A database error occurred during calculation")
+    if window is None:
+        raise CalculationError("User not found")
+
+    times = sample_times(since, until, step)
+    samples = history_samples(times, *popcorn_series(*window, times))
+    accept = app.current_event.get_header_value("Accept") or ""
+    if "application/x-ndjson" in accept or len(times) > MAX_JSON_HISTORY_SAMPLES:
+        return Response(
+            status_code=200,
+            content_type="application/x-ndjson",
+            body=to_ndjson(samples),
+        )
+    return json_response(
+        200,
+        {
+            "user_id": user_id,
+            "from": since.isoformat(),
+            "to": until.isoformat(),
+            "step": step,
+            "samples": list(samples),
+        },
+    )
+
+
+@app.get("/leaderboard")
+@tracer.capture_method
+def get_leaderboard():
+    query_params = app.current_event.query_string_parameters or {}
+    try:
+        user_id = query_params.get("user_id")
+        user_id = int(user_id) if user_id else None
+        limit = int(query_params.get("limit", 10))
+    except ValueError:
+        raise CalculationError("user_id and limit must be integers")
+    if not 1 <= limit <= MAX_LEADERBOARD_SIZE:
+        raise CalculationError(f"limit must be between 1 and {MAX_LEADERBOARD_SIZE}")
+
+    calculation_time = ensure_utc(datetime.now())
+    try:
+        if DB_ASYNC:
+            leaders, ranked_user = run(
+                leaderboard_async(calculation_time, limit, user_id)
+            )
+        else:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    leaders = top_users(cur, calculation_time, limit)
+                    ranked_user = (
+                        user_rank(cur, user_id, calculation_time)
+                        if user_id is not None
+                        else None
+                    )
+    except psycopg2.Error as e:
+        logger.error(f"Database error while building leaderboard: {str(e)}")
+        raise DatabaseError("A database error occurred while building leaderboard")
+
+    if user_id is not None and ranked_user is None:
+        raise CalculationError("User not found")
+
+    body = {
+        "calculated_at": calculation_time.isoformat(),
+        "leaderboard": [
+            {
+                "rank": position,
+                "user_id": leader_id,
+                "total_popcorn": total_popcorn,
+                "current_multiplier": current_multiplier,
+            }
+            for position, (leader_id, total_popcorn, current_multiplier) in enumerate(
+                leaders, start=1
+            )
+        ],
+    }
+    if ranked_user is not None:
+        rank, popcorn = ranked_user
+        body["user"] = {
+            "rank": rank,
+            "user_id": user_id,
+            "total_popcorn": popcorn.total_popcorn,
+            "current_multiplier": popcorn.current_multiplier,
+        }
+    return json_response(200, body)
+
+
 # New endpoint to generate invite codes
 @app.post("/generate_invite_code")
 @tracer.capture_method
@@ -382,25 +501,118 @@ def generate_invite_code_endpoint():
     code_type_str = body.get("code_type")
 
     if not code_type_str:
-        return {
-            "statusCode": 400,
-            "body": json.dumps({"error": "code_type is required"}),
-        }
+        return error_response(400, "code_type is required")
 
     try:
         code_type = InviteCodeType(code_type_str.lower())
     except ValueError:
-        return {"statusCode": 400, "body": json.dumps({"error": "Invalid code_type"})}
+        return error_response(400, "Invalid code_type")
 
     invite_code = generate_invite_sandwatch_invite_code(code_type)
-    return {"statusCode": 200, "body": json.dumps({"invite_code": invite_code})}
+    return json_response(200, {"invite_code": invite_code})
+
+
+@app.post("/generate_invite_code/bulk")
+@tracer.capture_method
+def generate_invite_codes_in_bulk():
+    """Mint and store up to ``MAX_BULK_INVITE_CODES`` codes of one type in a
+    single call. User codes need the ``user_id`` they belong to and general
+    codes the ``seat_type_id`` they grant."""
+    try:
+        request = BulkInviteCodeRequest(**json.loads(app.current_event.body or "{}"))
+        code_type = InviteCodeType(request.code_type.lower())
+    except (json.JSONDecodeError, ValidationError, TypeError) as e:
+        return error_response(400, f"Invalid bulk invite code request: {str(e)}")
+    except ValueError:
+        return error_response(400, "Invalid code_type")
+    if not 1 <= request.count <= MAX_BULK_INVITE_CODES:
+        return error_response(
+            400, f"count must be between 1 and {MAX_BULK_INVITE_CODES}"
+        )
+    if code_type == InviteCodeType.USER and request.user_id is None:
+        return error_response(400, "user_id is required for user invite codes")
+    if code_type == InviteCodeType.GENERAL and request.seat_type_id is None:
+        return error_response(400, "seat_type_id is required for general invite codes")
+
+    logger.info(f"Generating {request.count} {code_type.value} invite codes")
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                codes = mint_codes(
+                    cur,
+                    code_type.value,
+                    request.count,
+                    request.user_id,
+                    request.seat_type_id,
+                )
+    except psycopg2.Error as e:
+        logger.error(f"Failed to store invite codes: {str(e)}")
+        raise DatabaseError("A database error occurred while storing invite codes")
+    invalid_codes.discard(codes)
+    return json_response(200, {"code_type": code_type.value, "invite_codes": codes})
+
+
+@app.post("/redeem_invite_code")
+@tracer.capture_method
+def redeem_invite_code():
+    """Apply an invite code of any type and award the invite code task, in one
+    transaction. See redemption.py."""
+    try:
+        request = RedeemInviteCodeRequest(**json.loads(app.current_event.body or "{}"))
+    except (json.JSONDecodeError, ValidationError, TypeError) as e:
+        return error_response(400, f"Invalid request body: {str(e)}")
+    if not INVITE_CODE_TASK_ID:
+        raise Exception("INVITE_CODE_TASK_ID is not configured")
+    invite_code = request.invite_code.strip().upper()
+
+    try:
+        redemption = redeem(invite_code, request.user_id, int(INVITE_CODE_TASK_ID))
+    except psycopg2.IntegrityError as e:
+        logger.warning(f"Invite code redeemed for an unknown user: {str(e)}")
+        return error_response(404, "User not found")
+    except psycopg2.Error as e:
+        logger.error(f"Failed to redeem invite code: {str(e)}")
+        raise DatabaseError("A database error occurred while redeeming the code")
+
+    if redemption.refusal is not None:
+        return error_response(*REDEMPTION_ERRORS[redemption.refusal])
+    logger.info(f"User {request.user_id} redeemed a {redemption.code_type} code")
+    return json_response(
+        200,
+        {
+            "user_id": request.user_id,
+            "invite_code": invite_code,
+            "code_type": redemption.code_type,
+        },
+    )
+
+
+@app.get("/invite_code_usage")
+@tracer.capture_method
+def get_invite_code_usage():
+    """How many times a shared GEN- code was redeemed, from its sharded
+    counters."""
+    invite_code = app.current_event.get_query_string_value("code")
+    if not invite_code:
+        return error_response(400, "code parameter is required")
+    invite_code = invite_code.strip().upper()
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                uses = code_usage(cur, [invite_code]).get(invite_code, 0)
+    except psycopg2.Error as e:
+        logger.error(f"Failed to read invite code usage: {str(e)}")
+        raise DatabaseError("A database error occurred while reading the usage")
+    return json_response(200, {"invite_code": invite_code, "uses": uses})
 
 
 # Endpoint to handle invite codes
 @app.post("/apply_invite_code")
 @tracer.capture_method
 def apply_invite_code():
-    # private
+    """Older name of ``/redeem_invite_code``, with the same body and
+    responses."""
+    return redeem_invite_code()
 
 
 @app.post("/user-tasks")
@@ -410,66 +622,64 @@ def assign_task_to_user():
     try:
         body = json.loads(app.current_event.body)
         assignment_data = UserTaskAssignment(**body)
+        performed_at = datetime.utcnow()
         with get_db_connection() as conn:
             with conn.cursor() as cur:
+                try:
+                    multiplier = task_multipliers(
+                        cur, [assignment_data.multiplier_task_id]
+                    )[assignment_data.multiplier_task_id]
+                except KeyError:
+                    raise CalculationError("Task not found")
                 cur.execute(
                     "INSERT INTO user_to_multiplier (user_id, multiplier_task_id, performed_at) VALUES (%s, %s, %s) RETURNING id",
                     (
                         assignment_data.user_id,
                         assignment_data.multiplier_task_id,
-                        datetime.utcnow(),
+                        performed_at,
                     ),
                 )
                 assignment_id = cur.fetchone()[0]
-                conn.commit()
+                record_task_events(
+                    cur, assignment_data.user_id, [(performed_at, multiplier)]
+                )
         logger.info(f"Task assigned successfully. Assignment ID: {assignment_id}")
-        return Response(
-            status_code=201,
-            content_type="application/json",
-            body=json.dumps(
-                {"id": assignment_id, "message": "Task assigned to user successfully"}
-            ),
+        return json_response(
+            201, {"id": assignment_id, "message": "Task assigned to user successfully"}
         )
+    except CalculationError:
+        # An unknown task is the client's error, see handle_calculation_error
+        raise
     except Exception as e:
         logger.error(f"Error assigning task to user: {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps(
-                {"error": "An error occurred while trying to assign the task"}
-            ),
-        )
+        return error_response(500, "An error occurred while trying to assign the task")
+
+
+@app.post("/user-tasks/bulk")
+@tracer.capture_method
+def assign_tasks_in_bulk():
+    """Assign many tasks at once from an NDJSON or JSON array body, e.g. for
+    social callback backfills or campaign imports. Rows are reported one by
+    one, a bad row doesn't reject the others."""
+    logger.info("Assigning tasks in bulk")
+    results = ingest_assignments(
+        app.current_event.body or "",
+        app.current_event.get_header_value("Content-Type"),
+    )
+
+    created = sum(1 for result in results if result["status"] == "created")
+    logger.info(f"Assigned {created} of {len(results)} tasks")
+    return json_response(
+        200,
+        {"created": created, "failed": len(results) - created, "results": results},
+    )
 
 
 @logger.inject_lambda_context(correlation_id_path=correlation_paths.API_GATEWAY_REST)
 @tracer.capture_lambda_handler
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     logger.info("Lambda handler invoked")
-
-    try:
-        response = app.resolve(event, context)
-
-        if isinstance(response.get("body"), str):
-            try:
-                body = json.loads(response["body"])
-                response["body"] = json.dumps(body, cls=DecimalEncoder)
-            except json.JSONDecodeError:
-                pass  # If it's not JSON, leave it as is
-        return response
-    except Exception as e:
-        logger.error(f"An error occurred in the lambda handler: {str(e)}")
-        logger.error(f"Exception type: {type(e).__name__}")
-        logger.error(f"Exception traceback: {traceback.format_exc()}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps(
-                {
-                    "error": "An internal server error occurred",
-                    "details": str(e),
-                    "type": type(e).__name__,
-                }
-            ),
-        }
+    return resolve(app, event, context)
 
 
 def determine_invite_code_type(invite_code):
@@ -488,65 +698,51 @@ def determine_invite_code_type(invite_code):
 def validate_user_invite_code(invite_code):
     # Logic to validate user invite code in the database
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT * FROM user_invite_codes WHERE code = %s", (invite_code,)
-            )
-            result = cur.fetchone()
-            return result is not None
+        with get_db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    "SELECT * FROM user_invite_codes WHERE code = %s", (invite_code,)
+                )
+                result = cur.fetchone()
+                return result is not None
     except psycopg2.Error as e:
         logger.error(f"Failed to validate user invite code: {str(e)}")
         return False
-    finally:
-        conn.close()
 
 
 def update_user_to_multiplier(user_id):
-    # Logic to update the user_to_multiplier table
+    """Award the invite code task to the user. user_to_multiplier is the task
+    history, so this adds a row to it and folds it into the ledger, in one
+    transaction like any other award."""
+    if not INVITE_CODE_TASK_ID:
+        raise Exception("INVITE_CODE_TASK_ID is not configured")
+    task_id = int(INVITE_CODE_TASK_ID)
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO user_to_multiplier (user_id, multiplier)
-                VALUES (%s, 1.1)
-                ON CONFLICT (user_id) DO UPDATE SET multiplier = user_to_multiplier.multiplier * 1.1
-                """,
-                (user_id,),
-            )
-            conn.commit()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                award_tasks(
+                    cur,
+                    [(user_id, task_id, datetime.now(timezone.utc))],
+                    task_multipliers(cur, [task_id]),
+                )
     except psycopg2.Error as e:
         logger.error(f"Failed to update user_to_multiplier: {str(e)}")
         raise Exception("Unable to update user_to_multiplier") from e
-    finally:
-        conn.close()
 
 
 def validate_and_use_sandwatch_code(invite_code):
-    # Logic to validate and use sandwatch invite code
+    # Claim the code in one statement, so two requests can't both use it
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT * FROM sandwatch_invite_codes WHERE code = %s AND used = FALSE",
-                (invite_code,),
-            )
-            result = cur.fetchone()
-            if result:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
                 cur.execute(
-                    "UPDATE sandwatch_invite_codes SET used = TRUE WHERE code = %s",
+                    "UPDATE sandwatch_invite_codes SET used = TRUE WHERE code = %s AND used = FALSE RETURNING code",
                     (invite_code,),
                 )
-                conn.commit()
-                return True
-            else:
-                return False
+                return cur.fetchone() is not None
     except psycopg2.Error as e:
         logger.error(f"Failed to validate and use sandwatch invite code: {str(e)}")
         return False
-    finally:
-        conn.close()
 
 
 def generate_invite_sandwatch_invite_code(code_type: InviteCodeType) -> str:
@@ -562,4 +758,3 @@ def generate_invite_sandwatch_invite_code(code_type: InviteCodeType) -> str:
         return f"SW-{unique_id}"
     else:
         raise ValueError("Invalid invite code type")
-
@@ -0,0 +1,88 @@
+"""Popcorn over time for ``GET /popcorn/history``.
+
+A balance is piecewise linear in time with a breakpoint at every task, so the
+whole series comes from one pass instead of a ``popcorn_at`` replay per
+sample. The balance and multiplier right after each breakpoint are cumulative
+sums over the tasks, ``np.searchsorted`` finds the last breakpoint at or
+before every sample, and each sample is extrapolated from there. The tasks are
+read once, starting at the nearest checkpoint before the window (see
+``replay_window`` in ledger.py). The values match ``popcorn_at`` at the same
+times up to float rounding.
+
+Long series are returned as NDJSON, one sample per line, instead of a single
+JSON document.
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+
+from shared.lazy import lazy_import
+from shared.utils import dumps
+
+from .ledger import MULTIPLIER_PRECISION, ensure_utc
+
+# numpy is only needed by the history and batch routes, keep it out of the
+# cold start
+np = lazy_import("numpy")
+
+MAX_HISTORY_SAMPLES = 100_000
+# Larger series are sent as NDJSON even if the client didn't ask for it
+MAX_JSON_HISTORY_SAMPLES = 1000
+DEFAULT_HISTORY_WINDOW = timedelta(days=30)
+DEFAULT_HISTORY_STEP = 86400.0
+
+
+def sample_times(since, until, step):
+    """Epoch seconds from ``since`` to ``until`` (inclusive) every ``step``
+    seconds."""
+    start = since.timestamp()
+    count = int((until.timestamp() - start) // step) + 1
+    return start + step * np.arange(count, dtype=np.float64)
+
+
+def popcorn_series(start, events, times):
+    """Return ``(totals, multipliers)`` arrays at each of the sorted epoch
+    ``times``, from the ``LedgerState`` ``start`` and the ``(performed_at,
+    multiplier)`` events after it, oldest first."""
+    breakpoints = np.fromiter(
+        chain(
+            (start.last_event_at.timestamp(),),
+            (ensure_utc(performed_at).timestamp() for performed_at, _ in events),
+        ),
+        dtype=np.float64,
+        count=len(events) + 1,
+    )
+    increments = np.fromiter(
+        chain((0.0,), (float(multiplier) - 1 for _, multiplier in events)),
+        dtype=np.float64,
+        count=len(events) + 1,
+    )
+    # Multiplier in force from each breakpoint on, and the balance at it
+    multipliers = np.round(
+        start.current_multiplier + np.cumsum(increments), MULTIPLIER_PRECISION
+    )
+    totals = (
+        start.total_popcorn
+        + np.r_[0.0, np.cumsum(np.diff(breakpoints) * multipliers[:-1])]
+    )
+
+    # Events at a sample's exact time count, as in replay()
+    index = np.maximum(np.searchsorted(breakpoints, times, side="right") - 1, 0)
+    return (
+        totals[index] + (times - breakpoints[index]) * multipliers[index],
+        multipliers[index],
+    )
+
+
+def history_samples(times, totals, multipliers):
+    """Yield one sample dict per time."""
+    for at, total, multiplier in zip(times.tolist(), totals.tolist(), multipliers):
+        yield {
+            "at": datetime.fromtimestamp(at, timezone.utc).isoformat(),
+            "total_popcorn": total,
+            "current_multiplier": float(multiplier),
+        }
+
+
+def to_ndjson(samples):
+    return "".join(dumps(sample) + "\n" for sample in samples)
@@ -0,0 +1,188 @@
+"""Bulk task assignment for ``POST /popcorn/user-tasks/bulk``.
+
+The body is NDJSON (one assignment per line) or a JSON array. Assignments are
+decoded and validated one at a time as the body is read, and the valid ones
+are written ``INGEST_BATCH_SIZE`` at a time: one multi-row ``INSERT ...
+RETURNING id`` into ``user_to_multiplier`` and one ledger update per user in
+the batch, all in a single transaction per batch. A batch that fails is
+reported row by row and doesn't stop the batches after it.
+
+``COPY FROM STDIN`` would be slightly faster but cannot return the ids the
+per-row results need.
+"""
+
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+import psycopg2
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.utilities.parser import BaseModel, ValidationError
+from psycopg2.extras import execute_values
+
+from shared.db import DatabaseError, get_db_connection
+
+from .ledger import ensure_utc, record_task_events
+from .tasks import catalog_multipliers
+
+MAX_BULK_ASSIGNMENTS = 10_000
+INGEST_BATCH_SIZE = 500
+
+logger = Logger(child=True)
+
+
+class BulkTaskAssignment(BaseModel):
+    user_id: int
+    multiplier_task_id: int
+    performed_at: Optional[datetime] = None
+
+
+def _iter_json_array(text):
+    """Yield the elements of a JSON array one at a time, raising ValueError
+    at the first malformed element."""
+    decoder = json.JSONDecoder()
+    position = text.index("[") + 1
+    length = len(text)
+
+    def skip_whitespace(position):
+        while position < length and text[position] in " \t\r\n":
+            position += 1
+        return position
+
+    position = skip_whitespace(position)
+    if position < length and text[position] == "]":
+        return
+    while True:
+        value, position = decoder.raw_decode(text, skip_whitespace(position))
+        yield value
+        position = skip_whitespace(position)
+        if position >= length:
+            raise ValueError("Unterminated JSON array")
+        if text[position] == "]":
+            return
+        if text[position] != ",":
+            raise ValueError(f"Expected ',' or ']' at character {position}")
+        position += 1
+
+
+def iter_records(body, content_type=None):
+    """Yield ``(index, record or None, error or None)`` for every assignment
+    in an NDJSON or JSON array ``body``."""
+    is_array = not (content_type and "ndjson" in content_type) and (
+        body.lstrip().startswith("[")
+    )
+    if is_array:
+        index = 0
+        try:
+            for value in _iter_json_array(body):
+                yield index, value, None
+                index += 1
+        except ValueError as e:
+            # Nothing after a malformed element can be located reliably
+            yield index, None, f"Invalid JSON: {str(e)}"
+        return
+
+    index = 0
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            yield index, json.loads(line), None
+        except json.JSONDecodeError as e:
+            yield index, None, f"Invalid JSON: {str(e)}"
+        index += 1
+
+
+def _validate(record, now):
+    try:
+        assignment = BulkTaskAssignment(**record)
+    except (TypeError, ValidationError) as e:
+        return None, f"Invalid assignment: {str(e)}"
+    performed_at = ensure_utc(assignment.performed_at or now)
+    if performed_at > now:
+        return None, "performed_at is in the future"
+    return (assignment.user_id, assignment.multiplier_task_id, performed_at), None
+
+
+def award_tasks(cur, rows, multipliers):
+    """Insert ``(user_id, multiplier_task_id, performed_at)`` rows with one
+    multi-row insert and fold them into each user's ledger. Returns the new
+    ids in row order. Users and tasks must exist."""
+    ids = execute_values(
+        cur,
+        """
+        INSERT INTO user_to_multiplier (user_id, multiplier_task_id, performed_at)
+        VALUES %s
+        RETURNING id
+        """,
+        rows,
+        page_size=len(rows),
+        fetch=True,
+    )
+    events = {}
+    for user_id, task_id, performed_at in rows:
+        events.setdefault(user_id, []).append((performed_at, multipliers[task_id]))
+    # In id order so concurrent writers lock users in the same order
+    for user_id in sorted(events):
+        record_task_events(cur, user_id, events[user_id])
+    return [row[0] for row in ids]
+
+
+def _write_batch(batch, results):
+    """Insert one batch of ``(index, (user_id, task_id, performed_at))`` and
+    update the ledger of every user in it, in one transaction."""
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                user_ids = sorted({row[0] for _, row in batch})
+                cur.execute("SELECT id FROM users WHERE id = ANY(%s)", (user_ids,))
+                existing = {row[0] for row in cur.fetchall()}
+
+                multipliers = catalog_multipliers(cur, {row[1] for _, row in batch})
+
+                rows = []
+                for index, row in batch:
+                    if row[0] not in existing:
+                        results[index] = {"status": "error", "error": "User not found"}
+                    elif row[1] not in multipliers:
+                        results[index] = {"status": "error", "error": "Task not found"}
+                    else:
+                        rows.append((index, row))
+                if not rows:
+                    return
+
+                ids = award_tasks(cur, [row for _, row in rows], multipliers)
+    except (psycopg2.Error, DatabaseError) as e:
+        # DatabaseError is the pool's, e.g. no connection within the timeout.
+        # Either way the batch is reported and the next one still runs.
+        logger.error(f"Bulk assignment batch failed: {str(e)}")
+        for index, _ in batch:
+            if results[index] is None:
+                results[index] = {"status": "error", "error": "Database error"}
+        return
+
+    for (index, _), assignment_id in zip(rows, ids):
+        results[index] = {"status": "created", "id": assignment_id}
+
+
+def ingest_assignments(body, content_type=None, now=None):
+    """Validate and write every assignment in ``body``. Returns one result
+    dict per assignment, in order."""
+    now = ensure_utc(now or datetime.now(timezone.utc))
+    results, batch = [], []
+    for index, record, error in iter_records(body, content_type):
+        results.append(None)
+        if index >= MAX_BULK_ASSIGNMENTS:
+            error = f"At most {MAX_BULK_ASSIGNMENTS} assignments can be sent at once"
+        elif error is None:
+            row, error = _validate(record, now)
+        if error is not None:
+            results[index] = {"status": "error", "error": error}
+            continue
+        batch.append((index, row))
+        if len(batch) >= INGEST_BATCH_SIZE:
+            _write_batch(batch, results)
+            batch = []
+    if batch:
+        _write_batch(batch, results)
+    return [dict(result, index=index) for index, result in enumerate(results)]
@@ -0,0 +1,156 @@
+"""Invite codes minted in bulk, without collisions.
+
+A call claims a range of numbers from the code type's sequence in
+``invite_code_sequences`` (migrations/0007_invite_code_sequences.sql) and turns
+each number into a code with a keyed permutation of the 40-bit numbers: a
+4-round Feistel network whose round keys are derived from ``INVITE_CODE_KEY``
+and the code type. A permutation never maps two numbers to the same value, so
+codes are unique by construction and no lookup is needed before inserting
+them, while consecutive numbers still give unrelated looking codes. The
+result is written as 8 Crockford base32 characters after the type's prefix,
+e.g. ``GEN-7Q2MZK0D``, which leaves room for about 10^12 codes per type.
+
+The permutation and the encoding run vectorized over the whole range. The
+codes are inserted ``INVITE_CODE_BATCH_SIZE`` rows per statement, in the
+transaction that claimed the range, so a failed call gives its numbers back.
+
+The permutation only obfuscates the sequence, it is not a cipher: 4 rounds of
+a non-cryptographic mix don't stop someone holding enough codes from
+recovering the round keys. It keeps codes from being read off as counters;
+what makes a code hard to guess is the secret key and the size of the space.
+Without the key the round keys are public (this repository is), so every code
+could be enumerated from its sequence number. ``INVITE_CODE_KEY`` is therefore
+required and must not be empty, and it must stay the same once codes have
+been minted: a different key is a different permutation, whose codes could
+collide with the existing ones (the primary keys would then reject the batch).
+"""
+
+import hashlib
+import os
+
+from psycopg2.extras import execute_values
+
+from shared.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+INVITE_CODE_KEY = os.environ["INVITE_CODE_KEY"]
+if not INVITE_CODE_KEY:
+    raise RuntimeError("INVITE_CODE_KEY must not be empty")
+MAX_BULK_INVITE_CODES = 10_000
+INVITE_CODE_BATCH_SIZE = 1000
+
+CODE_PREFIXES = {"general": "GEN", "user": "USR", "sandwatch": "SW"}
+CODE_LENGTH = 8
+CODE_BITS = 5 * CODE_LENGTH
+HALF_BITS = CODE_BITS // 2
+FEISTEL_ROUNDS = 4
+# Crockford's base32: digits and letters without I, L, O and U
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def _round_keys(code_type):
+    digest = hashlib.sha256(f"{INVITE_CODE_KEY}:{code_type}".encode()).digest()
+    return [
+        int.from_bytes(digest[8 * i : 8 * (i + 1)], "big")
+        for i in range(FEISTEL_ROUNDS)
+    ]
+
+
+def _mix(half, key):
+    """Round function: a splitmix64 style hash of ``half`` and ``key``,
+    truncated to ``HALF_BITS``. uint64 arithmetic wraps around."""
+    x = (half ^ np.uint64(key)) * np.uint64(0x9E3779B97F4A7C15)
+    x ^= x >> np.uint64(31)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(29)
+    return x & np.uint64((1 << HALF_BITS) - 1)
+
+
+def permute(values, code_type):
+    """Apply the code type's permutation of ``[0, 2**CODE_BITS)`` to an array
+    of numbers."""
+    mask = np.uint64((1 << HALF_BITS) - 1)
+    left = (values >> np.uint64(HALF_BITS)) & mask
+    right = values & mask
+    for key in _round_keys(code_type):
+        left, right = right, left ^ _mix(right, key)
+    return (left << np.uint64(HALF_BITS)) | right
+
+
+def unpermute(values, code_type):
+    """Inverse of ``permute``: the rounds undone in reverse order."""
+    mask = np.uint64((1 << HALF_BITS) - 1)
+    left = (values >> np.uint64(HALF_BITS)) & mask
+    right = values & mask
+    for key in reversed(_round_keys(code_type)):
+        left, right = right ^ _mix(left, key), left
+    return (left << np.uint64(HALF_BITS)) | right
+
+
+def encode(values, prefix):
+    """``prefix-XXXXXXXX`` for every number, in base32."""
+    shifts = np.arange(CODE_LENGTH - 1, -1, -1, dtype=np.uint64) * np.uint64(5)
+    digits = (values[:, None] >> shifts) & np.uint64(31)
+    alphabet = np.frombuffer(ALPHABET.encode(), dtype=np.uint8)
+    encoded = np.ascontiguousarray(alphabet[digits]).view(f"S{CODE_LENGTH}")
+    return [f"{prefix}-{code.decode()}" for code in encoded.ravel()]
+
+
+def decode(codes):
+    """Inverse of ``encode``: the numbers of ``prefix-XXXXXXXX`` codes."""
+    lookup = np.zeros(256, dtype=np.uint64)
+    lookup[np.frombuffer(ALPHABET.encode(), dtype=np.uint8)] = np.arange(
+        len(ALPHABET), dtype=np.uint64
+    )
+    digits = np.frombuffer(
+        "".join(code.rpartition("-")[2] for code in codes).encode(), dtype=np.uint8
+    ).reshape(-1, CODE_LENGTH)
+    shifts = np.arange(CODE_LENGTH - 1, -1, -1, dtype=np.uint64) * np.uint64(5)
+    return np.bitwise_or.reduce(lookup[digits] << shifts, axis=1)
+
+
+def make_codes(code_type, start, count):
+    """Codes for the sequence numbers ``start`` to ``start + count - 1``."""
+    if start + count > 1 << CODE_BITS:
+        raise ValueError(f"The {code_type} invite code space is exhausted")
+    values = np.arange(start, start + count, dtype=np.uint64)
+    return encode(permute(values, code_type), CODE_PREFIXES[code_type])
+
+
+def claim_range(cur, code_type, count):
+    """Reserve ``count`` numbers of the type's sequence, returning the first."""
+    cur.execute(
+        """
+        INSERT INTO invite_code_sequences (code_type, next_value)
+        VALUES (%s, %s)
+        ON CONFLICT (code_type) DO UPDATE
+            SET next_value = invite_code_sequences.next_value + excluded.next_value
+        RETURNING next_value
+        """,
+        (code_type, count),
+    )
+    return cur.fetchone()[0] - count
+
+
+def insert_codes(cur, code_type, codes, user_id=None, seat_type_id=None):
+    if code_type == "general":
+        query = "INSERT INTO invite_codes (code, seat_type_id) VALUES %s"
+        rows = [(code, seat_type_id) for code in codes]
+    elif code_type == "user":
+        query = "INSERT INTO user_invite_codes (code, user_id) VALUES %s"
+        rows = [(code, user_id) for code in codes]
+    else:
+        query = "INSERT INTO sandwatch_invite_codes (code, used) VALUES %s"
+        rows = [(code, False) for code in codes]
+    execute_values(cur, query, rows, page_size=INVITE_CODE_BATCH_SIZE)
+
+
+def mint_codes(cur, code_type, count, user_id=None, seat_type_id=None):
+    """Create and store ``count`` new codes of ``code_type`` ("general",
+    "user" or "sandwatch"; user codes belong to ``user_id``, general codes
+    grant ``seat_type_id``). Must run in a transaction, which the caller
+    commits."""
+    codes = make_codes(code_type, claim_range(cur, code_type, count), count)
+    insert_codes(cur, code_type, codes, user_id, seat_type_id)
+    return codes
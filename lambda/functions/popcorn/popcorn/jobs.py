@@ -0,0 +1,221 @@
+"""Queue of social callback jobs.
+
+The social callbacks only record what the provider sent back and redirect;
+exchanging the code, verifying the account and awarding the task happen later
+in worker.py. A job is a small JSON object::
+
+    {"social": "discord", "params": {"code": "...", "state": "..."},
+     "key": "<idempotency key>", "attempts": 0}
+
+``params`` keeps only the fields a verifier needs (``CALLBACK_PARAMS``), and
+``key`` is derived from them, so a callback delivered twice becomes the same
+job and is only awarded once.
+
+Jobs go to the SQS queue at ``SOCIAL_JOB_QUEUE_URL`` (see infra/lambdas.tf).
+For local runs a SQLite file can stand in for SQS, opted into by setting
+``SOCIAL_JOB_QUEUE_PATH``. Inside Lambda the SQLite queue is never used: a
+file in the container's /tmp is not drained by any worker, so ``get_queue``
+raises instead when the URL is missing.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from collections import namedtuple
+from threading import Lock
+
+SOCIAL_JOB_QUEUE_URL = os.environ.get("SOCIAL_JOB_QUEUE_URL")
+SOCIAL_JOB_QUEUE_PATH = os.environ.get("SOCIAL_JOB_QUEUE_PATH")
+# Set by the Lambda runtime
+IN_LAMBDA = "AWS_LAMBDA_FUNCTION_NAME" in os.environ
+
+# Query string fields each provider's verifier needs, everything else is dropped
+CALLBACK_PARAMS = {
+    "discord": ("code", "state"),
+    "instagram": ("code", "state"),
+    "twitter": ("code", "state"),
+    "telegram": (
+        "id",
+        "first_name",
+        "last_name",
+        "username",
+        "photo_url",
+        "auth_date",
+        "hash",
+    ),
+}
+
+Job = namedtuple("Job", ["social", "params", "key", "attempts"])
+# A received job and the handle needed to acknowledge or retry it
+Delivery = namedtuple("Delivery", ["receipt", "job"])
+
+
+def make_job(social, query_params):
+    fields = CALLBACK_PARAMS[social]
+    params = {
+        name: query_params[name]
+        for name in fields
+        if query_params and query_params.get(name) is not None
+    }
+    key = hashlib.sha256(
+        json.dumps([social, params], sort_keys=True).encode()
+    ).hexdigest()[:32]
+    return Job(social, params, key, 0)
+
+
+def encode_job(job):
+    return json.dumps(job._asdict(), separators=(",", ":"))
+
+
+def decode_job(body):
+    return Job(**json.loads(body))
+
+
+class SQLiteQueue:
+    """At-least-once queue in a SQLite file with SQS-like semantics: received
+    jobs are hidden for ``visibility_timeout`` seconds and reappear unless they
+    are acknowledged."""
+
+    def __init__(self, path, visibility_timeout=60):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._lock = Lock()
+        self._conn = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                receipt TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                available_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_available_at ON jobs (available_at);
+            CREATE TABLE IF NOT EXISTS dead_jobs (
+                receipt TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                error TEXT,
+                failed_at REAL NOT NULL
+            );
+            """
+        )
+
+    def enqueue(self, job, delay=0):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (receipt, body, available_at) VALUES (?, ?, ?)",
+                (uuid.uuid4().hex, encode_job(job), time.time() + delay),
+            )
+
+    def receive(self, max_jobs):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    """
+                    SELECT receipt, body FROM jobs WHERE available_at <= ?
+                    ORDER BY available_at LIMIT ?
+                    """,
+                    (now, max_jobs),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET available_at = ? WHERE receipt = ?",
+                    [(now + self.visibility_timeout, receipt) for receipt, _ in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [Delivery(receipt, decode_job(body)) for receipt, body in rows]
+
+    def ack(self, receipts):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM jobs WHERE receipt = ?", [(r,) for r in receipts]
+            )
+
+    def retry(self, delivery, delay):
+        """Make the job visible again after ``delay`` seconds, one attempt
+        further on."""
+        job = delivery.job._replace(attempts=delivery.job.attempts + 1)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET body = ?, available_at = ? WHERE receipt = ?",
+                (encode_job(job), time.time() + delay, delivery.receipt),
+            )
+
+    def dead_letter(self, delivery, error):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "DELETE FROM jobs WHERE receipt = ?", (delivery.receipt,)
+            )
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO dead_jobs (receipt, body, error, failed_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (delivery.receipt, encode_job(delivery.job), error, time.time()),
+            )
+            self._conn.execute("COMMIT")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM jobs").fetchone()[0]
+
+    def dead_jobs(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT body, error FROM dead_jobs ORDER BY failed_at"
+            ).fetchall()
+        return [(decode_job(body), error) for body, error in rows]
+
+
+class SQSQueue:
+    """Producer side of the SQS queue. The worker Lambda consumes it through
+    an event source mapping, see ``worker.sqs_handler``."""
+
+    def __init__(self, queue_url):
+        self.queue_url = queue_url
+        self._client = None
+
+    def enqueue(self, job, delay=0):
+        if self._client is None:
+            # Provided by the Lambda runtime, only needed once SQS is configured
+            import boto3
+
+            self._client = boto3.client("sqs")
+        self._client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=encode_job(job),
+            DelaySeconds=int(delay),
+        )
+
+
+_queue = None
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        if SOCIAL_JOB_QUEUE_URL:
+            _queue = SQSQueue(SOCIAL_JOB_QUEUE_URL)
+        elif SOCIAL_JOB_QUEUE_PATH and not IN_LAMBDA:
+            _queue = SQLiteQueue(SOCIAL_JOB_QUEUE_PATH)
+        else:
+            raise RuntimeError(
+                "SOCIAL_JOB_QUEUE_URL is not configured"
+                + ("" if IN_LAMBDA else ", set SOCIAL_JOB_QUEUE_PATH for a local queue")
+            )
+    return _queue
+
+
+def enqueue_social_callback(social, query_params):
+    """Queue the callback for the worker and return its job."""
+    job = make_job(social, query_params)
+    get_queue().enqueue(job)
+    return job
@@ -0,0 +1,123 @@
+"""Popcorn leaderboard backed by the ledger's ranking index.
+
+Every user's balance grows linearly, ``popcorn_intercept + current_multiplier
+* t``, so lines with different multipliers cross over time and no single
+stored order stays valid. Users with the same multiplier keep their relative
+order forever though, so the top N overall is always among the top N of each
+multiplier group. Both reads below walk the
+``(current_multiplier, popcorn_intercept DESC)`` index once per group and never
+rescan the users or their task histories. See
+migrations/0002_popcorn_leaderboard.sql.
+
+Rankings are computed from each user's latest snapshot, so ``at`` should be the
+current time rather than a historical timestamp.
+
+The ``_async`` variants run the same queries over asyncpg (shared/aiodb.py).
+"""
+
+import asyncio
+
+from shared.aiodb import fetch, fetchval
+
+from .ledger import popcorn_at, popcorn_at_async
+
+MAX_LEADERBOARD_SIZE = 100
+
+
+def top_users(cur, at, limit):
+    """Return ``(user_id, total_popcorn, current_multiplier)`` rows for the
+    ``limit`` users with the most popcorn at ``at``."""
+    cur.execute(
+        """
+        SELECT lb.user_id,
+               lb.popcorn_intercept + lb.current_multiplier * %(at)s AS total_popcorn,
+               lb.current_multiplier
+        FROM popcorn_multiplier_groups g
+        CROSS JOIN LATERAL (
+            SELECT l.user_id, l.popcorn_intercept, l.current_multiplier
+            FROM user_popcorn_ledger l
+            WHERE l.current_multiplier = g.current_multiplier
+            ORDER BY l.popcorn_intercept DESC
+            LIMIT %(limit)s
+        ) AS lb
+        ORDER BY total_popcorn DESC, lb.user_id
+        LIMIT %(limit)s
+        """,
+        {"at": at.timestamp(), "limit": limit},
+    )
+    return cur.fetchall()
+
+
+def user_rank(cur, user_id, at):
+    """Return ``(rank, LedgerState)`` for the user at ``at``, or ``None`` if
+    the user does not exist. Rank 1 is the most popcorn; ties share a rank."""
+    popcorn = popcorn_at(cur, user_id, at)
+    if popcorn is None:
+        return None
+
+    # Count users strictly ahead, one index range per multiplier group
+    cur.execute(
+        """
+        SELECT count(*)
+        FROM popcorn_multiplier_groups g
+        JOIN user_popcorn_ledger l
+          ON l.current_multiplier = g.current_multiplier
+         AND l.popcorn_intercept > %(score)s - g.current_multiplier * %(at)s
+        WHERE l.user_id <> %(user_id)s
+        """,
+        {"score": popcorn.total_popcorn, "at": at.timestamp(), "user_id": user_id},
+    )
+    return cur.fetchone()[0] + 1, popcorn
+
+
+async def top_users_async(at, limit):
+    return await fetch(
+        """
+        SELECT lb.user_id,
+               lb.popcorn_intercept + lb.current_multiplier * $1 AS total_popcorn,
+               lb.current_multiplier
+        FROM popcorn_multiplier_groups g
+        CROSS JOIN LATERAL (
+            SELECT l.user_id, l.popcorn_intercept, l.current_multiplier
+            FROM user_popcorn_ledger l
+            WHERE l.current_multiplier = g.current_multiplier
+            ORDER BY l.popcorn_intercept DESC
+            LIMIT $2
+        ) AS lb
+        ORDER BY total_popcorn DESC, lb.user_id
+        LIMIT $2
+        """,
+        at.timestamp(),
+        limit,
+    )
+
+
+async def leaderboard_async(at, limit, user_id=None):
+    """Return ``(top_users, user_rank)`` results, fetching the two at once
+    since neither depends on the other."""
+    if user_id is None:
+        return await top_users_async(at, limit), None
+    return await asyncio.gather(
+        top_users_async(at, limit), user_rank_async(user_id, at)
+    )
+
+
+async def user_rank_async(user_id, at):
+    popcorn = await popcorn_at_async(user_id, at)
+    if popcorn is None:
+        return None
+
+    ahead = await fetchval(
+        """
+        SELECT count(*)
+        FROM popcorn_multiplier_groups g
+        JOIN user_popcorn_ledger l
+          ON l.current_multiplier = g.current_multiplier
+         AND l.popcorn_intercept > $1 - g.current_multiplier * $2
+        WHERE l.user_id <> $3
+        """,
+        popcorn.total_popcorn,
+        at.timestamp(),
+        user_id,
+    )
+    return ahead + 1, popcorn
@@ -0,0 +1,445 @@
+"""Checkpointed popcorn ledger.
+
+Popcorn accrues linearly between task assignments, so a user's balance at any
+time can be extrapolated from the last event before it:
+
+    total_popcorn + (at - last_event_at) * current_multiplier
+
+``user_popcorn_ledger`` keeps that snapshot for the latest event of every user
+and is updated in the same transaction that records a task.
+``user_popcorn_checkpoints`` keeps a snapshot every ``CHECKPOINT_INTERVAL``
+events so that historical reads only replay the tasks after the nearest earlier
+checkpoint instead of the whole history. See migrations/0001_popcorn_ledger.sql.
+
+The ledger also stores ``popcorn_intercept``, the balance rewritten as
+``popcorn_intercept + current_multiplier * epoch_seconds``, which is what the
+leaderboard ranks on (see leaderboard.py).
+
+``popcorn_at_async`` is the same read over asyncpg for functions running with
+``DB_ASYNC`` (see shared/aiodb.py).
+"""
+
+import asyncio
+import os
+from collections import namedtuple
+from datetime import timezone
+
+from psycopg2.extras import execute_values
+
+from shared.aiodb import fetch, fetchrow
+from shared.queries import execute, register
+
+from .tasks import task_multipliers
+
+CHECKPOINT_INTERVAL = int(os.environ.get("POPCORN_CHECKPOINT_INTERVAL", "16"))
+
+# Multipliers are sums of task multipliers such as 1.1, round away float noise
+# so that users with the same tasks share a leaderboard group
+MULTIPLIER_PRECISION = 6
+
+LedgerState = namedtuple(
+    "LedgerState", ["total_popcorn", "current_multiplier", "last_event_at"]
+)
+UserMultiplier = namedtuple(
+    "UserMultiplier", ["current_multiplier", "task_count", "last_task_at"]
+)
+
+
+def ensure_utc(dt):
+    """Ensure a datetime is UTC and offset-aware."""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def popcorn_intercept(state):
+    return (
+        state.total_popcorn - state.last_event_at.timestamp() * state.current_multiplier
+    )
+
+
+def initial_state(created_at):
+    return LedgerState(0.0, 1.0, ensure_utc(created_at))
+
+
+def advance(state, at):
+    """Extrapolate a snapshot to ``at`` without any further events."""
+    elapsed = (at - state.last_event_at).total_seconds()
+    return LedgerState(
+        state.total_popcorn + elapsed * state.current_multiplier,
+        state.current_multiplier,
+        at,
+    )
+
+
+def apply_event(state, performed_at, multiplier):
+    """Accrue popcorn up to a task assignment, then apply its multiplier."""
+    state = advance(state, ensure_utc(performed_at))
+    return state._replace(
+        current_multiplier=round(
+            state.current_multiplier + float(multiplier) - 1, MULTIPLIER_PRECISION
+        )
+    )
+
+
+def replay(state, events, until):
+    """Fold ``(performed_at, multiplier)`` events (oldest first) into ``state``
+    and extrapolate the result to ``until``. Events after ``until`` are ignored.
+    """
+    for performed_at, multiplier in events:
+        if ensure_utc(performed_at) > until:
+            break
+        state = apply_event(state, performed_at, multiplier)
+    return advance(state, until)
+
+
+def _with_multipliers(cur, rows):
+    """Turn ``(performed_at, multiplier_task_id)`` rows into events using the
+    cached task catalog instead of joining multiplier_tasks."""
+    multipliers = task_multipliers(cur, {task_id for _, task_id in rows})
+    return [(performed_at, multipliers[task_id]) for performed_at, task_id in rows]
+
+
+_EVENTS = register(
+    "popcorn_events",
+    """
+    SELECT utm.performed_at, utm.multiplier_task_id
+    FROM user_to_multiplier utm
+    WHERE utm.user_id = %s AND utm.performed_at <= %s
+    ORDER BY utm.performed_at, utm.id
+    """,
+)
+_EVENTS_AFTER = register(
+    "popcorn_events_after",
+    """
+    SELECT utm.performed_at, utm.multiplier_task_id
+    FROM user_to_multiplier utm
+    WHERE utm.user_id = %s AND utm.performed_at <= %s AND utm.performed_at > %s
+    ORDER BY utm.performed_at, utm.id
+    """,
+)
+
+
+def _fetch_events(cur, user_id, after, until):
+    if after is None:
+        execute(cur, _EVENTS, (user_id, until))
+    else:
+        execute(cur, _EVENTS_AFTER, (user_id, until, after))
+    return _with_multipliers(cur, cur.fetchall())
+
+
+def _from_latest(row, at):
+    """Answer a read from the ``(created_date, total_popcorn,
+    current_multiplier, last_event_at)`` ledger row alone, or return ``None``
+    when ``at`` is before the latest event and needs a replay."""
+    created_at, total_popcorn, current_multiplier, last_event_at = row
+    if last_event_at is None:
+        # No tasks recorded yet, popcorn accrues at the base rate since signup
+        return advance(initial_state(created_at), at)
+
+    latest = LedgerState(total_popcorn, current_multiplier, ensure_utc(last_event_at))
+    if at >= latest.last_event_at:
+        return advance(latest, at)
+    return None
+
+
+def _replay_start(created_at, checkpoint):
+    """Return the state to replay from and the time of the last event already
+    folded into it (``None`` when replaying from signup)."""
+    if checkpoint is None:
+        return initial_state(created_at), None
+    start = LedgerState(checkpoint[0], checkpoint[1], ensure_utc(checkpoint[2]))
+    return start, start.last_event_at
+
+
+_LATEST = register(
+    "popcorn_latest",
+    """
+    SELECT u.created_date, l.total_popcorn, l.current_multiplier, l.last_event_at
+    FROM users u
+    LEFT JOIN user_popcorn_ledger l ON l.user_id = u.id
+    WHERE u.id = %s
+    """,
+)
+_CHECKPOINT = register(
+    "popcorn_checkpoint",
+    """
+    SELECT total_popcorn, current_multiplier, last_event_at
+    FROM user_popcorn_checkpoints
+    WHERE user_id = %s AND last_event_at <= %s
+    ORDER BY last_event_at DESC
+    LIMIT 1
+    """,
+)
+
+
+def popcorn_at(cur, user_id, at):
+    """Return the user's ``LedgerState`` at ``at``, or ``None`` if the user
+    does not exist.
+
+    Reads at or after the latest event cost one row. Older timestamps replay
+    from the nearest checkpoint at or before ``at``.
+    """
+    execute(cur, _LATEST, (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    state = _from_latest(row, at)
+    if state is not None:
+        return state
+
+    execute(cur, _CHECKPOINT, (user_id, at))
+    start, after = _replay_start(row[0], cur.fetchone())
+    return replay(start, _fetch_events(cur, user_id, after, at), at)
+
+
+_MULTIPLIER = register(
+    "popcorn_multiplier",
+    """
+    SELECT l.current_multiplier, l.event_count, l.last_event_at
+    FROM users u
+    LEFT JOIN user_popcorn_ledger l ON l.user_id = u.id
+    WHERE u.id = %s
+    """,
+)
+
+
+def user_multiplier(cur, user_id):
+    """Return the user's ``UserMultiplier`` from the ledger row alone, or
+    ``None`` if the user does not exist."""
+    execute(cur, _MULTIPLIER, (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    current_multiplier, event_count, last_event_at = row
+    if not event_count:
+        # Users without tasks have a base rate ledger row or, before
+        # migrations/0002_popcorn_leaderboard.sql, none at all
+        return UserMultiplier(1.0, 0, None)
+    return UserMultiplier(current_multiplier, event_count, ensure_utc(last_event_at))
+
+
+def replay_window(cur, user_id, since, until):
+    """Return the state at or before ``since`` to replay from and the events
+    after it up to ``until`` (oldest first), or ``None`` if the user does not
+    exist. Windows after the latest event need no events at all."""
+    execute(cur, _LATEST, (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    state = _from_latest(row, since)
+    if state is not None:
+        return state, []
+
+    execute(cur, _CHECKPOINT, (user_id, since))
+    start, after = _replay_start(row[0], cur.fetchone())
+    return start, _fetch_events(cur, user_id, after, until)
+
+
+async def _fetch_latest_async(user_id):
+    return await fetchrow(
+        """
+        SELECT u.created_date, l.total_popcorn, l.current_multiplier, l.last_event_at
+        FROM users u
+        LEFT JOIN user_popcorn_ledger l ON l.user_id = u.id
+        WHERE u.id = $1
+        """,
+        user_id,
+    )
+
+
+async def _fetch_checkpoint_async(user_id, at):
+    return await fetchrow(
+        """
+        SELECT total_popcorn, current_multiplier, last_event_at
+        FROM user_popcorn_checkpoints
+        WHERE user_id = $1 AND last_event_at <= $2
+        ORDER BY last_event_at DESC
+        LIMIT 1
+        """,
+        user_id,
+        at,
+    )
+
+
+async def _fetch_events_async(user_id, at):
+    """Events after the checkpoint ``_fetch_checkpoint_async`` picks, found by
+    the query itself so that both can run at the same time. Multipliers are
+    joined in since the task catalog cache reads through psycopg2."""
+    return await fetch(
+        """
+        WITH checkpoint AS (
+            SELECT max(last_event_at) AS last_event_at
+            FROM user_popcorn_checkpoints
+            WHERE user_id = $1 AND last_event_at <= $2
+        )
+        SELECT utm.performed_at, mt.multiplier
+        FROM user_to_multiplier utm
+        JOIN multiplier_tasks mt ON mt.id = utm.multiplier_task_id
+        CROSS JOIN checkpoint
+        WHERE utm.user_id = $1 AND utm.performed_at <= $2::TIMESTAMPTZ
+          AND (checkpoint.last_event_at IS NULL
+               OR utm.performed_at > checkpoint.last_event_at)
+        ORDER BY utm.performed_at, utm.id
+        """,
+        user_id,
+        at,
+    )
+
+
+async def popcorn_at_async(user_id, at, historical=False):
+    """``popcorn_at`` over asyncpg.
+
+    The ledger row, the nearest checkpoint and the events after it don't
+    depend on each other. With ``historical`` (the caller asked for a past
+    timestamp, so a replay is likely) all three are fetched at once; otherwise
+    the replay queries only run, together, if the ledger row isn't enough.
+    """
+    if historical:
+        row, checkpoint, events = await asyncio.gather(
+            _fetch_latest_async(user_id),
+            _fetch_checkpoint_async(user_id, at),
+            _fetch_events_async(user_id, at),
+        )
+    else:
+        row = await _fetch_latest_async(user_id)
+    if row is None:
+        return None
+    state = _from_latest(row, at)
+    if state is not None:
+        return state
+
+    if not historical:
+        checkpoint, events = await asyncio.gather(
+            _fetch_checkpoint_async(user_id, at), _fetch_events_async(user_id, at)
+        )
+    start, _ = _replay_start(row[0], checkpoint)
+    return replay(start, events, at)
+
+
+_LEDGER_FOR_UPDATE = register(
+    "popcorn_ledger_for_update",
+    """
+    SELECT u.created_date, l.total_popcorn, l.current_multiplier,
+           l.last_event_at, l.event_count
+    FROM users u
+    LEFT JOIN user_popcorn_ledger l ON l.user_id = u.id
+    WHERE u.id = %s
+    FOR UPDATE OF u
+    """,
+)
+
+
+def record_task_events(cur, user_id, events):
+    """Fold newly inserted ``(performed_at, multiplier)`` events into the
+    user's ledger. Must run in the transaction that inserted the tasks.
+
+    Events at or before the user's latest recorded event (a backfill, or a
+    second task at the same time in another call) rebuild the ledger from the
+    full history instead: a checkpoint at that time may already have been
+    written without the new event, and replays only read the events after a
+    checkpoint's time. The users row is locked so concurrent awards for the
+    same user are serialized.
+    """
+    execute(cur, _LEDGER_FOR_UPDATE, (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"User {user_id} not found")
+
+    created_at, total_popcorn, current_multiplier, last_event_at, event_count = row
+    if last_event_at is None:
+        state, event_count = initial_state(created_at), 0
+    else:
+        state = LedgerState(
+            total_popcorn, current_multiplier, ensure_utc(last_event_at)
+        )
+        if any(
+            ensure_utc(performed_at) <= state.last_event_at
+            for performed_at, _ in events
+        ):
+            return rebuild_user_ledger(cur, user_id)
+
+    state, event_count, checkpoints = fold_events(
+        user_id, state, event_count, sorted(events, key=lambda e: e[0])
+    )
+    _write_ledger(cur, user_id, state, event_count, checkpoints)
+    return state
+
+
+def fold_events(user_id, state, event_count, events):
+    """Apply ``(performed_at, multiplier)`` events (oldest first) to ``state``.
+    Returns the new state and event count and the ``(user_id, *state)``
+    checkpoint rows to write."""
+    checkpoints = []
+    for performed_at, multiplier in events:
+        state = apply_event(state, performed_at, multiplier)
+        event_count += 1
+        if checkpoints and checkpoints[-1][-1] == state.last_event_at:
+            # A checkpoint must include every event sharing its timestamp
+            checkpoints[-1] = (user_id, *state)
+        elif event_count % CHECKPOINT_INTERVAL == 0:
+            checkpoints.append((user_id, *state))
+    return state, event_count, checkpoints
+
+
+def _write_ledger(cur, user_id, state, event_count, checkpoints):
+    cur.execute(
+        """
+        INSERT INTO user_popcorn_ledger
+            (user_id, total_popcorn, current_multiplier, last_event_at,
+             event_count, popcorn_intercept)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_popcorn = excluded.total_popcorn,
+            current_multiplier = excluded.current_multiplier,
+            last_event_at = excluded.last_event_at,
+            event_count = excluded.event_count,
+            popcorn_intercept = excluded.popcorn_intercept
+        """,
+        (user_id, *state, event_count, popcorn_intercept(state)),
+    )
+    cur.execute(
+        """
+        INSERT INTO popcorn_multiplier_groups (current_multiplier) VALUES (%s)
+        ON CONFLICT (current_multiplier) DO NOTHING
+        """,
+        (state.current_multiplier,),
+    )
+    if checkpoints:
+        execute_values(
+            cur,
+            """
+            INSERT INTO user_popcorn_checkpoints
+                (user_id, total_popcorn, current_multiplier, last_event_at)
+            VALUES %s
+            ON CONFLICT (user_id, last_event_at) DO UPDATE SET
+                total_popcorn = excluded.total_popcorn,
+                current_multiplier = excluded.current_multiplier
+            """,
+            checkpoints,
+        )
+
+
+def rebuild_user_ledger(cur, user_id):
+    """Recompute a user's ledger and checkpoints from the full task history."""
+    cur.execute("SELECT created_date FROM users WHERE id = %s FOR UPDATE", (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"User {user_id} not found")
+
+    cur.execute("DELETE FROM user_popcorn_checkpoints WHERE user_id = %s", (user_id,))
+    cur.execute(
+        """
+        SELECT utm.performed_at, utm.multiplier_task_id
+        FROM user_to_multiplier utm
+        WHERE utm.user_id = %s
+        ORDER BY utm.performed_at, utm.id
+        """,
+        (user_id,),
+    )
+    events = _with_multipliers(cur, cur.fetchall())
+    state, event_count, checkpoints = fold_events(
+        user_id, initial_state(row[0]), 0, events
+    )
+    _write_ledger(cur, user_id, state, event_count, checkpoints)
+    return state
@@ -0,0 +1,134 @@
+"""Check the popcorn ledger against the task history and repair it.
+
+The ledger row of every user (``user_popcorn_ledger``) is the materialized
+aggregate of their tasks: the current multiplier, the task count
+(``event_count``) and the last task time (``last_event_at``). Every award
+updates it in the transaction that inserts the task, so it can only drift
+through writes that bypass ledger.py, such as manual fixes or the old
+``update_user_to_multiplier``.
+
+Users are streamed in id order, ``batch_size`` at a time. For each batch the
+ledger rows are compared with the count, latest time and multiplier sum of the
+user's ``user_to_multiplier`` rows, aggregated by the database, and every user
+that differs or has no ledger row is rebuilt from the full history with
+``rebuild_user_ledger``, one user per transaction. Run it after a migration
+or manual data change, or periodically::
+
+    cd lambda/functions && PYTHONPATH=.:popcorn python -m popcorn.reconcile [--dry-run]
+"""
+
+import argparse
+from collections import namedtuple
+
+from aws_lambda_powertools import Logger
+
+from shared.db import get_db_connection
+
+from .ledger import MULTIPLIER_PRECISION, ensure_utc, rebuild_user_ledger
+from .tasks import task_multipliers
+
+RECONCILE_BATCH_SIZE = 1000
+# Ledger multipliers are rounded after every task, the sums here only once
+MULTIPLIER_TOLERANCE = 10**-MULTIPLIER_PRECISION
+
+logger = Logger(child=True)
+
+ReconcileResult = namedtuple("ReconcileResult", ["checked", "drifted", "rebuilt"])
+
+
+def _fetch_batch(cur, after_user_id, batch_size):
+    """``(user_id, created_date, ledger multiplier, event_count,
+    last_event_at)`` of the next users by id, with NULL ledger columns for
+    users without a ledger row."""
+    cur.execute(
+        """
+        SELECT u.id, u.created_date, l.current_multiplier, l.event_count,
+               l.last_event_at
+        FROM users u
+        LEFT JOIN user_popcorn_ledger l ON l.user_id = u.id
+        WHERE u.id > %s
+        ORDER BY u.id
+        LIMIT %s
+        """,
+        (after_user_id, batch_size),
+    )
+    return cur.fetchall()
+
+
+def _fetch_task_aggregates(cur, first_user_id, last_user_id):
+    """``{user_id: (task count, last task time, multiplier)}`` for the users
+    with tasks in the id range."""
+    cur.execute(
+        """
+        SELECT user_id, multiplier_task_id, count(*), max(performed_at)
+        FROM user_to_multiplier
+        WHERE user_id BETWEEN %s AND %s
+        GROUP BY user_id, multiplier_task_id
+        """,
+        (first_user_id, last_user_id),
+    )
+    rows = cur.fetchall()
+    multipliers = task_multipliers(cur, {row[1] for row in rows})
+    aggregates = {}
+    for user_id, task_id, count, last_task_at in rows:
+        task_count, latest, multiplier = aggregates.get(user_id, (0, None, 1.0))
+        aggregates[user_id] = (
+            task_count + count,
+            last_task_at if latest is None else max(latest, last_task_at),
+            multiplier + count * (float(multipliers[task_id]) - 1),
+        )
+    return aggregates
+
+
+def _drifted(row, aggregate):
+    """Whether a ledger row disagrees with the user's task aggregate."""
+    _, created_date, current_multiplier, event_count, last_event_at = row
+    if event_count is None:
+        return True
+    task_count, last_task_at, multiplier = aggregate or (0, created_date, 1.0)
+    return (
+        event_count != task_count
+        or ensure_utc(last_event_at) != ensure_utc(last_task_at)
+        or abs(current_multiplier - multiplier) > MULTIPLIER_TOLERANCE
+    )
+
+
+def reconcile_ledgers(batch_size=RECONCILE_BATCH_SIZE, dry_run=False):
+    """Compare every user's ledger row with their tasks and rebuild the ones
+    that drifted (only report them with ``dry_run``)."""
+    after_user_id, checked, drifted, rebuilt = 0, 0, 0, 0
+    while True:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                rows = _fetch_batch(cur, after_user_id, batch_size)
+                if not rows:
+                    break
+                aggregates = _fetch_task_aggregates(cur, rows[0][0], rows[-1][0])
+        stale = [row[0] for row in rows if _drifted(row, aggregates.get(row[0]))]
+        checked += len(rows)
+        drifted += len(stale)
+        if stale:
+            logger.warning(
+                "Popcorn ledger drifted from the task history",
+                extra={"user_ids": stale[:20], "count": len(stale)},
+            )
+        if not dry_run:
+            for user_id in stale:
+                with get_db_connection() as conn:
+                    with conn.cursor() as cur:
+                        rebuild_user_ledger(cur, user_id)
+                rebuilt += 1
+        after_user_id = rows[-1][0]
+    return ReconcileResult(checked, drifted, rebuilt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=RECONCILE_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    result = reconcile_ledgers(args.batch_size, args.dry_run)
+    print(
+        f"Checked {result.checked} users, {result.drifted} drifted,"
+        f" {result.rebuilt} rebuilt"
+    )
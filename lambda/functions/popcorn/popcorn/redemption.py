@@ -0,0 +1,287 @@
+"""Invite code redemption for ``POST /popcorn/redeem_invite_code``.
+
+A code is redeemed by one statement chosen by its prefix, which only reads
+the code's own table: SW- codes are single use and claimed with
+``UPDATE ... WHERE used = FALSE RETURNING``, USR- and GEN- codes can be
+applied by many users but not twice by the same one, nor a USR- code by its
+owner. Every redemption inserts an ``invite_code_redemptions`` row
+(migrations/0008_invite_code_redemptions.sql), whose primary key makes a
+retried or concurrent request a no-op, and the invite code task is awarded in
+the same transaction. Two requests for the same SW- code serialize on its
+row, the second finds it used. A code that isn't redeemed comes back with the
+reason, one of ``REFUSALS``.
+
+GEN- codes are shared, e.g. one code for a whole campaign, and their uses
+are counted in ``invite_code_usage`` (migrations/0009_invite_code_usage.sql).
+A single counter row per code would make every concurrent redemption of the
+code queue on it, so each code has up to ``INVITE_CODE_USAGE_SHARDS`` rows and
+a redemption increments a random one; ``code_usage`` sums them. Redemptions
+that still collide on a row are retried with backoff (``redeem``), see
+benchmarks/invite_code_contention.py for the retry rate and throughput with
+one shard and with several.
+
+Codes that don't exist and used SW- codes are remembered per container with
+their refusal for ``INVALID_CODE_TTL`` seconds, so repeated guesses are
+answered without a round trip. The TTL bounds how long a code minted in
+another container since is refused; codes minted in this one are dropped from
+the cache right away.
+"""
+
+import os
+import random
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from threading import Lock
+
+import psycopg2
+from psycopg2 import errorcodes
+
+from shared.db import get_db_connection
+from shared.queries import execute, register
+
+from .ingest import award_tasks
+from .invite_codes import CODE_PREFIXES
+from .tasks import task_multipliers
+
+INVALID_CODE_CACHE_SIZE = int(os.environ.get("INVALID_CODE_CACHE_SIZE", "10000"))
+INVALID_CODE_TTL = float(os.environ.get("INVALID_CODE_TTL", "300"))
+INVITE_CODE_USAGE_SHARDS = int(os.environ.get("INVITE_CODE_USAGE_SHARDS", "16"))
+REDEEM_ATTEMPTS = 5
+# Seconds, doubled after every attempt and jittered
+REDEEM_RETRY_DELAY = 0.01
+
+NOT_FOUND = "not_found"
+ALREADY_USED = "already_used"
+ALREADY_APPLIED = "already_applied"
+OWN_CODE = "own_code"
+REFUSALS = (NOT_FOUND, ALREADY_USED, ALREADY_APPLIED, OWN_CODE)
+# Refusals that hold for every user, so they can be cached per code
+CACHED_REFUSALS = (NOT_FOUND, ALREADY_USED)
+
+CODE_TYPES = {prefix: code_type for code_type, prefix in CODE_PREFIXES.items()}
+
+# code_type is the type named by the prefix, None for a malformed code.
+# refusal is None when the code was redeemed.
+Redemption = namedtuple("Redemption", ["code_type", "refusal"])
+
+
+class InvalidCodeCache:
+    """LRU of codes known to be invalid and their refusals, holding at most
+    ``maxsize`` codes for ``ttl`` seconds each."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, code):
+        """The cached refusal of ``code``, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None or entry[0] <= now:
+                self._entries.pop(code, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def add(self, code, refusal):
+        with self._lock:
+            self._entries[code] = (time.monotonic() + self.ttl, refusal)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, codes):
+        with self._lock:
+            for code in codes:
+                self._entries.pop(code, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+invalid_codes = InvalidCodeCache(INVALID_CODE_CACHE_SIZE, INVALID_CODE_TTL)
+
+# The final SELECT of each statement reads the snapshot before the statement,
+# i.e. without the row it inserted or the SW- code it consumed. counted runs
+# although nothing selects from it, like every data-modifying WITH clause.
+_REDEEM_SANDWATCH = register(
+    "redeem_sandwatch_invite_code",
+    """
+    WITH consumed AS (
+        UPDATE sandwatch_invite_codes SET used = TRUE
+        WHERE code = %s AND used = FALSE
+        RETURNING code
+    ),
+    redeemed AS (
+        INSERT INTO invite_code_redemptions (user_id, code, code_type)
+        SELECT %s, code, 'sandwatch' FROM consumed
+        ON CONFLICT (user_id, code) DO NOTHING
+        RETURNING code
+    )
+    SELECT
+        EXISTS (SELECT 1 FROM redeemed),
+        (SELECT used FROM sandwatch_invite_codes WHERE code = %s),
+        EXISTS (
+            SELECT 1 FROM invite_code_redemptions WHERE user_id = %s AND code = %s
+        )
+    """,
+)
+_REDEEM_USER = register(
+    "redeem_user_invite_code",
+    """
+    WITH found AS (
+        SELECT code, user_id FROM user_invite_codes WHERE code = %s
+    ),
+    redeemed AS (
+        INSERT INTO invite_code_redemptions (user_id, code, code_type)
+        SELECT %s, code, 'user' FROM found WHERE user_id <> %s
+        ON CONFLICT (user_id, code) DO NOTHING
+        RETURNING code
+    )
+    SELECT EXISTS (SELECT 1 FROM redeemed), (SELECT user_id FROM found)
+    """,
+)
+_REDEEM_GENERAL = register(
+    "redeem_general_invite_code",
+    """
+    WITH found AS (
+        SELECT code FROM invite_codes WHERE code = %s
+    ),
+    redeemed AS (
+        INSERT INTO invite_code_redemptions (user_id, code, code_type)
+        SELECT %s, code, 'general' FROM found
+        ON CONFLICT (user_id, code) DO NOTHING
+        RETURNING code
+    ),
+    counted AS (
+        INSERT INTO invite_code_usage (code, shard, uses)
+        SELECT code, %s, 1 FROM redeemed
+        ON CONFLICT (code, shard) DO UPDATE
+            SET uses = invite_code_usage.uses + 1
+        RETURNING uses
+    )
+    SELECT EXISTS (SELECT 1 FROM redeemed), EXISTS (SELECT 1 FROM found)
+    """,
+)
+
+
+def code_type_of(code):
+    """The code type named by the prefix of ``code``, or None if it has none."""
+    prefix, separator, rest = code.partition("-")
+    if not (separator and rest):
+        return None
+    return CODE_TYPES.get(prefix)
+
+
+def _claim_sandwatch(cur, code, user_id):
+    execute(cur, _REDEEM_SANDWATCH, (code, user_id, code, user_id, code))
+    redeemed, used, applied = cur.fetchone()
+    if redeemed:
+        return None
+    if used is None:
+        return NOT_FOUND
+    return ALREADY_APPLIED if applied else ALREADY_USED
+
+
+def _claim_user(cur, code, user_id):
+    execute(cur, _REDEEM_USER, (code, user_id, user_id))
+    redeemed, owner_id = cur.fetchone()
+    if redeemed:
+        return None
+    if owner_id is None:
+        return NOT_FOUND
+    return OWN_CODE if owner_id == user_id else ALREADY_APPLIED
+
+
+def _claim_general(cur, code, user_id, shard):
+    execute(cur, _REDEEM_GENERAL, (code, user_id, shard))
+    redeemed, found = cur.fetchone()
+    if redeemed:
+        return None
+    return ALREADY_APPLIED if found else NOT_FOUND
+
+
+def claim_code(cur, code, user_id, shard):
+    """Run the redemption statement of ``code``'s type for ``user_id``,
+    counting a GEN- code's use in ``shard``, without the award. Returns a
+    ``Redemption``."""
+    code_type = code_type_of(code)
+    if code_type == "sandwatch":
+        refusal = _claim_sandwatch(cur, code, user_id)
+    elif code_type == "user":
+        refusal = _claim_user(cur, code, user_id)
+    elif code_type == "general":
+        refusal = _claim_general(cur, code, user_id, shard)
+    else:
+        refusal = NOT_FOUND
+    return Redemption(code_type, refusal)
+
+
+def redeem_code(cur, code, user_id, task_id):
+    """Redeem ``code`` for ``user_id`` and award them ``task_id``, in the
+    caller's transaction. Returns a ``Redemption``."""
+    code_type = code_type_of(code)
+    if code_type is None:
+        return Redemption(None, NOT_FOUND)
+    refusal = invalid_codes.get(code)
+    if refusal is not None:
+        return Redemption(code_type, refusal)
+    redemption = claim_code(
+        cur, code, user_id, random.randrange(INVITE_CODE_USAGE_SHARDS)
+    )
+    if redemption.refusal is not None:
+        if redemption.refusal in CACHED_REFUSALS:
+            invalid_codes.add(code, redemption.refusal)
+        return redemption
+    award_tasks(
+        cur,
+        [(user_id, task_id, datetime.now(timezone.utc))],
+        task_multipliers(cur, [task_id]),
+    )
+    return redemption
+
+
+def is_retryable(error):
+    return getattr(error, "pgcode", None) == errorcodes.SERIALIZATION_FAILURE
+
+
+def redeem(code, user_id, task_id):
+    """``redeem_code`` in a transaction of its own, retried up to
+    ``REDEEM_ATTEMPTS`` times when CockroachDB asks for it (SQLSTATE 40001),
+    as it may when many users redeem the same code at once."""
+    for attempt in range(1, REDEEM_ATTEMPTS + 1):
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    return redeem_code(cur, code, user_id, task_id)
+        except psycopg2.Error as e:
+            if attempt == REDEEM_ATTEMPTS or not is_retryable(e):
+                raise
+            time.sleep(random.uniform(0, REDEEM_RETRY_DELAY * 2**attempt))
+
+
+_USAGE = register(
+    "invite_code_usage",
+    """
+    SELECT code, sum(uses)
+    FROM invite_code_usage
+    WHERE code = ANY(%s)
+    GROUP BY code
+    """,
+)
+
+
+def code_usage(cur, codes):
+    """``{code: uses}`` of the given codes, summed over their shards. Codes
+    that were never redeemed are left out."""
+    execute(cur, _USAGE, (list(codes),))
+    return {code: int(uses) for code, uses in cur.fetchall()}
@@ -0,0 +1,116 @@
+"""In-container cache of the multiplier_tasks catalog.
+
+The catalog is versioned by ``(count(*), max(updated_at))`` (see
+migrations/0003_multiplier_tasks_version.sql). It is re-validated at most every
+``TASK_CATALOG_TTL`` seconds and only reloaded when that version changes.
+
+An id the catalog doesn't know makes it reload once, in case the task was
+created since. Ids still unknown after that are remembered for
+``TASK_CATALOG_TTL`` seconds, so requests with made-up ids can't force a
+reload each.
+"""
+
+import hashlib
+import os
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+from psycopg2.extras import RealDictCursor
+
+from shared.cache import VersionedCache
+from shared.db import with_cursor
+from shared.utils import dumps
+
+TASK_CATALOG_TTL = float(os.environ.get("TASK_CATALOG_TTL", "60"))
+MAX_UNKNOWN_TASK_IDS = 10_000
+
+TaskCatalog = namedtuple("TaskCatalog", ["tasks", "multipliers", "body", "etag"])
+
+
+def _fetch_version(cur):
+    cur.execute("SELECT count(*), max(updated_at) FROM multiplier_tasks")
+    count, updated_at = cur.fetchone()
+    return f"{count}:{updated_at.isoformat() if updated_at else ''}"
+
+
+def _load(cur):
+    version = _fetch_version(cur)
+    with cur.connection.cursor(cursor_factory=RealDictCursor) as dict_cur:
+        dict_cur.execute("SELECT * FROM multiplier_tasks ORDER BY id")
+        rows = dict_cur.fetchall()
+
+    tasks = tuple(rows)
+    body = dumps({"tasks": tasks})
+    return version, TaskCatalog(
+        tasks=tasks,
+        multipliers={task["id"]: float(task["multiplier"]) for task in tasks},
+        body=body,
+        etag='"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"',
+    )
+
+
+_catalog = VersionedCache(
+    with_cursor(_load), with_cursor(_fetch_version), TASK_CATALOG_TTL
+)
+
+
+def get_task_catalog(cur=None):
+    """Return the cached ``TaskCatalog``, refreshing it through ``cur`` when
+    the TTL has run out."""
+    return _catalog.get(cur)
+
+
+# task id -> time.monotonic() until which it is known not to exist
+_unknown_task_ids = OrderedDict()
+_unknown_lock = Lock()
+
+
+def invalidate_task_catalog():
+    """Drop the cached catalog, e.g. after changing multiplier_tasks."""
+    _catalog.invalidate()
+    with _unknown_lock:
+        _unknown_task_ids.clear()
+
+
+def _recently_missing(task_id, now):
+    expires_at = _unknown_task_ids.get(task_id)
+    if expires_at is not None and expires_at <= now:
+        del _unknown_task_ids[task_id]
+        return False
+    return expires_at is not None
+
+
+def catalog_multipliers(cur, task_ids):
+    """The catalog's ``{task id: multiplier}``, reloaded first if ``task_ids``
+    has an id it doesn't know and that wasn't already missing after a reload
+    in the last ``TASK_CATALOG_TTL`` seconds. Unknown ids are left out."""
+    multipliers = get_task_catalog(cur).multipliers
+    now = time.monotonic()
+    with _unknown_lock:
+        unknown = [
+            task_id
+            for task_id in task_ids
+            if task_id not in multipliers and not _recently_missing(task_id, now)
+        ]
+    if unknown:
+        _catalog.invalidate()
+        multipliers = get_task_catalog(cur).multipliers
+        with _unknown_lock:
+            for task_id in unknown:
+                if task_id not in multipliers:
+                    _unknown_task_ids[task_id] = now + TASK_CATALOG_TTL
+                    _unknown_task_ids.move_to_end(task_id)
+            while len(_unknown_task_ids) > MAX_UNKNOWN_TASK_IDS:
+                _unknown_task_ids.popitem(last=False)
+    return multipliers
+
+
+def task_multipliers(cur, task_ids):
+    """Map each task id to its multiplier (see ``catalog_multipliers``),
+    raising KeyError if any of them doesn't exist."""
+    multipliers = catalog_multipliers(cur, task_ids)
+    missing = [task_id for task_id in task_ids if task_id not in multipliers]
+    if missing:
+        raise KeyError(f"Unknown multiplier tasks: {missing}")
+    return {task_id: multipliers[task_id] for task_id in task_ids}
@@ -0,0 +1,246 @@
+"""Worker for the social callback jobs queued by the popcorn callbacks.
+
+Jobs are drained ``WORKER_BATCH_SIZE`` at a time. For every batch:
+
+1. jobs whose idempotency key is already in ``social_callback_jobs`` are
+   acknowledged without doing anything (a redelivered or repeated callback),
+2. the rest are verified on at most ``WORKER_CONCURRENCY`` threads, since
+   verification waits on the provider's API,
+3. all verified awards are written in one transaction that claims the keys
+   and inserts the tasks with a single multi-row insert (ingest.award_tasks).
+   If that transaction fails, each award is written again on its own, so one
+   bad job (an unknown user or task) fails alone instead of sending the whole
+   batch back for retries,
+4. failures the provider may recover from are retried with exponential
+   backoff up to ``MAX_ATTEMPTS`` times; anything else is dead-lettered.
+
+Each provider registers a verifier with ``@verifier("discord")``. It receives
+the ``Job`` and returns an ``Award``, raising ``RetryableError`` for transient
+failures and ``VerificationError`` when the callback can never be honoured.
+Without a verifier a job fails with ``VerificationError``.
+
+Run the local SQLite stand-in with::
+
+    cd lambda/functions && SOCIAL_JOB_QUEUE_PATH=/tmp/social_jobs.sqlite3 \\
+        PYTHONPATH=.:popcorn python -m popcorn.worker
+"""
+
+import os
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import psycopg2
+from aws_lambda_powertools import Logger
+from psycopg2.extras import execute_values
+
+from shared.db import DatabaseError, get_db_connection
+
+from .ingest import award_tasks
+from .jobs import decode_job, get_queue
+from .tasks import task_multipliers
+
+WORKER_BATCH_SIZE = int(os.environ.get("WORKER_BATCH_SIZE", "50"))
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "8"))
+MAX_ATTEMPTS = int(os.environ.get("WORKER_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = 2
+MAX_RETRY_DELAY = 300
+
+DONE, DUPLICATE, RETRY, FAILED = "done", "duplicate", "retry", "failed"
+
+Award = namedtuple("Award", ["user_id", "multiplier_task_id", "performed_at"])
+
+logger = Logger(child=True)
+
+
+class RetryableError(Exception):
+    """A transient failure, e.g. the provider timed out."""
+
+    pass
+
+
+class VerificationError(Exception):
+    """The callback can't be honoured, e.g. an invalid or expired code."""
+
+    pass
+
+
+VERIFIERS = {}
+
+
+def verifier(social):
+    """Register ``fn(job) -> Award`` as the verifier for ``social``."""
+
+    def register(fn):
+        VERIFIERS[social] = fn
+        return fn
+
+    return register
+
+
+def _verify(job):
+    verify = VERIFIERS.get(job.social)
+    if verify is None:
+        raise VerificationError(f"No verifier registered for {job.social}")
+    return verify(job)
+
+
+def _processed_keys(keys):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT idempotency_key FROM social_callback_jobs
+                WHERE idempotency_key = ANY(%s)
+                """,
+                (list(keys),),
+            )
+            return {row[0] for row in cur.fetchall()}
+
+
+def _write_awards(awards):
+    """Claim the idempotency keys of ``{key: (job, award)}`` and award the
+    tasks for the keys nobody claimed before, in one transaction."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            claimed = execute_values(
+                cur,
+                """
+                INSERT INTO social_callback_jobs
+                    (idempotency_key, social, user_id, multiplier_task_id,
+                     processed_at)
+                VALUES %s
+                ON CONFLICT (idempotency_key) DO NOTHING
+                RETURNING idempotency_key
+                """,
+                [
+                    (key, job.social, award.user_id, award.multiplier_task_id)
+                    for key, (job, award) in awards.items()
+                ],
+                template="(%s, %s, %s, %s, now())",
+                page_size=len(awards),
+                fetch=True,
+            )
+            claimed = {row[0] for row in claimed}
+            rows = [
+                (award.user_id, award.multiplier_task_id, award.performed_at)
+                for key, (_, award) in awards.items()
+                if key in claimed
+            ]
+            if rows:
+                multipliers = task_multipliers(cur, {row[1] for row in rows})
+                award_tasks(cur, rows, multipliers)
+    return claimed
+
+
+# Errors that retrying the same award can't fix
+PERMANENT_WRITE_ERRORS = (
+    psycopg2.IntegrityError,
+    psycopg2.DataError,
+    KeyError,
+    ValueError,
+)
+WRITE_ERRORS = (psycopg2.Error, DatabaseError) + PERMANENT_WRITE_ERRORS
+
+
+def _write_award(key, award):
+    """Write one award in a transaction of its own and return its outcome."""
+    try:
+        claimed = _write_awards({key: award})
+    except PERMANENT_WRITE_ERRORS as e:
+        return (FAILED, f"{type(e).__name__}: {str(e)}")
+    except (psycopg2.Error, DatabaseError) as e:
+        logger.error(f"Writing a social task award failed: {str(e)}")
+        return (RETRY, "Database error")
+    return (DONE, None) if key in claimed else (DUPLICATE, None)
+
+
+def process_jobs(jobs, concurrency=WORKER_CONCURRENCY):
+    """Verify and award a batch of jobs. Returns ``{key: (outcome, detail)}``
+    with one entry per distinct idempotency key."""
+    unique = {}
+    for job in jobs:
+        unique.setdefault(job.key, job)
+    outcomes = {key: (DUPLICATE, None) for key in _processed_keys(unique)}
+    pending = [job for key, job in unique.items() if key not in outcomes]
+
+    awards = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(pending))) as pool:
+            futures = {pool.submit(_verify, job): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    awards[job.key] = (job, future.result())
+                except RetryableError as e:
+                    outcomes[job.key] = (RETRY, str(e))
+                except Exception as e:
+                    outcomes[job.key] = (FAILED, f"{type(e).__name__}: {str(e)}")
+
+    if awards:
+        try:
+            claimed = _write_awards(awards)
+        except WRITE_ERRORS as e:
+            logger.warning(
+                f"Writing {len(awards)} social task awards failed, writing them"
+                f" one by one: {str(e)}"
+            )
+            for key, award in awards.items():
+                outcomes[key] = _write_award(key, award)
+        else:
+            for key in awards:
+                outcomes[key] = (DONE, None) if key in claimed else (DUPLICATE, None)
+    return outcomes
+
+
+def retry_delay(attempts):
+    return min(MAX_RETRY_DELAY, RETRY_BASE_DELAY * 2**attempts)
+
+
+def drain(queue, batch_size=WORKER_BATCH_SIZE, concurrency=WORKER_CONCURRENCY):
+    """Process jobs from a pull queue (``SQLiteQueue``) until none are
+    visible. Returns a ``Counter`` of outcomes per delivery."""
+    totals = Counter()
+    while True:
+        deliveries = queue.receive(batch_size)
+        if not deliveries:
+            return totals
+        outcomes = process_jobs([d.job for d in deliveries], concurrency)
+        done = []
+        for delivery in deliveries:
+            outcome, detail = outcomes[delivery.job.key]
+            if outcome == RETRY and delivery.job.attempts + 1 >= MAX_ATTEMPTS:
+                outcome = FAILED
+            if outcome in (DONE, DUPLICATE):
+                done.append(delivery.receipt)
+            elif outcome == RETRY:
+                queue.retry(delivery, retry_delay(delivery.job.attempts))
+            else:
+                logger.error(f"Social callback job failed: {detail}")
+                queue.dead_letter(delivery, detail)
+            totals[outcome] += 1
+        queue.ack(done)
+
+
+def sqs_handler(event, context):
+    """SQS event source entry point. Jobs that were not awarded are reported as
+    batch item failures, so SQS redelivers them and the queue's redrive policy
+    dead-letters them after ``maxReceiveCount`` deliveries. Permanent failures
+    are logged as well, they reach the dead letter queue the same way."""
+    records = [
+        (record["messageId"], decode_job(record["body"])) for record in event["Records"]
+    ]
+    outcomes = process_jobs([job for _, job in records])
+    failures = []
+    for message_id, job in records:
+        outcome, detail = outcomes[job.key]
+        if outcome == FAILED:
+            logger.error(
+                f"Social callback job failed: {detail}", extra={"job": job._asdict()}
+            )
+        if outcome in (RETRY, FAILED):
+            failures.append({"itemIdentifier": message_id})
+    return {"batchItemFailures": failures}
+
+
+if __name__ == "__main__":
+    print(dict(drain(get_queue())))
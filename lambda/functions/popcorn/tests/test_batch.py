@@ -0,0 +1,59 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from popcorn.batch import calculate_batch
+from popcorn.ledger import initial_state, replay
+
+UNTIL = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def make_rows(seed, users):
+    """Rows shaped like ``fetch_task_rows`` output for ``users`` users, some
+    without tasks and some with tasks sharing a timestamp."""
+    rng = random.Random(seed)
+    rows = []
+    for user_id in range(1, users + 1):
+        created_at = UNTIL - timedelta(days=rng.randint(1, 120))
+        task_count = rng.choice([0, 0, 1, 5, 40])
+        if not task_count:
+            rows.append((user_id, created_at, None, None))
+            continue
+        at = created_at
+        for _ in range(task_count):
+            if rng.random() > 0.1:
+                at += timedelta(seconds=rng.randint(1, 3600))
+            rows.append((user_id, created_at, min(at, UNTIL), rng.choice([1.1, 2.0])))
+    return rows
+
+
+def per_user(rows, until):
+    """The single-user computation of ledger.py, one replay per user."""
+    results = {}
+    for user_id in dict.fromkeys(row[0] for row in rows):
+        user_rows = [row for row in rows if row[0] == user_id]
+        events = [(row[2], row[3]) for row in user_rows if row[2] is not None]
+        state = replay(initial_state(user_rows[0][1]), events, until)
+        results[user_id] = (state.total_popcorn, state.current_multiplier)
+    return results
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_matches_per_user_replay(seed):
+    rows = make_rows(seed, 200)
+    batch = calculate_batch(rows, UNTIL)
+    expected = per_user(rows, UNTIL)
+    assert batch.keys() == expected.keys()
+    for user_id, (total_popcorn, current_multiplier) in expected.items():
+        assert batch[user_id][0] == pytest.approx(total_popcorn, rel=1e-9)
+        assert batch[user_id][1] == pytest.approx(current_multiplier, abs=1e-6)
+
+
+def test_user_without_tasks_accrues_the_base_rate():
+    created_at = UNTIL - timedelta(hours=1)
+    assert calculate_batch([(7, created_at, None, None)], UNTIL) == {7: (3600.0, 1.0)}
+
+
+def test_empty_batch():
+    assert calculate_batch([], UNTIL) == {}
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from popcorn.invite_codes import (
+    CODE_BITS,
+    CODE_LENGTH,
+    CODE_PREFIXES,
+    decode,
+    make_codes,
+    permute,
+    unpermute,
+)
+
+CODE_TYPES = list(CODE_PREFIXES)
+
+
+def random_values(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 1 << CODE_BITS, size=count, dtype=np.uint64)
+
+
+@pytest.mark.parametrize("code_type", CODE_TYPES)
+def test_permutation_round_trips(code_type):
+    values = np.r_[
+        np.arange(10_000, dtype=np.uint64),
+        np.uint64((1 << CODE_BITS) - 1),
+        random_values(100_000),
+    ]
+    permuted = permute(values, code_type)
+    assert (permuted < np.uint64(1 << CODE_BITS)).all()
+    assert (unpermute(permuted, code_type) == values).all()
+    assert (permute(unpermute(values, code_type), code_type) == values).all()
+
+
+@pytest.mark.parametrize("code_type", CODE_TYPES)
+def test_permutation_is_injective(code_type):
+    # Implied by the inverse above, checked directly over 2**20 numbers
+    values = np.arange(1 << 20, dtype=np.uint64)
+    assert len(np.unique(permute(values, code_type))) == len(values)
+
+
+def test_code_types_use_different_permutations():
+    values = np.arange(1000, dtype=np.uint64)
+    assert (permute(values, "general") != permute(values, "user")).any()
+
+
+@pytest.mark.parametrize("code_type", CODE_TYPES)
+def test_codes_decode_to_their_sequence_numbers(code_type):
+    start = 123_456
+    codes = make_codes(code_type, start, 5000)
+    prefix = CODE_PREFIXES[code_type]
+    assert all(
+        code.startswith(f"{prefix}-") and len(code) == len(prefix) + 1 + CODE_LENGTH
+        for code in codes
+    )
+    assert len(set(codes)) == len(codes)
+    numbers = unpermute(decode(codes), code_type)
+    assert (numbers == np.arange(start, start + 5000, dtype=np.uint64)).all()
+
+
+def test_exhausted_code_space():
+    with pytest.raises(ValueError):
+        make_codes("general", (1 << CODE_BITS) - 1, 2)
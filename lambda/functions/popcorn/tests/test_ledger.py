@@ -0,0 +1,150 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from popcorn import ledger
+from popcorn.ledger import (
+    CHECKPOINT_INTERVAL,
+    LedgerState,
+    advance,
+    fold_events,
+    initial_state,
+    record_task_events,
+    replay,
+)
+
+CREATED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def baseline_popcorn(created_at, tasks, at):
+    """The per-request loop the ledger replaced: accrue from signup over every
+    task up to ``at``. Returns ``(total_popcorn, current_multiplier)``."""
+    total_popcorn = 0
+    current_multiplier = 1
+    last_calculation_time = created_at
+    for performed_at, multiplier in tasks:
+        if performed_at > at:
+            break
+        total_popcorn += (performed_at - last_calculation_time).total_seconds() * (
+            current_multiplier
+        )
+        current_multiplier += multiplier - 1
+        last_calculation_time = performed_at
+    total_popcorn += (at - last_calculation_time).total_seconds() * current_multiplier
+    return total_popcorn, current_multiplier
+
+
+def make_tasks(seed, count):
+    """``count`` tasks, oldest first, with some sharing a timestamp."""
+    rng = random.Random(seed)
+    at = CREATED_AT
+    tasks = []
+    for _ in range(count):
+        if not tasks or rng.random() > 0.2:
+            at += timedelta(seconds=rng.randint(1, 86_400))
+        tasks.append((at, rng.choice([1.1, 1.25, 1.5, 2.0])))
+    return tasks
+
+
+def read_at(checkpoints, tasks, at):
+    """What ``popcorn_at`` computes for a past ``at``: replay the tasks after
+    the nearest checkpoint at or before it."""
+    earlier = [c for c in checkpoints if c[3] <= at]
+    if earlier:
+        _, total_popcorn, current_multiplier, last_event_at = max(
+            earlier, key=lambda c: c[3]
+        )
+        start = LedgerState(total_popcorn, current_multiplier, last_event_at)
+        events = [task for task in tasks if task[0] > last_event_at]
+    else:
+        start, events = initial_state(CREATED_AT), tasks
+    return replay(start, events, at)
+
+
+def assert_matches_baseline(state, tasks, at):
+    total_popcorn, current_multiplier = baseline_popcorn(CREATED_AT, tasks, at)
+    assert state.total_popcorn == pytest.approx(total_popcorn, rel=1e-9)
+    assert state.current_multiplier == pytest.approx(current_multiplier, abs=1e-6)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_latest_state_extrapolates_like_baseline(seed):
+    tasks = make_tasks(seed, 100)
+    state, event_count, _ = fold_events(1, initial_state(CREATED_AT), 0, tasks)
+    assert event_count == len(tasks)
+    for days in (0, 1, 30):
+        at = tasks[-1][0] + timedelta(days=days)
+        assert_matches_baseline(advance(state, at), tasks, at)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_reads_from_checkpoints_match_baseline(seed):
+    tasks = make_tasks(seed, 4 * CHECKPOINT_INTERVAL + 3)
+    _, _, checkpoints = fold_events(1, initial_state(CREATED_AT), 0, tasks)
+    assert checkpoints
+    times = [CREATED_AT] + [performed_at for performed_at, _ in tasks]
+    for at in times + [t + timedelta(seconds=1) for t in times]:
+        assert_matches_baseline(read_at(checkpoints, tasks, at), tasks, at)
+
+
+def test_checkpoint_includes_every_task_at_its_time():
+    at = CREATED_AT + timedelta(hours=1)
+    tasks = [(at + timedelta(minutes=i), 1.1) for i in range(CHECKPOINT_INTERVAL - 1)]
+    tasks += [(tasks[-1][0] + timedelta(minutes=1), 1.5)] * 3
+    _, _, checkpoints = fold_events(1, initial_state(CREATED_AT), 0, tasks)
+    last_task_at = tasks[-1][0]
+    assert [c[3] for c in checkpoints] == [last_task_at]
+    assert_matches_baseline(
+        read_at(checkpoints, tasks, last_task_at), tasks, last_task_at
+    )
+
+
+class LedgerCursor:
+    """Answers ``record_task_events``'s ledger read with a fixed row."""
+
+    def __init__(self, row):
+        self.row = row
+
+    def fetchone(self):
+        return self.row
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    calls = {"rebuilt": 0, "written": []}
+
+    def rebuild(cur, user_id):
+        calls["rebuilt"] += 1
+
+    def write(cur, user_id, state, event_count, checkpoints):
+        calls["written"].append((state, event_count))
+
+    monkeypatch.setattr(ledger, "execute", lambda cur, statement, params: None)
+    monkeypatch.setattr(ledger, "rebuild_user_ledger", rebuild)
+    monkeypatch.setattr(ledger, "_write_ledger", write)
+    return calls
+
+
+def ledger_row(last_event_at, event_count=CHECKPOINT_INTERVAL):
+    return (CREATED_AT, 1000.0, 1.5, last_event_at, event_count)
+
+
+def test_later_task_is_folded_into_the_ledger(recorded):
+    last_event_at = CREATED_AT + timedelta(hours=1)
+    cur = LedgerCursor(ledger_row(last_event_at))
+    record_task_events(cur, 1, [(last_event_at + timedelta(seconds=10), 1.1)])
+    assert recorded["rebuilt"] == 0
+    state, event_count = recorded["written"][0]
+    assert state.total_popcorn == pytest.approx(1015.0)
+    assert state.current_multiplier == pytest.approx(1.6)
+    assert event_count == CHECKPOINT_INTERVAL + 1
+
+
+@pytest.mark.parametrize("offset", [timedelta(0), timedelta(seconds=-10)])
+def test_task_at_or_before_the_latest_rebuilds(recorded, offset):
+    last_event_at = CREATED_AT + timedelta(hours=1)
+    cur = LedgerCursor(ledger_row(last_event_at))
+    record_task_events(cur, 1, [(last_event_at + offset, 1.1)])
+    assert recorded["rebuilt"] == 1
+    assert recorded["written"] == []
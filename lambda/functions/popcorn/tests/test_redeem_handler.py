@@ -0,0 +1,159 @@
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+
+from popcorn import handler, redemption
+from popcorn.redemption import (
+    ALREADY_APPLIED,
+    ALREADY_USED,
+    NOT_FOUND,
+    OWN_CODE,
+    Redemption,
+)
+
+INVITE_CODE_TASK_ID = 9
+CONTEXT = SimpleNamespace(
+    function_name="test",
+    memory_limit_in_mb=128,
+    invoked_function_arn="arn:aws:lambda:us-east-1:000000000000:function:test",
+    aws_request_id="test",
+)
+
+
+def post(path, body):
+    event = {
+        "resource": "/{proxy+}",
+        "path": "/v1/popcorn" + path,
+        "httpMethod": "POST",
+        "headers": {"Content-Type": "application/json"},
+        "multiValueHeaders": {},
+        "queryStringParameters": None,
+        "multiValueQueryStringParameters": None,
+        "pathParameters": None,
+        "stageVariables": None,
+        "requestContext": {"stage": "v1", "requestId": "test", "httpMethod": "POST"},
+        "body": body if isinstance(body, str) else json.dumps(body),
+        "isBase64Encoded": False,
+    }
+    response = handler.lambda_handler(event, CONTEXT)
+    return response["statusCode"], json.loads(response["body"])
+
+
+@pytest.fixture(autouse=True)
+def invite_code_task(monkeypatch):
+    monkeypatch.setattr(handler, "INVITE_CODE_TASK_ID", str(INVITE_CODE_TASK_ID))
+
+
+@pytest.fixture
+def redeemed(monkeypatch):
+    """Replace ``redeem`` with one answering ``result`` and recording calls."""
+    calls = SimpleNamespace(args=[], result=Redemption("general", None))
+
+    def redeem(code, user_id, task_id):
+        calls.args.append((code, user_id, task_id))
+        if isinstance(calls.result, Exception):
+            raise calls.result
+        return calls.result
+
+    monkeypatch.setattr(handler, "redeem", redeem)
+    return calls
+
+
+@pytest.mark.parametrize("path", ["/redeem_invite_code", "/apply_invite_code"])
+def test_redeems_the_normalized_code(redeemed, path):
+    status, body = post(path, {"user_id": 7, "invite_code": " gen-7q2mzk0d "})
+    assert status == 200
+    assert body == {"user_id": 7, "invite_code": "GEN-7Q2MZK0D", "code_type": "general"}
+    assert redeemed.args == [("GEN-7Q2MZK0D", 7, INVITE_CODE_TASK_ID)]
+
+
+@pytest.mark.parametrize(
+    "refusal, expected_status",
+    [(NOT_FOUND, 404), (ALREADY_USED, 409), (ALREADY_APPLIED, 409), (OWN_CODE, 403)],
+)
+def test_refusals_have_distinct_responses(redeemed, refusal, expected_status):
+    redeemed.result = Redemption("sandwatch", refusal)
+    status, body = post("/redeem_invite_code", {"user_id": 7, "invite_code": "SW-1"})
+    assert status == expected_status
+    assert body["error"] == handler.REDEMPTION_ERRORS[refusal][1]
+
+
+def test_messages_tell_the_refusals_apart():
+    messages = [message for _, message in handler.REDEMPTION_ERRORS.values()]
+    assert len(set(messages)) == len(messages)
+
+
+@pytest.mark.parametrize("body", ["not json", {"user_id": 7}, {"invite_code": "X"}])
+def test_invalid_body(redeemed, body):
+    status, _ = post("/redeem_invite_code", body)
+    assert status == 400
+    assert redeemed.args == []
+
+
+def test_unknown_user(redeemed):
+    redeemed.result = psycopg2.IntegrityError("insert violates foreign key")
+    status, body = post("/redeem_invite_code", {"user_id": 7, "invite_code": "SW-1"})
+    assert (status, body["error"]) == (404, "User not found")
+
+
+class RedeemCursor:
+    """Answers the GEN- redemption statement with ``row``."""
+
+    def __init__(self, row):
+        self.row = row
+        self.connection = SimpleNamespace(prepared=set())
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params):
+        self.statements.append((sql, params))
+
+    def fetchone(self):
+        return self.row
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """``redeem`` against a fake connection, with the award recorded."""
+    db = SimpleNamespace(cursor=None, awards=[])
+
+    @contextmanager
+    def get_db_connection():
+        yield SimpleNamespace(cursor=lambda: db.cursor)
+
+    def award_tasks(cur, rows, multipliers):
+        db.awards.extend((user_id, task_id) for user_id, task_id, _ in rows)
+
+    monkeypatch.setattr(redemption, "get_db_connection", get_db_connection)
+    monkeypatch.setattr(redemption, "award_tasks", award_tasks)
+    monkeypatch.setattr(redemption, "task_multipliers", lambda cur, ids: {})
+    redemption.invalid_codes.clear()
+    yield db
+    redemption.invalid_codes.clear()
+
+
+def test_redemption_awards_the_invite_code_task(database):
+    database.cursor = RedeemCursor((True, True))
+    status, body = post("/redeem_invite_code", {"user_id": 7, "invite_code": "GEN-1"})
+    assert (status, body["code_type"]) == (200, "general")
+    assert database.awards == [(7, INVITE_CODE_TASK_ID)]
+    [(sql, params)] = database.cursor.statements
+    assert "invite_codes" in sql and "sandwatch_invite_codes" not in sql
+    assert params[:2] == ("GEN-1", 7)
+
+
+def test_unknown_code_is_answered_from_the_cache(database):
+    database.cursor = RedeemCursor((False, False))
+    for _ in range(2):
+        status, _ = post("/redeem_invite_code", {"user_id": 7, "invite_code": "GEN-2"})
+        assert status == 404
+    assert len(database.cursor.statements) == 1
+    assert database.awards == []
@@ -0,0 +1,142 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from popcorn import worker
+from popcorn.jobs import SQLiteQueue, encode_job, make_job
+from popcorn.worker import (
+    DONE,
+    DUPLICATE,
+    FAILED,
+    MAX_ATTEMPTS,
+    RETRY,
+    Award,
+    RetryableError,
+    VerificationError,
+    drain,
+    sqs_handler,
+)
+
+PERFORMED_AT = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+class Awards:
+    """``social_callback_jobs`` and the awarded tasks behind the worker's two
+    database calls."""
+
+    def __init__(self):
+        self.keys = set()
+        self.tasks = []
+
+    def processed_keys(self, keys):
+        return set(keys) & self.keys
+
+    def write_awards(self, awards):
+        claimed = set(awards) - self.keys
+        self.keys |= claimed
+        self.tasks += [award for key, (_, award) in awards.items() if key in claimed]
+        return claimed
+
+
+@pytest.fixture
+def awards(monkeypatch):
+    awards = Awards()
+    monkeypatch.setattr(worker, "_processed_keys", awards.processed_keys)
+    monkeypatch.setattr(worker, "_write_awards", awards.write_awards)
+    monkeypatch.setattr(worker, "retry_delay", lambda attempts: 0)
+    return awards
+
+
+@pytest.fixture
+def verified(monkeypatch):
+    """A stub discord verifier. Codes starting with ``retry`` fail transiently
+    as many times as ``failures[code]`` says, ``bad`` codes fail for good."""
+    calls = []
+    failures = {}
+    monkeypatch.setattr(worker, "VERIFIERS", {})
+
+    @worker.verifier("discord")
+    def verify(job):
+        code = job.params["code"]
+        calls.append(code)
+        if code == "bad":
+            raise VerificationError("Invalid code")
+        if failures.get(code, 0) > 0:
+            failures[code] -= 1
+            raise RetryableError("Provider timed out")
+        return Award(int(code.split("-")[-1]), 3, PERFORMED_AT)
+
+    return calls, failures
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def job(code):
+    return make_job("discord", {"code": code, "state": "s"})
+
+
+def test_repeated_callbacks_are_awarded_once(awards, verified, queue):
+    for code in ("user-1", "user-1", "user-2"):
+        queue.enqueue(job(code))
+    assert drain(queue) == {DONE: 3}
+    assert [award.user_id for award in awards.tasks] == [1, 2]
+    # Verified once per distinct job
+    assert sorted(verified[0]) == ["user-1", "user-2"]
+    assert len(queue) == 0
+
+
+def test_redelivered_jobs_are_acknowledged_without_verifying(awards, verified, queue):
+    queue.enqueue(job("user-1"))
+    drain(queue)
+    queue.enqueue(job("user-1"))
+    assert drain(queue) == {DUPLICATE: 1}
+    assert len(awards.tasks) == 1
+    assert verified[0] == ["user-1"]
+
+
+def test_transient_failures_are_retried(awards, verified, queue):
+    verified[1]["retry-4"] = 2
+    queue.enqueue(job("retry-4"))
+    assert drain(queue) == {RETRY: 2, DONE: 1}
+    assert [award.user_id for award in awards.tasks] == [4]
+    assert len(queue) == 0
+
+
+def test_jobs_are_dead_lettered_after_max_attempts(awards, verified, queue):
+    verified[1]["retry-4"] = MAX_ATTEMPTS
+    queue.enqueue(job("retry-4"))
+    assert drain(queue) == {RETRY: MAX_ATTEMPTS - 1, FAILED: 1}
+    ((dead, error),) = queue.dead_jobs()
+    assert dead.attempts == MAX_ATTEMPTS - 1
+    assert error == "Provider timed out"
+    assert awards.tasks == []
+
+
+def test_permanent_failures_are_dead_lettered(awards, verified, queue):
+    queue.enqueue(job("bad"))
+    queue.enqueue(make_job("twitter", {"code": "c", "state": "s"}))
+    assert drain(queue) == {FAILED: 2}
+    assert sorted(error for _, error in queue.dead_jobs()) == [
+        "VerificationError: Invalid code",
+        "VerificationError: No verifier registered for twitter",
+    ]
+    assert len(queue) == 0
+
+
+def test_sqs_reports_jobs_not_awarded_as_failures(awards, verified):
+    verified[1]["retry-4"] = 1
+    codes = ["user-1", "user-1", "retry-4", "bad"]
+    event = {
+        "Records": [
+            {"messageId": f"m{n}", "body": encode_job(job(code))}
+            for n, code in enumerate(codes)
+        ]
+    }
+    # Redelivered failures reach the dead letter queue through the redrive policy
+    assert sqs_handler(event, None) == {
+        "batchItemFailures": [{"itemIdentifier": "m2"}, {"itemIdentifier": "m3"}]
+    }
+    assert [award.user_id for award in awards.tasks] == [1]
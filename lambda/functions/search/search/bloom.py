@@ -0,0 +1,267 @@
+"""In-memory Bloom filter of taken usernames.
+
+A username that is not in the filter is definitely free, so only probable hits
+have to be confirmed by the database. The filter is loaded at init from the
+snapshot in ``username_filter_snapshots`` (or built from ``users`` if there is
+none yet) and then catches up every ``USERNAME_FILTER_REFRESH`` seconds with
+the usernames updated since its high-water mark on ``users.updated_at``. See
+migrations/0004_username_filter.sql.
+
+A name taken since the last refresh can be reported free for at most that
+long; the unique constraint on ``users.username`` stays the source of truth.
+Bloom filters cannot forget, so a released name keeps falling through to the
+database until the next snapshot is written, which is done by::
+
+    cd lambda/functions && PYTHONPATH=.:search python -m search.bloom
+"""
+
+import hashlib
+import math
+import os
+import time
+from datetime import timedelta
+from threading import Lock
+
+from aws_lambda_powertools import Logger
+
+from shared.db import get_db_connection
+
+USERNAME_FILTER_ERROR_RATE = float(os.environ.get("USERNAME_FILTER_ERROR_RATE", "0.01"))
+USERNAME_FILTER_REFRESH = float(os.environ.get("USERNAME_FILTER_REFRESH", "5"))
+USERNAME_FILTER_PRELOAD = (
+    os.environ.get("USERNAME_FILTER_PRELOAD", "true").lower() == "true"
+)
+# Smallest filter built, so a young table doesn't saturate it straight away
+USERNAME_FILTER_MIN_CAPACITY = 100_000
+# Re-read this far behind the high-water mark, to pick up transactions that
+# committed after later ones were already seen
+REFRESH_OVERLAP = timedelta(seconds=30)
+SNAPSHOT_NAME = "usernames"
+
+logger = Logger(child=True)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings with ``hash_count`` probes derived
+    from one BLAKE2b digest (double hashing)."""
+
+    def __init__(self, bit_count, hash_count, bits=None, item_count=0):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.bits = bytearray((bit_count + 7) // 8) if bits is None else bits
+        self.item_count = item_count
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        """Size a filter to hold ``capacity`` items at ``error_rate``."""
+        capacity = max(1, capacity)
+        bit_count = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hash_count = max(1, round(bit_count / capacity * math.log(2)))
+        return cls(bit_count, hash_count)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, item):
+        bits = self.bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.item_count += 1
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    @property
+    def memory_bytes(self):
+        return len(self.bits)
+
+    def fill_ratio(self):
+        set_bits = int.from_bytes(self.bits, "little").bit_count()
+        return set_bits / self.bit_count
+
+    def estimated_false_positive_rate(self):
+        """False positive rate implied by the share of bits set."""
+        return self.fill_ratio() ** self.hash_count
+
+
+class UsernameFilter:
+    """The process-wide filter plus its high-water mark and hit counters."""
+
+    def __init__(self, error_rate=USERNAME_FILTER_ERROR_RATE):
+        self.error_rate = error_rate
+        self.filter = None
+        self.high_water_mark = None
+        self.refreshed_at = 0.0
+        self.lookups = 0
+        self.negatives = 0
+        self.false_positives = 0
+        self._lock = Lock()
+
+    def _load(self, cur):
+        cur.execute(
+            """
+            SELECT bit_count, hash_count, item_count, bits, high_water_mark
+            FROM username_filter_snapshots WHERE name = %s
+            """,
+            (SNAPSHOT_NAME,),
+        )
+        row = cur.fetchone()
+        if row is None:
+            self.filter, self.high_water_mark = build_filter(cur, self.error_rate)
+            return
+        bit_count, hash_count, item_count, bits, high_water_mark = row
+        self.filter = BloomFilter(bit_count, hash_count, bytearray(bits), item_count)
+        self.high_water_mark = high_water_mark
+
+    def _catch_up(self, cur):
+        since = self.high_water_mark - REFRESH_OVERLAP if self.high_water_mark else None
+        cur.execute(
+            """
+            SELECT username, updated_at FROM users
+            WHERE username IS NOT NULL
+              AND (%(since)s::TIMESTAMPTZ IS NULL OR updated_at > %(since)s)
+            ORDER BY updated_at
+            """,
+            {"since": since},
+        )
+        rows = cur.fetchall()
+        for username, _ in rows:
+            if username not in self.filter:
+                self.filter.add(username)
+        if rows:
+            self.high_water_mark = max(self.high_water_mark or rows[-1][1], rows[-1][1])
+
+    def refresh(self, force=False):
+        """Load the filter if needed and add the usernames changed since the
+        high-water mark, at most once per ``USERNAME_FILTER_REFRESH``. Borrows
+        a database connection only when a refresh is due."""
+        with self._lock:
+            now = time.monotonic()
+            if (
+                not force
+                and self.filter is not None
+                and now < self.refreshed_at + USERNAME_FILTER_REFRESH
+            ):
+                return
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    if self.filter is None:
+                        self._load(cur)
+                    self._catch_up(cur)
+                    if (
+                        self.filter.estimated_false_positive_rate()
+                        > 2 * self.error_rate
+                    ):
+                        # Grown past its capacity, start over with a bigger filter
+                        self.filter, self.high_water_mark = build_filter(
+                            cur, self.error_rate
+                        )
+            self.refreshed_at = now
+            logger.info("Username filter refreshed", extra=self.stats())
+
+    def might_exist(self, username):
+        """False if ``username`` is definitely not taken."""
+        self.lookups += 1
+        if username in self.filter:
+            return True
+        self.negatives += 1
+        return False
+
+    def record_false_positive(self):
+        self.false_positives += 1
+
+    def stats(self):
+        probable_hits = self.lookups - self.negatives
+        return {
+            "items": self.filter.item_count if self.filter else 0,
+            "memory_bytes": self.filter.memory_bytes if self.filter else 0,
+            "hash_count": self.filter.hash_count if self.filter else 0,
+            "estimated_false_positive_rate": (
+                self.filter.estimated_false_positive_rate() if self.filter else 0.0
+            ),
+            "lookups": self.lookups,
+            "answered_from_memory": self.negatives,
+            "false_positives": self.false_positives,
+            # Share of names absent from the table that still went to the database
+            "observed_false_positive_rate": (
+                self.false_positives / (self.negatives + self.false_positives)
+                if self.negatives + self.false_positives
+                else 0.0
+            ),
+            "db_lookups": probable_hits,
+        }
+
+
+def build_filter(cur, error_rate=USERNAME_FILTER_ERROR_RATE):
+    """Build a filter of every username, sized for twice the current count.
+    Returns ``(filter, high_water_mark)``."""
+    cur.execute(
+        "SELECT count(*), max(updated_at) FROM users WHERE username IS NOT NULL"
+    )
+    count, high_water_mark = cur.fetchone()
+    bloom = BloomFilter.for_capacity(
+        max(2 * count, USERNAME_FILTER_MIN_CAPACITY), error_rate
+    )
+    cur.execute("SELECT username FROM users WHERE username IS NOT NULL")
+    while True:
+        rows = cur.fetchmany(10_000)
+        if not rows:
+            break
+        bloom.update(row[0] for row in rows)
+    return bloom, high_water_mark
+
+
+def save_snapshot(cur, bloom, high_water_mark):
+    cur.execute(
+        """
+        INSERT INTO username_filter_snapshots
+            (name, bit_count, hash_count, item_count, bits, high_water_mark,
+             created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, now())
+        ON CONFLICT (name) DO UPDATE SET
+            bit_count = excluded.bit_count,
+            hash_count = excluded.hash_count,
+            item_count = excluded.item_count,
+            bits = excluded.bits,
+            high_water_mark = excluded.high_water_mark,
+            created_at = excluded.created_at
+        """,
+        (
+            SNAPSHOT_NAME,
+            bloom.bit_count,
+            bloom.hash_count,
+            bloom.item_count,
+            bytes(bloom.bits),
+            high_water_mark,
+        ),
+    )
+
+
+username_filter = UsernameFilter()
+
+
+def rebuild_snapshot():
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            bloom, high_water_mark = build_filter(cur)
+            save_snapshot(cur, bloom, high_water_mark)
+    return bloom
+
+
+if __name__ == "__main__":
+    bloom = rebuild_snapshot()
+    print(
+        f"Saved username filter: {bloom.item_count} names, "
+        f"{bloom.memory_bytes} bytes, {bloom.hash_count} hashes"
+    )
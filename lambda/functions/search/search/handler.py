@@ -1,75 +1,53 @@
 # force build comment 2683534907
-import json
+from shared.utils import dumps, error_response, json_response, resolve
+from shared.db import get_db_connection, DatabaseError
+from shared.queries import execute, register
+from .bloom import USERNAME_FILTER_PRELOAD, username_filter
+from .index import MAX_PAGE_SIZE, MAX_RANKED_MATCHES, user_search
 
-import os
-import traceback
-
-import psycopg2
 
 from psycopg2.extras import RealDictCursor
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.event_handler import APIGatewayRestResolver
-from aws_lambda_powertools.event_handler.api_gateway import Response
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.parser import BaseModel
 from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
 
-# Database connection parameters
-DB_NAME = os.environ["DB_NAME"]
-DB_USER = os.environ["DB_USER"]
-DB_PASSWORD = os.environ["DB_PASSWORD"]
-DB_HOST = os.environ["DB_HOST"]
-DB_PORT = os.environ["DB_PORT"]
-
 logger = Logger()
 tracer = Tracer()
 
-app = APIGatewayRestResolver(strip_prefixes=["/v1/search"])
-
-
-class Connection(BaseModel):
-    id: str
-
+app = APIGatewayRestResolver(strip_prefixes=["/v1/search"], serializer=dumps)
 
-class DatabaseError(Exception):
-    """Custom exception for database-related errors."""
+USERNAME_EXISTS = register(
+    "username_exists",
+    "SELECT EXISTS (SELECT 1 FROM public.users WHERE username = %s)",
+)
 
-    pass
+# Load the username filter during init. If the database is unreachable the
+# first request loads it instead.
+if USERNAME_FILTER_PRELOAD:
+    try:
+        username_filter.refresh()
+    except Exception as e:
+        logger.warning(f"Could not load the username filter: {str(e)}")
 
 
-@tracer.capture_method
-def get_db_connection():
-    try:
-        return psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT,
-        )
-    except psycopg2.Error as e:
-        logger.error(f"Failed to connect to the database: {str(e)}")
-        raise DatabaseError("Unable to establish database connection") from e
+class Connection(BaseModel):
+    id: str
 
 
 @app.exception_handler(Exception)
 def handle_general_exception(e):
     logger.exception("An unexpected error occurred")
-    return {
-        "statusCode": 500,
-        "body": "An unexpected error occurred. Please try again later.",
-    }
+    return error_response(500, "An unexpected error occurred. Please try again later.")
 
 
 @app.exception_handler(DatabaseError)
 def handle_database_error(e):
     logger.error(f"Database error: {str(e)}")
-    return {
-        "statusCode": 500,
-        "body": "A database error occurred. Please try again later.",
-    }
+    return error_response(500, "A database error occurred. Please try again later.")
 
 
 @logger.inject_lambda_context(correlation_id_path=correlation_paths.API_GATEWAY_REST)
@@ -77,67 +55,75 @@ def handle_database_error(e):
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     logger.info("Search Lambda handler invoked")
 
-    try:
-        response = app.resolve(event, context)
-        if isinstance(response.get("body"), str):
-            try:
-                body = json.loads(response["body"])
-                response["body"] = json.dumps(body)
-            except json.JSONDecodeError:
-                pass  # If it's not JSON, leave it as is
-        return response
-    except Exception as e:
-        logger.error(f"An error occurred in the lambda handler: {str(e)}")
-        logger.error(f"Exception type: {type(e).__name__}")
-        logger.error(f"Exception traceback: {traceback.format_exc()}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps(
-                {
-                    "error": "An internal server error occurred",
-                    "details": str(e),
-                    "type": type(e).__name__,
-                }
-            ),
-        }
+    return resolve(app, event, context)
 
 
 @app.get("/username")
 @tracer.capture_method
-def check_username_exists(request):
-    username = request.get_query_string_value("username")
+def check_username_exists():
+    username = app.current_event.get_query_string_value("username")
     if not username:
-        return Response(
-            status_code=400,
-            content_type="application/json",
-            body=json.dumps({"error": "Username parameter is required"}),
-        )
+        return error_response(400, "Username parameter is required")
 
     logger.info("Checking if username exists")
     try:
+        # Definitely free names are answered from memory
+        username_filter.refresh()
+        if not username_filter.might_exist(username):
+            return json_response(200, {"exists": False})
+
         with get_db_connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    "SELECT EXISTS (SELECT 1 FROM public.users WHERE username = %s);",
-                    (username,),
-                )
+                execute(cur, USERNAME_EXISTS, (username,))
                 exists = cur.fetchone()["exists"]
+        if not exists:
+            username_filter.record_false_positive()
 
-        return Response(
-            status_code=200,
-            content_type="application/json",
-            body=json.dumps({"exists": exists}),
-        )
+        return json_response(200, {"exists": exists})
     except Exception as e:
         logger.error(f"Error checking username: {str(e)}")
-        return Response(
-            status_code=500,
-            content_type="application/json",
-            body=json.dumps(
-                {
-                    "error": "An internal server error occurred",
-                    "details": str(e),
-                    "type": type(e).__name__,
-                }
-            ),
+        return json_response(
+            500,
+            {
+                "error": "An internal server error occurred",
+                "details": str(e),
+                "type": type(e).__name__,
+            },
         )
+
+
+@app.get("/users")
+@tracer.capture_method
+def search_users():
+    query_params = app.current_event.query_string_parameters or {}
+    query = (query_params.get("q") or "").strip()
+    if not query:
+        return error_response(400, "q parameter is required")
+    try:
+        limit = int(query_params.get("limit", 20))
+        offset = int(query_params.get("offset", 0))
+    except ValueError:
+        return error_response(400, "limit and offset must be integers")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return error_response(400, f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if not 0 <= offset < MAX_RANKED_MATCHES:
+        return error_response(
+            400, f"offset must be between 0 and {MAX_RANKED_MATCHES - 1}"
+        )
+
+    logger.info("Searching users")
+    page = user_search.search(query, offset, limit)
+    next_offset = offset + len(page.users)
+    return json_response(
+        200,
+        {
+            "query": query,
+            "users": [
+                {"user_id": user_id, "username": username, "match": match}
+                for user_id, username, match in page.users
+            ],
+            "total": page.total,
+            "truncated": page.truncated,
+            "next_offset": next_offset if next_offset < page.total else None,
+        },
+    )
@@ -0,0 +1,277 @@
+"""In-process username search index behind ``/users?q=``.
+
+Usernames are held in two compact structures, built from ``users`` on the
+first search and then kept current from the same ``users.updated_at``
+high-water mark as the username filter (see bloom.py):
+
+* a sorted array of lower-cased usernames, answering prefix queries with a
+  binary search, and
+* trigram posting lists (ascending ``array`` of document numbers), answering
+  substring queries from the rarest trigram of the query and typo-tolerant
+  queries by the share of trigrams a username has in common with it.
+
+Matches are ranked exact, then prefix (alphabetically), then substring (by
+position, shorter names first), then fuzzy (by similarity). A query stops collecting matches once it has
+``MAX_RANKED_MATCHES`` of them or runs out of its latency budget, and then
+says so with ``truncated``.
+
+The index is built in the container, on its first search, taking about
+450 MiB and 11 s of CPU at 1M users. The search Lambda's memory and timeout
+in infra/lambdas.tf are sized for that.
+"""
+
+import os
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, namedtuple
+from threading import Lock
+
+from aws_lambda_powertools import Logger
+
+from shared.db import get_db_connection
+
+from .bloom import REFRESH_OVERLAP
+
+USER_INDEX_REFRESH = float(os.environ.get("USER_INDEX_REFRESH", "30"))
+SEARCH_LATENCY_BUDGET_MS = float(os.environ.get("SEARCH_LATENCY_BUDGET_MS", "50"))
+MAX_RANKED_MATCHES = 1000
+MAX_PAGE_SIZE = 50
+# Smallest share of trigrams shared with the query for a fuzzy match
+FUZZY_SIMILARITY = 0.3
+# Trigrams this common say little about a typo and cost a lot to count
+MAX_FUZZY_POSTINGS = 50_000
+
+EXACT, PREFIX, SUBSTRING, FUZZY = range(4)
+MATCH_TYPES = ("exact", "prefix", "substring", "fuzzy")
+
+SearchPage = namedtuple("SearchPage", ["users", "total", "truncated"])
+
+logger = Logger(child=True)
+
+
+def trigrams(key):
+    return {key[i : i + 3] for i in range(len(key) - 2)}
+
+
+class UsernameIndex:
+    """Prefix and trigram index over ``(user_id, username)`` pairs.
+
+    Documents are append-only: a renamed user gets a new document and the old
+    one is blanked out, so posting lists stay sorted and never shift.
+    """
+
+    def __init__(self):
+        self.names = []  # document -> username, None once replaced
+        self.user_ids = array("q")  # document -> user id
+        self.documents = {}  # user id -> live document
+        self.sorted_keys = []  # lower-cased usernames in order
+        self.sorted_documents = array("I")
+        self.postings = {}  # trigram -> array of documents
+
+    @classmethod
+    def build(cls, rows):
+        """Index ``(user_id, username)`` rows in one pass."""
+        index = cls()
+        for user_id, username in rows:
+            index._add_document(user_id, username)
+        ordered = sorted(
+            (name.lower(), document)
+            for document, name in enumerate(index.names)
+            if name is not None
+        )
+        index.sorted_keys = [key for key, _ in ordered]
+        index.sorted_documents = array("I", (document for _, document in ordered))
+        return index
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _add_document(self, user_id, username):
+        previous = self.documents.pop(user_id, None)
+        if previous is not None:
+            self.names[previous] = None
+        if username is None:
+            return None
+        document = len(self.names)
+        self.names.append(username)
+        self.user_ids.append(user_id)
+        self.documents[user_id] = document
+        for trigram in trigrams(username.lower()):
+            postings = self.postings.get(trigram)
+            if postings is None:
+                postings = self.postings[trigram] = array("I")
+            postings.append(document)
+        return document
+
+    def set_username(self, user_id, username):
+        """Add a user or change their username (None removes them)."""
+        previous = self.documents.get(user_id)
+        if previous is not None and self.names[previous] == username:
+            return
+        document = self._add_document(user_id, username)
+        if document is not None:
+            key = username.lower()
+            position = bisect_left(self.sorted_keys, key)
+            self.sorted_keys.insert(position, key)
+            self.sorted_documents.insert(position, document)
+
+    def _rank(self, document, match, detail):
+        key = self.names[document].lower()
+        if match == PREFIX:
+            # Completions read best in alphabetical order, which is also the
+            # order they are collected in if the search is cut short
+            return (match, 0, 0, key)
+        return (match, detail, len(key), key)
+
+    def search(self, query, offset=0, limit=20, budget_ms=SEARCH_LATENCY_BUDGET_MS):
+        """Return a ``SearchPage`` of ``(user_id, username, match_type)``."""
+        key = query.strip().lower()
+        deadline = time.perf_counter() + budget_ms / 1000
+        matches = {}
+        truncated = False
+        names = self.names
+
+        # Prefix matches are a contiguous run of the sorted array
+        keys = self.sorted_keys
+        position = bisect_left(keys, key)
+        while position < len(keys) and keys[position].startswith(key):
+            document = self.sorted_documents[position]
+            if names[document] is not None:
+                match = EXACT if keys[position] == key else PREFIX
+                matches[document] = self._rank(document, match, 0)
+                if len(matches) >= MAX_RANKED_MATCHES:
+                    truncated = True
+                    break
+            position += 1
+
+        query_trigrams = trigrams(key)
+        if query_trigrams and not truncated:
+            truncated = self._substring_matches(key, query_trigrams, matches, deadline)
+        if query_trigrams and not truncated and len(matches) < offset + limit:
+            truncated = self._fuzzy_matches(query_trigrams, matches, deadline)
+
+        ranked = sorted(matches.items(), key=lambda item: item[1])
+        users = [
+            (self.user_ids[document], names[document], MATCH_TYPES[rank[0]])
+            for document, rank in ranked[offset : offset + limit]
+        ]
+        return SearchPage(users, len(matches), truncated)
+
+    def _substring_matches(self, key, query_trigrams, matches, deadline):
+        """Add usernames containing ``key``, checking only the documents of
+        its rarest trigram. Returns whether the search was cut short."""
+        postings = [self.postings.get(trigram) for trigram in query_trigrams]
+        if not all(postings):
+            return False
+        names = self.names
+        for checked, document in enumerate(min(postings, key=len)):
+            if checked % 1024 == 0 and time.perf_counter() > deadline:
+                return True
+            name = names[document]
+            if document in matches or name is None:
+                continue
+            at = name.lower().find(key)
+            if at >= 0:
+                matches[document] = self._rank(document, SUBSTRING, at)
+                if len(matches) >= MAX_RANKED_MATCHES:
+                    return True
+        return False
+
+    def _fuzzy_matches(self, query_trigrams, matches, deadline):
+        """Add usernames sharing at least ``FUZZY_SIMILARITY`` of their
+        trigrams with the query. Returns whether the search was cut short."""
+        shared = Counter()
+        for trigram in query_trigrams:
+            postings = self.postings.get(trigram)
+            if postings is None or len(postings) > MAX_FUZZY_POSTINGS:
+                continue
+            if time.perf_counter() > deadline:
+                return True
+            shared.update(postings)
+
+        names = self.names
+        for document, count in shared.items():
+            name = names[document]
+            if document in matches or name is None:
+                continue
+            similarity = count / (
+                len(query_trigrams) + len(trigrams(name.lower())) - count
+            )
+            if similarity >= FUZZY_SIMILARITY:
+                matches[document] = self._rank(document, FUZZY, -similarity)
+                if len(matches) >= MAX_RANKED_MATCHES:
+                    return True
+        return False
+
+
+class UserSearch:
+    """The process-wide index plus its high-water mark on ``users``."""
+
+    def __init__(self):
+        self.index = None
+        self.high_water_mark = None
+        self.refreshed_at = 0.0
+        self._lock = Lock()
+
+    def _load(self, cur):
+        cur.execute("SELECT max(updated_at) FROM users")
+        self.high_water_mark = cur.fetchone()[0]
+        cur.execute("SELECT id, username FROM users WHERE username IS NOT NULL")
+
+        def rows():
+            while True:
+                batch = cur.fetchmany(10_000)
+                if not batch:
+                    return
+                yield from batch
+
+        self.index = UsernameIndex.build(rows())
+
+    def _catch_up(self, cur):
+        cur.execute(
+            """
+            SELECT id, username, updated_at FROM users
+            WHERE updated_at > %s
+            ORDER BY updated_at
+            """,
+            (self.high_water_mark - REFRESH_OVERLAP,),
+        )
+        rows = cur.fetchall()
+        for user_id, username, _ in rows:
+            self.index.set_username(user_id, username)
+        if rows:
+            self.high_water_mark = max(self.high_water_mark, rows[-1][2])
+
+    def refresh(self, force=False):
+        """Build the index on first use, then apply the username changes since
+        the high-water mark at most once per ``USER_INDEX_REFRESH``."""
+        with self._lock:
+            now = time.monotonic()
+            if (
+                not force
+                and self.index is not None
+                and now < self.refreshed_at + USER_INDEX_REFRESH
+            ):
+                return
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    if self.index is None:
+                        self._load(cur)
+                    elif self.high_water_mark is not None:
+                        self._catch_up(cur)
+                    else:
+                        # The table was empty when loaded
+                        self._load(cur)
+            self.refreshed_at = now
+            logger.info(
+                "User search index refreshed",
+                extra={"users": len(self.index), "trigrams": len(self.index.postings)},
+            )
+
+    def search(self, query, offset, limit):
+        self.refresh()
+        return self.index.search(query, offset, limit)
+
+
+user_search = UserSearch()
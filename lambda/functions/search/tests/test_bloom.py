@@ -0,0 +1,41 @@
+import pytest
+
+from search.bloom import BloomFilter
+
+CAPACITY = 20_000
+PROBES = 50_000
+
+
+def usernames(prefix, count):
+    return [f"{prefix}_{i}" for i in range(count)]
+
+
+@pytest.mark.parametrize("error_rate", [0.01, 0.001])
+def test_false_positive_rate_at_capacity(error_rate):
+    bloom = BloomFilter.for_capacity(CAPACITY, error_rate)
+    taken = usernames("taken", CAPACITY)
+    bloom.update(taken)
+
+    assert all(name in bloom for name in taken)
+    false_positives = sum(name in bloom for name in usernames("free", PROBES))
+    # Sampling noise is a few percent of the rate at this many probes
+    assert false_positives / PROBES <= 1.5 * error_rate
+    assert bloom.estimated_false_positive_rate() <= 1.5 * error_rate
+
+
+def test_estimate_flags_a_filter_past_its_capacity():
+    error_rate = 0.01
+    bloom = BloomFilter.for_capacity(CAPACITY, error_rate)
+    bloom.update(usernames("taken", 3 * CAPACITY))
+    # UsernameFilter.refresh rebuilds a filter estimated past twice the rate
+    assert bloom.estimated_false_positive_rate() > 2 * error_rate
+
+
+def test_snapshot_bits_restore_the_same_filter():
+    bloom = BloomFilter.for_capacity(1000, 0.01)
+    bloom.update(usernames("taken", 1000))
+    restored = BloomFilter(
+        bloom.bit_count, bloom.hash_count, bytearray(bytes(bloom.bits)), 1000
+    )
+    names = usernames("taken", 1000) + usernames("free", 1000)
+    assert [name in restored for name in names] == [name in bloom for name in names]
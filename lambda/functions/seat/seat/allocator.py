@@ -0,0 +1,178 @@
+"""Seat allocation from an in-memory occupancy map per seat type.
+
+Every seat type is a ``SEAT_ROWS`` x ``SEATS_PER_ROW`` section. ``SeatMap``
+keeps an occupancy bitmap of the section and a list of the free seats with
+each seat's position in it, so picking a random free seat and marking a seat
+taken are both O(1) however full the section is.
+
+The maps are loaded from ``seat_to_user`` and reloaded when the section's
+``(count(*), max(updated_at))`` changes (see
+migrations/0010_seat_to_user_updated_at.sql), checked at most every
+``SEAT_MAP_TTL`` seconds. A seat released and another one taken between two
+checks leave the count as it was but not ``max(updated_at)``. Other containers
+allocate concurrently, so a seat is only ever claimed by inserting it, which
+the unique index from migrations/0005_seat_to_user_unique_seat.sql makes
+atomic; a seat someone else took in the meantime is marked taken and another
+one is tried.
+"""
+
+import os
+import random
+from array import array
+
+from shared.cache import VersionedCache
+
+SEAT_ROWS = 100
+SEATS_PER_ROW = 50
+SEAT_MAP_TTL = float(os.environ.get("SEAT_MAP_TTL", "60"))
+# Seats tried before giving up on a section that looked free but wasn't
+MAX_RESERVE_ATTEMPTS = 20
+
+
+class SectionFullError(Exception):
+    pass
+
+
+def seat_index(seat_row, seat_number):
+    return (seat_row - 1) * SEATS_PER_ROW + (seat_number - 1)
+
+
+def seat_position(index):
+    """``(seat_row, seat_number)`` of a seat index, both 1-based."""
+    row, number = divmod(index, SEATS_PER_ROW)
+    return row + 1, number + 1
+
+
+class SeatMap:
+    """Occupancy of one section: a bitmap plus a swap-remove free list."""
+
+    def __init__(self, taken=(), rows=SEAT_ROWS, seats_per_row=SEATS_PER_ROW):
+        self.size = rows * seats_per_row
+        self.occupied = bytearray((self.size + 7) // 8)
+        self.free = array("i", range(self.size))
+        # seat index -> position in self.free, -1 when taken
+        self.free_position = array("i", range(self.size))
+        for index in taken:
+            self.mark_taken(index)
+
+    def __len__(self):
+        return len(self.free)
+
+    def is_taken(self, index):
+        return bool(self.occupied[index >> 3] & (1 << (index & 7)))
+
+    def mark_taken(self, index):
+        position = self.free_position[index]
+        if position < 0:
+            return
+        last = self.free.pop()
+        if last != index:
+            self.free[position] = last
+            self.free_position[last] = position
+        self.free_position[index] = -1
+        self.occupied[index >> 3] |= 1 << (index & 7)
+
+    def release(self, index):
+        if self.free_position[index] >= 0:
+            return
+        self.free_position[index] = len(self.free)
+        self.free.append(index)
+        self.occupied[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def pick(self, rng=random):
+        """A random free seat index, without taking it."""
+        if not self.free:
+            raise SectionFullError("No free seats left in this section")
+        return self.free[rng.randrange(len(self.free))]
+
+    def occupancy(self):
+        return 1 - len(self.free) / self.size
+
+
+def _fetch_version(cur, seat_type_id):
+    cur.execute(
+        "SELECT count(*), max(updated_at) FROM seat_to_user WHERE seat_type_id = %s",
+        (seat_type_id,),
+    )
+    count, updated_at = cur.fetchone()
+    return f"{count}:{updated_at.isoformat() if updated_at else ''}"
+
+
+def _load(cur, seat_type_id):
+    version = _fetch_version(cur, seat_type_id)
+    cur.execute(
+        """
+        SELECT seat_row, seat_number FROM seat_to_user
+        WHERE seat_type_id = %s
+        """,
+        (seat_type_id,),
+    )
+    rows = cur.fetchall()
+    seat_map = SeatMap(
+        seat_index(seat_row, seat_number)
+        for seat_row, seat_number in rows
+        if 1 <= seat_row <= SEAT_ROWS and 1 <= seat_number <= SEATS_PER_ROW
+    )
+    return version, seat_map
+
+
+_seat_maps = {}
+
+
+def get_seat_map(cur, seat_type_id):
+    """The cached ``SeatMap`` of ``seat_type_id``. ``cur`` may be of any
+    cursor class, the map is read through a plain cursor of its connection."""
+    cache = _seat_maps.get(seat_type_id)
+    if cache is None:
+        cache = _seat_maps[seat_type_id] = VersionedCache(
+            _load, _fetch_version, SEAT_MAP_TTL
+        )
+    with cur.connection.cursor() as plain_cur:
+        return cache.get(plain_cur, seat_type_id)
+
+
+def suggest_seat(cur, seat_type_id):
+    """A free ``(seat_row, seat_number)`` in the section, not reserved."""
+    return seat_position(get_seat_map(cur, seat_type_id).pick())
+
+
+def reserve_seat(cur, user_id, seat_type_id):
+    """Claim a free seat of ``seat_type_id`` for ``user_id`` and return its
+    ``seat_to_user`` row as ``(id, seat_row, seat_number)``.
+
+    Each attempt is a single ``INSERT ... ON CONFLICT DO NOTHING``, so two
+    concurrent reservations can never get the same seat. Raises
+    ``SectionFullError`` if no seat could be claimed.
+
+    The seat stays free in this container's map: the caller's transaction
+    may still roll back. Call ``mark_reserved`` once it has committed.
+    """
+    seat_map = get_seat_map(cur, seat_type_id)
+    with cur.connection.cursor() as plain_cur:
+        for _ in range(MAX_RESERVE_ATTEMPTS):
+            index = seat_map.pick()
+            seat_row, seat_number = seat_position(index)
+            plain_cur.execute(
+                """
+                INSERT INTO seat_to_user (user_id, seat_type_id, seat_row, seat_number)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (seat_type_id, seat_row, seat_number) DO NOTHING
+                RETURNING id
+                """,
+                (user_id, seat_type_id, seat_row, seat_number),
+            )
+            row = plain_cur.fetchone()
+            if row is not None:
+                return row[0], seat_row, seat_number
+            # Taken by another container since the last load
+            seat_map.mark_taken(index)
+    raise SectionFullError("Could not reserve a seat in this section")
+
+
+def mark_reserved(seat_type_id, seat_row, seat_number):
+    """Mark a seat that ``reserve_seat`` claimed taken in this container's
+    map, after the reserving transaction committed."""
+    cache = _seat_maps.get(seat_type_id)
+    seat_map = cache.peek() if cache is not None else None
+    if seat_map is not None:
+        seat_map.mark_taken(seat_index(seat_row, seat_number))
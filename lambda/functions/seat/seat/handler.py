@@ -1,30 +1,50 @@
 # force build comment 2683534907
 from shared.db import get_db_connection
-from shared.models import SeatType, Seat, SeatAssignment
+from shared.models import Seat, SeatAssignment
+from shared.queries import execute, register
+from shared.utils import dumps, error_response, json_response, resolve
+from .allocator import SectionFullError, mark_reserved, reserve_seat, suggest_seat
+from .seat_types import get_seat_type_catalog, seat_rank
 
-import json
-import traceback
+from psycopg2 import errors
 from psycopg2.extras import RealDictCursor
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.event_handler import APIGatewayRestResolver
+from aws_lambda_powertools.event_handler.api_gateway import Response
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
-from aws_lambda_powertools.utilities.parser import parse
+from aws_lambda_powertools.utilities.parser import ValidationError, parse
 
 logger = Logger()
 tracer = Tracer()
-app = APIGatewayRestResolver(strip_prefixes=["/v1/seat"])
+app = APIGatewayRestResolver(strip_prefixes=["/v1/seat"], serializer=dumps)
+
+SEAT_FOR_USER = register(
+    "seat_for_user",
+    """
+    SELECT stu.id, stu.user_id, stu.seat_type_id, stu.seat_row, stu.seat_number
+    FROM seat_to_user stu
+    WHERE stu.user_id = %s
+    """,
+)
+RELEASE_SEAT = register(
+    "release_seat",
+    "DELETE FROM seat_to_user WHERE id = %s",
+)
+INVITE_CODE_SEAT_TYPE = register(
+    "invite_code_seat_type",
+    "SELECT ic.seat_type_id FROM invite_codes ic WHERE ic.code = %s",
+)
 
 
 @app.get("/seat-types")
 @tracer.capture_method
 def get_seat_types():
-    with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT * FROM seat_types")
-            seat_types = cur.fetchall()
-    return {"seat_types": [SeatType(**st) for st in seat_types]}
+    catalog = get_seat_type_catalog()
+    if app.current_event.get_header_value("If-None-Match") == catalog.etag:
+        return Response(status_code=304, headers={"ETag": catalog.etag})
+    return json_response(200, catalog.body, headers={"ETag": catalog.etag})
 
 
 @app.get("/seat/{user_id}")
@@ -32,25 +52,15 @@ def get_seat_types():
 def get_seat_for_user(user_id: int):
     with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT stu.id, stu.user_id, stu.seat_type_id, stu.seat_row, stu.seat_number
-                FROM seat_to_user stu
-                WHERE stu.user_id = %s
-            """,
-                (user_id,),
-            )
+            execute(cur, SEAT_FOR_USER, (user_id,))
             result = cur.fetchone()
 
             if not result:
-                return {
-                    "statusCode": 404,
-                    "body": json.dumps({"error": "No seat found for the given user"}),
-                }
+                return error_response(404, "No seat found for the given user")
 
             seat = Seat(**result)
 
-            return {"statusCode": 200, "body": json.dumps({"seat": seat.model_dump()})}
+            return json_response(200, {"seat": seat.model_dump()})
 
 
 @app.get("/seat-for-invite-code/{invite_code}")
@@ -59,54 +69,129 @@ def get_seat_for_invite_code(invite_code: str):
     with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             # Get the seat type associated with the invite code
-            cur.execute(
-                """
-                SELECT ic.seat_type_id
-                FROM invite_codes ic
-                WHERE ic.code = %s
-            """,
-                (invite_code,),
-            )
+            execute(cur, INVITE_CODE_SEAT_TYPE, (invite_code,))
             result = cur.fetchone()
 
             if not result:
-                return {
-                    "statusCode": 404,
-                    "body": json.dumps({"error": "Invite code not found"}),
-                }
+                return error_response(404, "Invite code not found")
 
             seat_type_id = result["seat_type_id"]
 
-            # Generate random seat row and number
-            import random
-
-            seat_row = random.randint(1, 100)  # Adjust range as needed
-            seat_number = random.randint(1, 50)  # Adjust range as needed
-
-            return {
-                "statusCode": 200,
-                "body": json.dumps(
-                    {
-                        "seat": {
-                            "seat_row": seat_row,
-                            "seat_number": seat_number,
-                            "seat_type_id": seat_type_id,
-                        }
+            # Suggest a seat that is actually free, /assign reserves it
+            try:
+                seat_row, seat_number = suggest_seat(cur, seat_type_id)
+            except SectionFullError:
+                return error_response(409, "No seats left for this invite code")
+
+            return json_response(
+                200,
+                {
+                    "seat": {
+                        "seat_row": seat_row,
+                        "seat_number": seat_number,
+                        "seat_type_id": seat_type_id,
                     }
-                ),
-            }
+                },
+            )
+
+
+def seat_response(seat_id, user_id, seat_type_id, seat_row, seat_number):
+    seat = Seat(
+        id=seat_id,
+        user_id=user_id,
+        seat_type_id=seat_type_id,
+        seat_row=seat_row,
+        seat_number=seat_number,
+    )
+    return json_response(200, {"seat": seat.model_dump()})
 
 
 @app.post("/assign")
 @tracer.capture_method
 def assign_seat():
-    # private
+    """Reserve a free seat of the requested seat type for a user without a
+    seat. See allocator.py."""
+    try:
+        assignment = parse(event=app.current_event.body, model=SeatAssignment)
+    except ValidationError as e:
+        return error_response(400, f"Invalid seat assignment: {str(e)}")
+
+    if assignment.seat_type_id not in get_seat_type_catalog().by_id:
+        return error_response(404, "Seat type not found")
+
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                execute(cur, SEAT_FOR_USER, (assignment.user_id,))
+                if cur.fetchone():
+                    return error_response(409, "User already has a seat")
+
+                try:
+                    seat_id, seat_row, seat_number = reserve_seat(
+                        cur, assignment.user_id, assignment.seat_type_id
+                    )
+                except SectionFullError:
+                    return error_response(409, "No seats left for this seat type")
+    except errors.UniqueViolation:
+        # A concurrent /assign for the same user committed first, see
+        # migrations/0011_seat_to_user_unique_user.sql
+        return error_response(409, "User already has a seat")
+
+    mark_reserved(assignment.seat_type_id, seat_row, seat_number)
+    return seat_response(
+        seat_id, assignment.user_id, assignment.seat_type_id, seat_row, seat_number
+    )
 
 
 @app.post("/upgrade")
 @tracer.capture_method
 def upgrade_seat():
-    # private
+    """Move a user to a free seat of a higher seat type. The old seat is
+    released in the same transaction, so the user keeps it when the new
+    section is full."""
+    try:
+        assignment = parse(event=app.current_event.body, model=SeatAssignment)
+    except ValidationError as e:
+        return error_response(400, f"Invalid seat assignment: {str(e)}")
+
+    catalog = get_seat_type_catalog()
+    new_type = catalog.by_id.get(assignment.seat_type_id)
+    if new_type is None:
+        return error_response(404, "Seat type not found")
+
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            execute(cur, SEAT_FOR_USER, (assignment.user_id,))
+            current = cur.fetchone()
+            if not current:
+                return error_response(404, "No seat found for the given user")
+
+            current_type = catalog.by_id.get(current["seat_type_id"])
+            try:
+                upgrade = is_upgrade(
+                    current_type.name if current_type else None, new_type.name
+                )
+            except ValueError as e:
+                return error_response(400, str(e))
+            if not upgrade:
+                return error_response(
+                    400, f"{new_type.name} is not an upgrade of the current seat"
+                )
+
+            execute(cur, RELEASE_SEAT, (current["id"],))
+            try:
+                seat_id, seat_row, seat_number = reserve_seat(
+                    cur, assignment.user_id, new_type.id
+                )
+            except SectionFullError:
+                # Give the old seat back
+                conn.rollback()
+                return error_response(409, "No seats left for this seat type")
+
+    mark_reserved(new_type.id, seat_row, seat_number)
+    return seat_response(
+        seat_id, assignment.user_id, new_type.id, seat_row, seat_number
+    )
 
 
 @logger.inject_lambda_context(correlation_id_path=correlation_paths.API_GATEWAY_REST)
@@ -114,24 +199,8 @@ def upgrade_seat():
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     logger.info("Lambda handler invoked")
 
-    try:
-        return app.resolve(event, context)
-    except Exception as e:
-        logger.error(f"An error occurred in the lambda handler: {str(e)}")
-        logger.error(f"Exception type: {type(e).__name__}")
-        logger.error(f"Exception traceback: {traceback.format_exc()}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps(
-                {
-                    "error": "An internal server error occurred",
-                    "details": str(e),
-                    "type": type(e).__name__,
-                }
-            ),
-        }
+    return resolve(app, event, context)
 
 
 def is_upgrade(current_type, new_type):
-    seat_hierarchy = ["basic", "golden", "creator"]
-    return seat_hierarchy.index(new_type) > seat_hierarchy.index(current_type)
+    return seat_rank(new_type) > seat_rank(current_type)
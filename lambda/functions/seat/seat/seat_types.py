@@ -0,0 +1,80 @@
+"""In-container catalog of seat types.
+
+``seat_types`` holds a handful of rows that almost never change, so it is
+loaded once into an immutable lookup table keyed by id and by name, together
+with each type's rank in ``SEAT_HIERARCHY`` and the pre-rendered
+``/seat-types`` body. Every ``SEAT_TYPE_CATALOG_TTL`` seconds the rows are
+compared with the cached ones and the table is only rebuilt if they changed.
+"""
+
+import hashlib
+import os
+from collections import namedtuple
+from types import MappingProxyType
+
+from shared.cache import VersionedCache
+from shared.db import with_cursor
+from shared.models import SeatType
+from shared.utils import dumps
+
+SEAT_TYPE_CATALOG_TTL = float(os.environ.get("SEAT_TYPE_CATALOG_TTL", "300"))
+
+# Lowest to highest, a move to a later type is an upgrade
+SEAT_HIERARCHY = ("basic", "golden", "creator")
+SEAT_RANKS = MappingProxyType({name: rank for rank, name in enumerate(SEAT_HIERARCHY)})
+
+SeatTypeInfo = namedtuple("SeatTypeInfo", ["id", "name", "rank"])
+SeatTypeCatalog = namedtuple("SeatTypeCatalog", ["by_id", "by_name", "body", "etag"])
+
+
+def _fetch_rows(cur):
+    cur.execute("SELECT id, name FROM seat_types ORDER BY id")
+    return tuple(cur.fetchall())
+
+
+def _load(cur):
+    rows = _fetch_rows(cur)
+    seat_types = [
+        SeatTypeInfo(seat_type_id, name, SEAT_RANKS.get(name))
+        for seat_type_id, name in rows
+    ]
+    body = dumps(
+        {
+            "seat_types": [
+                SeatType(id=seat_type.id, name=seat_type.name).model_dump()
+                for seat_type in seat_types
+            ]
+        }
+    )
+    return rows, SeatTypeCatalog(
+        by_id=MappingProxyType({seat_type.id: seat_type for seat_type in seat_types}),
+        by_name=MappingProxyType(
+            {seat_type.name: seat_type for seat_type in seat_types}
+        ),
+        body=body,
+        etag='"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"',
+    )
+
+
+_catalog = VersionedCache(
+    with_cursor(_load), with_cursor(_fetch_rows), SEAT_TYPE_CATALOG_TTL
+)
+
+
+def get_seat_type_catalog(cur=None):
+    """Return the cached ``SeatTypeCatalog``, revalidating it through ``cur``
+    when the TTL has run out."""
+    return _catalog.get(cur)
+
+
+def invalidate_seat_type_catalog():
+    _catalog.invalidate()
+
+
+def seat_rank(seat_type):
+    """Rank of a seat type name in ``SEAT_HIERARCHY``. Raises ValueError for a
+    name outside the hierarchy."""
+    try:
+        return SEAT_RANKS[seat_type]
+    except KeyError:
+        raise ValueError(f"Unknown seat type: {seat_type}") from None
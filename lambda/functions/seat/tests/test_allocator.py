@@ -0,0 +1,201 @@
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from seat import allocator
+from seat.allocator import (
+    SEAT_ROWS,
+    SEATS_PER_ROW,
+    SeatMap,
+    SectionFullError,
+    mark_reserved,
+    reserve_seat,
+    seat_index,
+    seat_position,
+)
+
+
+def assert_consistent(seat_map):
+    """The bitmap, the free list and the positions describe the same seats."""
+    free = list(seat_map.free)
+    assert len(set(free)) == len(free)
+    for index in range(seat_map.size):
+        position = seat_map.free_position[index]
+        if seat_map.is_taken(index):
+            assert position == -1
+        else:
+            assert free[position] == index
+    assert len(free) == sum(not seat_map.is_taken(i) for i in range(seat_map.size))
+
+
+def test_seat_index_round_trips():
+    for seat_row in range(1, SEAT_ROWS + 1):
+        for seat_number in (1, SEATS_PER_ROW):
+            index = seat_index(seat_row, seat_number)
+            assert 0 <= index < SEAT_ROWS * SEATS_PER_ROW
+            assert seat_position(index) == (seat_row, seat_number)
+
+
+def test_initial_taken_seats():
+    seat_map = SeatMap([0, 7, 8, 4999])
+    assert len(seat_map) == 5000 - 4
+    assert [seat_map.is_taken(i) for i in (0, 1, 7, 8, 9, 4999)] == [
+        True,
+        False,
+        True,
+        True,
+        False,
+        True,
+    ]
+    assert seat_map.occupancy() == pytest.approx(4 / 5000)
+    assert_consistent(seat_map)
+
+
+def test_random_takes_and_releases_stay_consistent():
+    rng = random.Random(0)
+    seat_map = SeatMap(rows=10, seats_per_row=10)
+    taken = set()
+    for _ in range(2000):
+        index = rng.randrange(seat_map.size)
+        if rng.random() < 0.6:
+            seat_map.mark_taken(index)
+            taken.add(index)
+        else:
+            seat_map.release(index)
+            taken.discard(index)
+    assert {i for i in range(seat_map.size) if seat_map.is_taken(i)} == taken
+    assert_consistent(seat_map)
+
+
+def test_marking_twice_is_a_no_op():
+    seat_map = SeatMap(rows=1, seats_per_row=4)
+    seat_map.mark_taken(2)
+    seat_map.mark_taken(2)
+    seat_map.release(1)
+    assert len(seat_map) == 3
+    assert_consistent(seat_map)
+
+
+def test_pick_only_returns_free_seats_until_full():
+    seat_map = SeatMap(rows=3, seats_per_row=7)
+    picked = []
+    while len(seat_map):
+        index = seat_map.pick(random.Random(len(picked)))
+        assert not seat_map.is_taken(index)
+        seat_map.mark_taken(index)
+        picked.append(index)
+    assert sorted(picked) == list(range(21))
+    assert seat_map.occupancy() == 1
+    with pytest.raises(SectionFullError):
+        seat_map.pick()
+
+
+class FakeSection:
+    """``seat_to_user`` of one section behind the cursor calls the allocator
+    makes. ``stolen`` seats are taken by another container after the map was
+    loaded."""
+
+    def __init__(self, taken=(), stolen=()):
+        self.seats = {index: 100 + n for n, index in enumerate(taken)}
+        self.stolen = set(stolen)
+        self.updated_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.inserts = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, section):
+        self.section = section
+        self.connection = section
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params):
+        section = self.section
+        if sql.startswith("SELECT count(*)"):
+            self.result = [(len(section.seats), section.updated_at)]
+        elif "SELECT seat_row, seat_number" in sql:
+            self.result = [seat_position(index) for index in section.seats]
+        else:
+            section.inserts += 1
+            user_id, _, seat_row, seat_number = params
+            index = seat_index(seat_row, seat_number)
+            if index in section.stolen:
+                section.seats[index] = -1
+            if index in section.seats:
+                self.result = []
+            else:
+                section.seats[index] = user_id
+                self.result = [(1000 + index,)]
+
+    def fetchone(self):
+        return self.result.pop(0) if self.result else None
+
+    def fetchall(self):
+        result, self.result = self.result, []
+        return result
+
+
+@pytest.fixture(autouse=True)
+def fresh_seat_maps(monkeypatch):
+    monkeypatch.setattr(allocator, "_seat_maps", {})
+
+
+def test_reserve_takes_a_free_seat():
+    section = FakeSection(taken=range(0, 5000, 2))
+    seat_id, seat_row, seat_number = reserve_seat(section.cursor(), 42, 1)
+    index = seat_index(seat_row, seat_number)
+    assert index % 2 == 1
+    assert section.seats[index] == 42
+    assert seat_id == 1000 + index
+
+
+def test_reserve_skips_seats_taken_since_the_load():
+    free = [4997, 4998, 4999]
+    section = FakeSection(taken=range(4997), stolen=free[:2])
+    _, seat_row, seat_number = reserve_seat(section.cursor(), 42, 1)
+    assert seat_index(seat_row, seat_number) == free[2]
+    assert section.seats[free[2]] == 42
+    assert section.inserts <= 3
+
+
+def test_reserve_in_a_full_section():
+    section = FakeSection(taken=range(5000))
+    with pytest.raises(SectionFullError):
+        reserve_seat(section.cursor(), 42, 1)
+    assert section.inserts == 0
+
+
+def test_reserved_seats_are_never_handed_out_twice():
+    section = FakeSection(taken=range(4900))
+    reserved = set()
+    for user_id in range(100):
+        _, seat_row, seat_number = reserve_seat(section.cursor(), user_id, 1)
+        reserved.add(seat_index(seat_row, seat_number))
+    assert reserved == set(range(4900, 5000))
+    with pytest.raises(SectionFullError):
+        reserve_seat(section.cursor(), 100, 1)
+
+
+def test_seats_are_marked_only_once_reserved():
+    section = FakeSection(taken=range(4999))
+    _, seat_row, seat_number = reserve_seat(section.cursor(), 42, 1)
+    seat_map = allocator._seat_maps[1].peek()
+    # The reserving transaction may still roll back
+    assert not seat_map.is_taken(seat_index(seat_row, seat_number))
+    mark_reserved(1, seat_row, seat_number)
+    assert seat_map.is_taken(seat_index(seat_row, seat_number))
+    assert_consistent(seat_map)
+
+
+def test_marking_a_seat_type_that_was_never_loaded():
+    mark_reserved(3, 1, 1)
+    assert 3 not in allocator._seat_maps
@@ -0,0 +1,141 @@
+"""asyncpg counterpart of db.py, used by functions that set ``DB_ASYNC``.
+
+Lambda calls the handler synchronously, so routes stay plain functions and
+hand their queries to ``run()``, which drives a coroutine on an event loop
+that lives as long as the container. The asyncpg pool belongs to that loop and
+is reused across invocations like the psycopg2 one. Within a coroutine,
+queries that don't depend on each other are awaited together with
+``asyncio.gather`` and run on separate pooled connections, so a route waits
+for the slowest of them instead of their sum.
+
+The helpers below run one statement each outside an explicit transaction and
+are meant for reads. asyncpg uses ``$1`` placeholders instead of ``%s`` and
+does not cast parameters implicitly, so pass ints for integer columns.
+"""
+
+import asyncio
+import time
+
+from aws_lambda_powertools import Logger
+
+from .constants import (
+    DB_NAME,
+    DB_USER,
+    DB_PASSWORD,
+    DB_HOST,
+    DB_PORT,
+    DB_POOL_MAX_CONNECTIONS,
+    DB_POOL_HEALTHCHECK_INTERVAL,
+    DB_POOL_ACQUIRE_TIMEOUT,
+    DB_CONNECT_TIMEOUT,
+)
+from .db import DatabaseError
+from .lazy import lazy_import
+from .metrics import record_connect, record_query
+
+# Only executed once a pool is created, functions without DB_ASYNC never pay
+# for it at init
+try:
+    asyncpg = lazy_import("asyncpg")
+except ImportError:  # pragma: no cover - only needed with DB_ASYNC
+    asyncpg = None
+
+logger = Logger(child=True)
+
+_loop = None
+_pool = None  # task creating the pool, shared by concurrent first callers
+
+
+def run(coro):
+    """Run ``coro`` to completion on the container's event loop."""
+    global _loop, _pool
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        _pool = None
+    return _loop.run_until_complete(coro)
+
+
+async def _create_pool():
+    if asyncpg is None:
+        raise DatabaseError("DB_ASYNC is set but asyncpg is not installed")
+    try:
+        return await asyncpg.create_pool(
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            port=int(DB_PORT),
+            min_size=0,
+            max_size=DB_POOL_MAX_CONNECTIONS,
+            timeout=DB_CONNECT_TIMEOUT,
+            # Idle connections are closed rather than pinged before reuse
+            max_inactive_connection_lifetime=DB_POOL_HEALTHCHECK_INTERVAL,
+        )
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+        logger.error(f"Failed to connect to the database: {str(e)}")
+        raise DatabaseError("Unable to establish database connection") from e
+
+
+async def get_async_pool():
+    global _pool
+    if _pool is None:
+        _pool = asyncio.ensure_future(_create_pool())
+    try:
+        return await _pool
+    except Exception:
+        _pool = None
+        raise
+
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = await _pool, None
+        await pool.close()
+
+
+def _count_rows(result):
+    if isinstance(result, list):
+        return len(result)
+    return 0 if result is None else 1
+
+
+async def _query(method, query, args):
+    start = time.perf_counter()
+    pool = await get_async_pool()
+    # The idle timeout only fires while the loop runs, so a connection can
+    # still be handed out once after the container was frozen; retry once
+    for attempt in range(2):
+        try:
+            async with pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT) as conn:
+                acquired = time.perf_counter()
+                record_connect((acquired - start) * 1000)
+                result = await getattr(conn, method)(query, *args)
+                record_query(
+                    (time.perf_counter() - acquired) * 1000, _count_rows(result)
+                )
+                return result
+        except (asyncpg.ConnectionDoesNotExistError, ConnectionError) as e:
+            if attempt:
+                logger.error(f"Database connection lost: {str(e)}")
+                raise DatabaseError("Database connection lost") from e
+            logger.info(f"Retrying on a new connection: {str(e)}")
+        except asyncio.TimeoutError as e:
+            raise DatabaseError("Timed out waiting for a pooled connection") from e
+        except asyncpg.PostgresError as e:
+            logger.error(f"Query failed: {str(e)}")
+            raise DatabaseError("A database error occurred") from e
+
+
+async def fetch(query, *args):
+    """Return every row of ``query`` as a list of ``asyncpg.Record``, which
+    unpack like the tuples psycopg2 returns."""
+    return await _query("fetch", query, args)
+
+
+async def fetchrow(query, *args):
+    return await _query("fetchrow", query, args)
+
+
+async def fetchval(query, *args):
+    return await _query("fetchval", query, args)
@@ -0,0 +1,47 @@
+import time
+from threading import Lock
+
+
+class VersionedCache:
+    """Keep a rarely changing value in the Lambda container between invocations.
+
+    ``load(*args)`` returns ``(version, value)``. Once ``ttl`` seconds have
+    passed, ``fetch_version(*args)`` is asked for the current version and the
+    value is only reloaded if it changed, so an unchanged value costs one cheap
+    query per ``ttl``. ``invalidate()`` forces a full reload on the next read.
+    The arguments given to ``get`` are passed through to both callables, e.g.
+    the cursor of the caller's transaction.
+    """
+
+    def __init__(self, load, fetch_version, ttl):
+        self._load = load
+        self._fetch_version = fetch_version
+        self.ttl = ttl
+        self._version = None
+        self._value = None
+        self._expires_at = 0.0
+        self._lock = Lock()
+
+    def get(self, *args):
+        with self._lock:
+            now = time.monotonic()
+            if self._value is not None and now < self._expires_at:
+                return self._value
+            if self._value is not None and self._fetch_version(*args) == self._version:
+                self._expires_at = now + self.ttl
+                return self._value
+            self._version, self._value = self._load(*args)
+            self._expires_at = now + self.ttl
+            return self._value
+
+    def peek(self):
+        """The cached value as it is, without revalidating or loading it. None
+        if nothing is loaded."""
+        with self._lock:
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+            self._value = None
+            self._expires_at = 0.0
@@ -5,3 +5,15 @@ DB_USER = os.environ["DB_USER"]
 DB_PASSWORD = os.environ["DB_PASSWORD"]
 DB_HOST = os.environ["DB_HOST"]
 DB_PORT = os.environ["DB_PORT"]
+
+# Connection pool settings (per Lambda container)
+DB_POOL_MAX_CONNECTIONS = int(os.environ.get("DB_POOL_MAX_CONNECTIONS", "2"))
+DB_POOL_HEALTHCHECK_INTERVAL = float(
+    os.environ.get("DB_POOL_HEALTHCHECK_INTERVAL", "30")
+)
+DB_POOL_ACQUIRE_TIMEOUT = float(os.environ.get("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", "5"))
+
+# Set DB_ASYNC=true on a function to run its converted routes on asyncpg
+# (shared/aiodb.py) instead of psycopg2
+DB_ASYNC = os.environ.get("DB_ASYNC", "false").lower() == "true"
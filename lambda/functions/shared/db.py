@@ -1,8 +1,222 @@
+import time
+from contextlib import contextmanager
+from threading import Condition
+
 import psycopg2
-from .constants import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+from psycopg2 import extensions
+from aws_lambda_powertools import Logger
+
+from .constants import (
+    DB_NAME,
+    DB_USER,
+    DB_PASSWORD,
+    DB_HOST,
+    DB_PORT,
+    DB_POOL_MAX_CONNECTIONS,
+    DB_POOL_HEALTHCHECK_INTERVAL,
+    DB_POOL_ACQUIRE_TIMEOUT,
+    DB_CONNECT_TIMEOUT,
+)
+from .metrics import record_connect, timed_cursor
+from .queries import prepare_statements
+
+logger = Logger(child=True)
+
+
+class DatabaseError(Exception):
+    """Custom exception for database-related errors."""
+
+    pass
+
+
+class PooledConnection(extensions.connection):
+    """Connection that remembers which registered statements (queries.py) it
+    has prepared and hands out instrumented cursors."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+    def cursor(self, *args, **kwargs):
+        """Cursors time their statements and count fetched rows for the
+        request metrics (metrics.py), whatever ``cursor_factory`` is asked
+        for."""
+        factory = kwargs.get("cursor_factory") or self.cursor_factory
+        kwargs["cursor_factory"] = timed_cursor(factory or extensions.cursor)
+        return super().cursor(*args, **kwargs)
+
+
+class ConnectionPool:
+    """Pool of connections that lives for as long as the Lambda container.
+
+    Connections are opened lazily, capped at ``max_connections`` and checked
+    before reuse. A connection that has been idle for longer than
+    ``healthcheck_interval`` seconds is pinged first, since the socket may
+    have been dropped while the container was frozen between invocations.
+    Statements registered in queries.py are prepared on a connection before it
+    is handed out.
+    """
+
+    def __init__(
+        self,
+        max_connections=DB_POOL_MAX_CONNECTIONS,
+        healthcheck_interval=DB_POOL_HEALTHCHECK_INTERVAL,
+        acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+    ):
+        self.max_connections = max_connections
+        self.healthcheck_interval = healthcheck_interval
+        self.acquire_timeout = acquire_timeout
+        self._idle = []  # (connection, released_at)
+        self._open = 0
+        self._condition = Condition()
+
+    def _connect(self):
+        try:
+            return psycopg2.connect(
+                dbname=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                host=DB_HOST,
+                port=DB_PORT,
+                connect_timeout=DB_CONNECT_TIMEOUT,
+                keepalives=1,
+                keepalives_idle=30,
+                connection_factory=PooledConnection,
+            )
+        except psycopg2.Error as e:
+            logger.error(f"Failed to connect to the database: {str(e)}")
+            raise DatabaseError("Unable to establish database connection") from e
+
+    def _is_healthy(self, conn, released_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - released_at < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.info(f"Dropping stale pooled connection: {str(e)}")
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def acquire(self):
+        start = time.perf_counter()
+        try:
+            return self._acquire()
+        finally:
+            record_connect((time.perf_counter() - start) * 1000)
 
+    def _acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._condition:
+                while not self._idle and self._open >= self.max_connections:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DatabaseError("Timed out waiting for a pooled connection")
+                    self._condition.wait(remaining)
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                else:
+                    conn, released_at = None, None
+                    self._open += 1
 
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._forget()
+                    raise
+            elif not self._is_healthy(conn, released_at):
+                self._close(conn)
+                self._forget()
+                continue
+
+            prepare_statements(conn)
+            return conn
+
+    def release(self, conn):
+        status = (
+            extensions.TRANSACTION_STATUS_UNKNOWN
+            if conn.closed
+            else conn.get_transaction_status()
+        )
+        if status in (
+            extensions.TRANSACTION_STATUS_INTRANS,
+            extensions.TRANSACTION_STATUS_INERROR,
+        ):
+            try:
+                conn.rollback()
+                status = extensions.TRANSACTION_STATUS_IDLE
+            except psycopg2.Error:
+                status = extensions.TRANSACTION_STATUS_UNKNOWN
+
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            self._close(conn)
+            self._forget()
+            return
+
+        with self._condition:
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def _forget(self):
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    def close_all(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool()
+    return _pool
+
+
+@contextmanager
 def get_db_connection():
-    return psycopg2.connect(
-        dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
-    )
+    """Borrow a pooled connection for the duration of a ``with`` block.
+
+    The block runs in a transaction that is committed on success and rolled
+    back on error, and the connection goes back to the pool afterwards.
+    """
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.release(conn)
+
+
+def with_cursor(query):
+    """Wrap ``query(cur, *args)`` so it runs on the caller's cursor, or on a
+    borrowed connection when the caller passes ``None`` (a cache that is still
+    fresh then never touches the database)."""
+
+    def run(cur, *args):
+        if cur is not None:
+            return query(cur, *args)
+        with get_db_connection() as conn:
+            with conn.cursor() as own_cur:
+                return query(own_cur, *args)
+
+    return run
@@ -0,0 +1,66 @@
+from bisect import bisect_left
+from threading import Lock
+
+# Upper bounds of the buckets, doubling from 0.05 to about 26000 (50µs to 26s
+# for latencies in ms); anything larger lands in a final overflow bucket
+BUCKET_BOUNDS = tuple(0.05 * 2**i for i in range(20))
+
+
+class Histogram:
+    """Histogram of latencies (or counts) with fixed log-spaced buckets.
+
+    Recording is O(log buckets) and the memory use is constant, so a warm
+    container can keep one per statement or route metric indefinitely. Percentiles
+    are reported as the upper bound of the bucket they fall in, i.e. within a
+    factor of two.
+    """
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def record(self, value):
+        bucket = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.bounds[bucket] if bucket < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        """Counts and summary statistics as a JSON-friendly dict. Buckets are
+        keyed by their upper bound and empty ones are left out."""
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.total
+        bounds = [*self.bounds, float("inf")]
+        return {
+            "count": count,
+            "total": total,
+            "mean": total / count if count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": {f"{bound:g}": n for bound, n in zip(bounds, counts) if n},
+        }
@@ -0,0 +1,28 @@
+import importlib
+import importlib.util
+import os
+import sys
+
+# Set COLD_START_LAZY_IMPORTS=false to import everything eagerly at init, e.g.
+# to compare cold starts with benchmarks/cold_start.py
+LAZY_IMPORTS = os.environ.get("COLD_START_LAZY_IMPORTS", "true").lower() == "true"
+
+
+def lazy_import(name):
+    """Return module ``name`` but only execute it on first attribute access.
+
+    Used for heavy dependencies that only some routes need, so that a cold
+    start does not pay for them before a request actually uses them.
+    """
+    if name in sys.modules or not LAZY_IMPORTS:
+        return importlib.import_module(name)
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
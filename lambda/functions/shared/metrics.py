@@ -0,0 +1,289 @@
+"""Per-route latency, database time and row counts.
+
+``resolve()`` (utils.py) tracks every invocation; while the route runs, the
+pools, the cursors and ``dumps()`` add what they measured to it:
+
+- ``Latency``: the whole resolve, in ms
+- ``ConnectTime``: waiting for, opening or checking pooled connections
+- ``QueryTime`` and ``Queries``: time spent in and number of statements,
+  summed over statements that ran concurrently (aiodb.py)
+- ``RowsFetched``: rows read from cursors
+- ``SerializationTime``: ``dumps()`` calls
+- ``ColdStart``: 1 on the container's first invocation, 0 afterwards
+
+``METRICS_MODE`` selects what happens with them:
+
+- ``emf`` (default) prints one CloudWatch Embedded Metric Format line per
+  invocation, dimensioned by service and route and by service and cold/warm
+  start, and CloudWatch builds the percentiles from those,
+- ``file`` keeps a ``Histogram`` per route, start type and metric and writes
+  them as JSON to ``METRICS_FILE`` at exit or on ``dump_metrics()``, so runs
+  can be compared offline with ``python -m shared.metrics before.json
+  after.json``,
+- ``off`` records nothing.
+"""
+
+import atexit
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .histogram import Histogram
+
+METRICS_MODE = os.environ.get("METRICS_MODE", "emf").lower()
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Sandwatch")
+METRICS_FILE = os.environ.get("METRICS_FILE", "/tmp/sandwatch_metrics.json")
+SERVICE = os.environ.get(
+    "POWERTOOLS_SERVICE_NAME", os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
+)
+
+# Name, unit and RequestMetrics attribute of every metric
+METRICS = (
+    ("Latency", "Milliseconds", "latency"),
+    ("ConnectTime", "Milliseconds", "connect_ms"),
+    ("QueryTime", "Milliseconds", "query_ms"),
+    ("Queries", "Count", "queries"),
+    ("RowsFetched", "Count", "rows"),
+    ("SerializationTime", "Milliseconds", "serialize_ms"),
+    ("ColdStart", "Count", "cold_start"),
+)
+
+_current = ContextVar("request_metrics", default=None)
+_cold_start = True
+_instrumented = set()
+_histograms = {}  # (route, "cold" | "warm") -> {metric name: Histogram}
+
+
+class RequestMetrics:
+    __slots__ = (
+        "route",
+        "cold_start",
+        "status_code",
+        "latency",
+        "connect_ms",
+        "query_ms",
+        "queries",
+        "rows",
+        "serialize_ms",
+    )
+
+    def __init__(self, cold_start):
+        self.route = "unmatched"
+        self.cold_start = int(cold_start)
+        self.status_code = None
+        self.latency = 0.0
+        self.connect_ms = 0.0
+        self.query_ms = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.serialize_ms = 0.0
+
+
+def record_connect(ms):
+    request = _current.get()
+    if request is not None:
+        request.connect_ms += ms
+
+
+def record_query(ms, rows=0):
+    request = _current.get()
+    if request is not None:
+        request.query_ms += ms
+        request.queries += 1
+        request.rows += rows
+
+
+def record_rows(rows):
+    request = _current.get()
+    if request is not None:
+        request.rows += rows
+
+
+def record_serialization(ms):
+    request = _current.get()
+    if request is not None:
+        request.serialize_ms += ms
+
+
+class TimedCursor:
+    """Mixin for psycopg2 cursor classes that reports statement time and
+    fetched rows to the current request, see ``timed_cursor``."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query((time.perf_counter() - start) * 1000)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query((time.perf_counter() - start) * 1000)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            record_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany() if size is None else super().fetchmany(size)
+        record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        record_rows(len(rows))
+        return rows
+
+
+_timed_cursors = {}
+
+
+def timed_cursor(cursor_class):
+    """``cursor_class`` with ``TimedCursor`` mixed in, e.g. RealDictCursor."""
+    timed = _timed_cursors.get(cursor_class)
+    if timed is None:
+        timed = _timed_cursors[cursor_class] = type(
+            f"Timed{cursor_class.__name__}", (TimedCursor, cursor_class), {}
+        )
+    return timed
+
+
+def _record_route(app, next_middleware):
+    request = _current.get()
+    route = app.context.get("_route")
+    # Unknown paths get a catch-all route (".*"), keep those out of the
+    # dimensions so that scanners can't create a metric per path
+    if request is not None and route is not None and route.rule.pattern[1:2] == "/":
+        request.route = f"{route.method} {route.path}"
+    return next_middleware(app)
+
+
+@contextmanager
+def track_request(app):
+    """Collect the metrics of one invocation of ``app`` and publish them when
+    the block exits."""
+    global _cold_start
+    if METRICS_MODE == "off":
+        yield None
+        return
+    if id(app) not in _instrumented:
+        app.use(middlewares=[_record_route])
+        _instrumented.add(id(app))
+
+    request = RequestMetrics(_cold_start)
+    _cold_start = False
+    token = _current.set(request)
+    start = time.perf_counter()
+    try:
+        yield request
+    finally:
+        request.latency = (time.perf_counter() - start) * 1000
+        _current.reset(token)
+        _publish(request)
+
+
+def _publish(request):
+    if METRICS_MODE == "emf":
+        print(json.dumps(_emf(request), separators=(",", ":")))
+    elif METRICS_MODE == "file":
+        start = "cold" if request.cold_start else "warm"
+        histograms = _histograms.setdefault((request.route, start), {})
+        for name, _, attribute in METRICS:
+            if name != "ColdStart":
+                histograms.setdefault(name, Histogram()).record(
+                    getattr(request, attribute)
+                )
+
+
+def _emf(request):
+    body = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Service", "Route"], ["Service", "Start"]],
+                    "Metrics": [
+                        {"Name": name, "Unit": unit} for name, unit, _ in METRICS
+                    ],
+                }
+            ],
+        },
+        "Service": SERVICE,
+        "Route": request.route,
+        "Start": "cold" if request.cold_start else "warm",
+        "StatusCode": request.status_code,
+    }
+    for name, _, attribute in METRICS:
+        body[name] = getattr(request, attribute)
+    return body
+
+
+def metrics_snapshot():
+    """The file mode histograms as ``{route: {start: {metric: snapshot}}}``."""
+    snapshot = {}
+    for (route, start), histograms in sorted(_histograms.items()):
+        snapshot.setdefault(route, {})[start] = {
+            name: histogram.snapshot() for name, histogram in histograms.items()
+        }
+    return snapshot
+
+
+def dump_metrics(path=None):
+    """Write ``metrics_snapshot()`` to ``path`` (``METRICS_FILE``)."""
+    with open(path or METRICS_FILE, "w") as f:
+        json.dump({"service": SERVICE, "routes": metrics_snapshot()}, f, indent=2)
+
+
+def reset_metrics():
+    _histograms.clear()
+
+
+def _dump_at_exit():
+    if _histograms:
+        dump_metrics()
+
+
+if METRICS_MODE == "file":
+    atexit.register(_dump_at_exit)
+
+
+def compare(before_path, after_path):
+    """Print p50/p95 of every metric in two dumps side by side."""
+    with open(before_path) as f:
+        before = json.load(f)["routes"]
+    with open(after_path) as f:
+        after = json.load(f)["routes"]
+    for route in sorted(set(before) | set(after)):
+        for start in ("warm", "cold"):
+            old = before.get(route, {}).get(start, {})
+            new = after.get(route, {}).get(start, {})
+            if not old and not new:
+                continue
+            print(f"{route} ({start})")
+            for name, _, _ in METRICS:
+                if name not in old and name not in new:
+                    continue
+                columns = []
+                for stats in (old.get(name), new.get(name)):
+                    columns.append(
+                        f"p50={stats['p50']:9.3f} p95={stats['p95']:9.3f}"
+                        f" n={stats['count']:<6}"
+                        if stats
+                        else f"{'-':<36}"
+                    )
+                print(f"  {name:<18} {columns[0]} -> {columns[1]}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python -m shared.metrics before.json after.json")
+    compare(sys.argv[1], sys.argv[2])
@@ -0,0 +1,129 @@
+"""Registry of hot statements, prepared once per pooled connection.
+
+A statement is registered at import time under a name, with the usual
+psycopg2 ``%s`` placeholders::
+
+    SEAT_FOR_USER = register("seat_for_user", "SELECT ... WHERE user_id = %s")
+
+and run with ``execute(cur, SEAT_FOR_USER, (user_id,))``. When the pool hands
+out a connection it sends ``PREPARE seat_for_user AS ...`` for every
+registered statement that connection hasn't prepared yet, outside of any
+transaction so that a later rollback can't drop it. From then on each request
+only sends ``EXECUTE seat_for_user (...)`` and CockroachDB reuses the parsed
+and planned statement instead of redoing both.
+
+Every execution is timed into a per-statement ``Histogram``, see
+``statement_stats()``. Set ``DB_PREPARE_STATEMENTS=false`` to send the plain
+SQL instead, e.g. to compare the two with benchmarks/prepared_statements.py.
+The asyncpg path (aiodb.py) doesn't need this, asyncpg prepares and caches
+statements per connection by itself.
+"""
+
+import os
+import re
+import time
+
+import psycopg2
+from aws_lambda_powertools import Logger
+
+from .histogram import Histogram
+
+PREPARE_STATEMENTS = os.environ.get("DB_PREPARE_STATEMENTS", "true").lower() == "true"
+
+logger = Logger(child=True)
+
+
+class Statement:
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.arity = sql.count("%s")
+        numbered = iter(range(1, self.arity + 1))
+        self.prepare_sql = f"PREPARE {name} AS " + re.sub(
+            r"%s", lambda _: f"${next(numbered)}", sql
+        )
+        self.execute_sql = f"EXECUTE {name}" + (
+            f" ({', '.join(['%s'] * self.arity)})" if self.arity else ""
+        )
+        # Set when the server rejects the PREPARE, the plain SQL is used instead
+        self.disabled = False
+        self.histogram = Histogram()
+        self.prepare_histogram = Histogram()
+
+
+_statements = {}
+
+
+def register(name, sql):
+    """Register ``sql`` under ``name`` and return its ``Statement``. ``sql``
+    may only use positional ``%s`` placeholders."""
+    if not re.fullmatch(r"[a-z_][a-z0-9_]*", name):
+        raise ValueError(f"Invalid statement name: {name}")
+    if re.search(r"%\(|%%", sql):
+        raise ValueError(f"{name}: only positional %s placeholders are supported")
+    statement = _statements.get(name)
+    if statement is not None:
+        if statement.sql != sql:
+            raise ValueError(f"Statement {name} is already registered")
+        return statement
+    statement = _statements[name] = Statement(name, sql)
+    return statement
+
+
+def get_statement(name):
+    return _statements[name]
+
+
+def prepare_statements(conn):
+    """PREPARE the registered statements ``conn`` hasn't prepared yet. Called
+    by the pool on an idle connection before handing it out."""
+    prepared = getattr(conn, "prepared", None)
+    if prepared is None or not PREPARE_STATEMENTS:
+        return
+    for statement in list(_statements.values()):
+        if statement.name in prepared or statement.disabled:
+            continue
+        start = time.perf_counter()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(statement.prepare_sql)
+            conn.commit()
+        except psycopg2.Error as e:
+            if conn.closed:
+                # The connection is gone, using it will fail the same way
+                return
+            conn.rollback()
+            statement.disabled = True
+            logger.warning(f"Could not prepare {statement.name}: {str(e)}")
+            continue
+        statement.prepare_histogram.record((time.perf_counter() - start) * 1000)
+        prepared.add(statement.name)
+
+
+def execute(cur, statement, params=()):
+    """Run ``statement`` on ``cur`` by name when its connection has prepared
+    it, or as plain SQL otherwise. Results are fetched from ``cur`` as usual.
+    """
+    prepared = getattr(cur.connection, "prepared", ())
+    sql = statement.execute_sql if statement.name in prepared else statement.sql
+    start = time.perf_counter()
+    cur.execute(sql, params)
+    statement.histogram.record((time.perf_counter() - start) * 1000)
+
+
+def statement_stats():
+    """Execution and prepare latencies of every registered statement."""
+    return {
+        name: {
+            "prepared": not statement.disabled,
+            "execute": statement.histogram.snapshot(),
+            "prepare": statement.prepare_histogram.snapshot(),
+        }
+        for name, statement in _statements.items()
+    }
+
+
+def reset_statement_stats():
+    for statement in _statements.values():
+        statement.histogram.reset()
+        statement.prepare_histogram.reset()
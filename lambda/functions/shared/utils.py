@@ -0,0 +1,92 @@
+import json
+import time
+import traceback
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.event_handler.api_gateway import Response
+
+from .metrics import record_serialization, track_request
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+logger = Logger(child=True)
+
+# Number of dumps() calls so far, read by benchmarks/serialization.py
+serialization_count = 0
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Serialize ``obj`` to a JSON string, handling Decimal and datetime.
+
+    Uses orjson when it is installed and the standard library otherwise. This
+    is also the resolvers' serializer, so every response body goes through
+    here exactly once.
+    """
+    global serialization_count
+    serialization_count += 1
+    start = time.perf_counter()
+    if orjson is not None:
+        body = orjson.dumps(obj, default=_default).decode()
+    else:
+        body = json.dumps(obj, default=_default, separators=(",", ":"))
+    record_serialization((time.perf_counter() - start) * 1000)
+    return body
+
+
+def json_response(status_code, body, headers=None):
+    """Build a JSON ``Response``. ``body`` is serialized here unless it is an
+    already rendered JSON string."""
+    return Response(
+        status_code=status_code,
+        content_type="application/json",
+        headers=headers,
+        body=body if isinstance(body, str) else dumps(body),
+    )
+
+
+def error_response(status_code, message):
+    return json_response(status_code, {"error": message})
+
+
+def resolve(app, event, context):
+    """Resolve the event, turning anything the route exception handlers did
+    not catch into a JSON 500. The invocation's metrics are published once it
+    is done (see metrics.py)."""
+    with track_request(app) as request:
+        try:
+            response = app.resolve(event, context)
+        except Exception as e:
+            logger.error(f"An error occurred in the lambda handler: {str(e)}")
+            logger.error(f"Exception type: {type(e).__name__}")
+            logger.error(f"Exception traceback: {traceback.format_exc()}")
+            response = {
+                "statusCode": 500,
+                "body": dumps(
+                    {
+                        "error": "An internal server error occurred",
+                        "details": str(e),
+                        "type": type(e).__name__,
+                    }
+                ),
+            }
+        if request is not None:
+            request.status_code = response.get("statusCode")
+        return response
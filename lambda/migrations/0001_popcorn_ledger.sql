@@ -0,0 +1,22 @@
+-- Per-user popcorn snapshot at the latest task assignment, plus periodic
+-- checkpoints for historical reads. Maintained by popcorn/ledger.py.
+
+CREATE TABLE IF NOT EXISTS user_popcorn_ledger (
+    user_id INT8 PRIMARY KEY REFERENCES users (id),
+    total_popcorn FLOAT8 NOT NULL,
+    current_multiplier FLOAT8 NOT NULL,
+    last_event_at TIMESTAMPTZ NOT NULL,
+    event_count INT8 NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS user_popcorn_checkpoints (
+    user_id INT8 NOT NULL REFERENCES users (id),
+    last_event_at TIMESTAMPTZ NOT NULL,
+    total_popcorn FLOAT8 NOT NULL,
+    current_multiplier FLOAT8 NOT NULL,
+    PRIMARY KEY (user_id, last_event_at)
+);
+
+-- Existing users with tasks must be backfilled before the popcorn Lambda reads
+-- from the ledger:
+--   cd lambda/functions && PYTHONPATH=.:popcorn python -m popcorn.reconcile
@@ -0,0 +1,40 @@
+-- Leaderboard ranking index over the popcorn ledger.
+--
+-- A user's balance at epoch time t is popcorn_intercept + current_multiplier * t.
+-- Within one multiplier the order by popcorn_intercept never changes, so the
+-- leaderboard reads the top rows of each multiplier group and merges them.
+-- popcorn_multiplier_groups lists the distinct multipliers so that reads
+-- never have to scan the ledger to find them.
+
+ALTER TABLE user_popcorn_ledger ADD COLUMN IF NOT EXISTS popcorn_intercept FLOAT8;
+
+UPDATE user_popcorn_ledger
+SET popcorn_intercept = total_popcorn
+    - extract(epoch FROM last_event_at) * current_multiplier
+WHERE popcorn_intercept IS NULL;
+
+-- Users without tasks rank too, seed them at the base multiplier
+INSERT INTO user_popcorn_ledger
+    (user_id, total_popcorn, current_multiplier, last_event_at, event_count,
+     popcorn_intercept)
+SELECT id, 0, 1, created_date, 0, -extract(epoch FROM created_date)
+FROM users
+ON CONFLICT (user_id) DO NOTHING;
+
+ALTER TABLE user_popcorn_ledger ALTER COLUMN popcorn_intercept SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS user_popcorn_ledger_ranking_idx
+    ON user_popcorn_ledger (current_multiplier, popcorn_intercept DESC);
+
+CREATE TABLE IF NOT EXISTS popcorn_multiplier_groups (
+    current_multiplier FLOAT8 PRIMARY KEY
+);
+
+INSERT INTO popcorn_multiplier_groups (current_multiplier)
+SELECT DISTINCT current_multiplier FROM user_popcorn_ledger
+ON CONFLICT (current_multiplier) DO NOTHING;
+
+-- The base multiplier of users created later (auth create_users), even if
+-- there are no users yet
+INSERT INTO popcorn_multiplier_groups (current_multiplier) VALUES (1)
+ON CONFLICT (current_multiplier) DO NOTHING;
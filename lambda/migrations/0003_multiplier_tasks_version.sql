@@ -0,0 +1,6 @@
+-- Version stamp for the in-process task catalog cache (popcorn/tasks.py).
+-- The cache compares count(*) and max(updated_at) to decide whether to reload.
+-- ON UPDATE is CockroachDB syntax; on Postgres use an update trigger instead.
+
+ALTER TABLE multiplier_tasks
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now() ON UPDATE now();
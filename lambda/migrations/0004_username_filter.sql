@@ -0,0 +1,23 @@
+-- Username Bloom filter for the search Lambda (search/bloom.py).
+--
+-- users.updated_at is the high-water mark the filter refreshes from, and
+-- username_filter_snapshots holds the serialized filter it loads at init so
+-- a cold start reads one row instead of every username. Rebuild the snapshot
+-- periodically with:
+--   cd lambda/functions && PYTHONPATH=.:search python -m search.bloom
+-- ON UPDATE is CockroachDB syntax; on Postgres use an update trigger instead.
+
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now() ON UPDATE now();
+
+CREATE INDEX IF NOT EXISTS users_updated_at_idx ON users (updated_at) STORING (username);
+
+CREATE TABLE IF NOT EXISTS username_filter_snapshots (
+    name STRING PRIMARY KEY,
+    bit_count INT8 NOT NULL,
+    hash_count INT8 NOT NULL,
+    item_count INT8 NOT NULL,
+    bits BYTES NOT NULL,
+    high_water_mark TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
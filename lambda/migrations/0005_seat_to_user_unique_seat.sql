@@ -0,0 +1,8 @@
+-- One user per seat, so the seat allocator (seat/allocator.py) can claim a
+-- seat with a single INSERT ... ON CONFLICT DO NOTHING.
+-- Duplicate seats left by the old random assignment must be resolved first:
+--   SELECT seat_type_id, seat_row, seat_number, array_agg(user_id)
+--   FROM seat_to_user GROUP BY 1, 2, 3 HAVING count(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS seat_to_user_seat_key
+    ON seat_to_user (seat_type_id, seat_row, seat_number);
@@ -0,0 +1,11 @@
+-- Idempotency keys of the social callback jobs the worker has awarded
+-- (popcorn/worker.py). Claiming the key and inserting the task happen in one
+-- transaction, so a redelivered or repeated callback is never awarded twice.
+
+CREATE TABLE IF NOT EXISTS social_callback_jobs (
+    idempotency_key STRING PRIMARY KEY,
+    social STRING NOT NULL,
+    user_id INT8 NOT NULL REFERENCES users (id),
+    multiplier_task_id INT8 NOT NULL,
+    processed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,13 @@
+-- Bulk invite code generation (popcorn/invite_codes.py).
+--
+-- Codes are minted from a per-type sequence: a call claims a range of numbers
+-- from invite_code_sequences and each number is turned into a code by a keyed
+-- permutation, so codes never collide as long as INVITE_CODE_KEY is not
+-- changed. The codes themselves go to the existing tables: GEN- codes to
+-- invite_codes (with the seat type they grant), USR- codes to
+-- user_invite_codes and SW- codes to sandwatch_invite_codes.
+
+CREATE TABLE IF NOT EXISTS invite_code_sequences (
+    code_type STRING PRIMARY KEY,
+    next_value INT8 NOT NULL
+);
@@ -0,0 +1,11 @@
+-- One row per invite code applied by a user (popcorn/redemption.py). The
+-- primary key stops a user from applying the same code twice, including two
+-- concurrent requests; SW- codes are additionally marked used.
+
+CREATE TABLE IF NOT EXISTS invite_code_redemptions (
+    user_id INT8 NOT NULL REFERENCES users (id),
+    code STRING NOT NULL,
+    code_type STRING NOT NULL,
+    redeemed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, code)
+);
@@ -0,0 +1,12 @@
+-- Uses of shared GEN- invite codes (popcorn/redemption.py). Every code has up
+-- to INVITE_CODE_USAGE_SHARDS rows and a redemption increments a random one,
+-- so concurrent redemptions of one code rarely wait on the same row; the
+-- count of a code is the sum of its rows. The shard count can be changed at
+-- any time, reads sum whatever rows exist.
+
+CREATE TABLE IF NOT EXISTS invite_code_usage (
+    code STRING NOT NULL,
+    shard INT8 NOT NULL,
+    uses INT8 NOT NULL,
+    PRIMARY KEY (code, shard)
+);
@@ -0,0 +1,11 @@
+-- Version stamp for the seat maps of the seat allocator (seat/allocator.py).
+-- The allocator compares count(*) and max(updated_at) per section, so a seat
+-- released and another one taken in the same section between two checks still
+-- reloads the map. The index answers that check without reading the rows.
+-- ON UPDATE is CockroachDB syntax; on Postgres use an update trigger instead.
+
+ALTER TABLE seat_to_user
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now() ON UPDATE now();
+
+CREATE INDEX IF NOT EXISTS seat_to_user_seat_type_updated_at
+    ON seat_to_user (seat_type_id) STORING (updated_at);
@@ -0,0 +1,8 @@
+-- One seat per user. seat/handler.py checks for a seat before /assign
+-- reserves one, but two concurrent requests for the same user could both pass
+-- that check; the second insert now fails and is answered with 409.
+-- Users with several seats must be resolved first:
+--   SELECT user_id, array_agg(id) FROM seat_to_user
+--   GROUP BY user_id HAVING count(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS seat_to_user_user_key ON seat_to_user (user_id);
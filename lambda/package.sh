@@ -0,0 +1,77 @@
+#!/bin/bash
+
+# Build functions/<name>/<name>.zip: the function, shared/ and its runtime
+# dependencies, without modules the Lambda runtime never loads and with
+# bytecode precompiled for the runtime.
+# Usage (from the lambda directory): ./package.sh <function name>
+#
+# Dependencies are installed as the wheels of the Lambda platform and the
+# bytecode is compiled by python $RUNTIME_PYTHON, whatever the build host runs:
+# .pyc files are only used by the interpreter version that wrote them. Without
+# a python$RUNTIME_PYTHON on the host (or $PYTHON pointing at one), the build
+# runs in the Lambda base image through docker instead.
+
+set -e
+
+# Keep in step with runtime in infra/modules/lambda/main.tf
+RUNTIME_PYTHON=3.12
+RUNTIME_PLATFORM=manylinux2014_x86_64
+BUILD_IMAGE=public.ecr.aws/lambda/python:$RUNTIME_PYTHON
+PYTHON=${PYTHON:-python$RUNTIME_PYTHON}
+
+# Distributions the package never needs: the AWS SDK is part of the runtime,
+# the rest are install tooling and type stubs pulled in as dependencies
+UNUSED_DISTRIBUTIONS="boto3 botocore s3transfer pip setuptools wheel types-*"
+
+FUNCTION=$1
+if [ -z "$FUNCTION" ] || [ ! -d "functions/$FUNCTION" ]; then
+    echo "Usage: $0 <function name>"
+    exit 1
+fi
+
+if ! command -v "$PYTHON" &> /dev/null; then
+    if [ -z "$IN_BUILD_IMAGE" ] && command -v docker &> /dev/null; then
+        echo "No $PYTHON on this host, building in $BUILD_IMAGE"
+        exec docker run --rm -e IN_BUILD_IMAGE=1 -e HOME=/tmp \
+            --user "$(id -u):$(id -g)" -v "$PWD":/build -w /build \
+            --entrypoint /bin/bash "$BUILD_IMAGE" ./package.sh "$FUNCTION"
+    fi
+    echo "$PYTHON not found: install python $RUNTIME_PYTHON, set PYTHON or install docker"
+    exit 1
+fi
+if [ "$("$PYTHON" -c 'import sys; print("%d.%d" % sys.version_info[:2])')" != "$RUNTIME_PYTHON" ]; then
+    echo "$PYTHON is not python $RUNTIME_PYTHON, the runtime's version"
+    exit 1
+fi
+
+cd "functions/$FUNCTION"
+rm -rf dist package
+"$PYTHON" -m pip wheel --quiet --no-deps -w dist .
+"$PYTHON" -m pip install --quiet --upgrade --no-compile -t package \
+    --platform "$RUNTIME_PLATFORM" --implementation cp \
+    --python-version "$RUNTIME_PYTHON" --only-binary=:all: dist/*.whl
+cp -r ../shared package/shared
+
+cd package
+
+# Remove the unused distributions file by file, as listed in their RECORD
+for pattern in $UNUSED_DISTRIBUTIONS; do
+    for record in $(ls -d ${pattern//-/_}-*.dist-info/RECORD 2> /dev/null); do
+        echo "Removing $(dirname "$record")"
+        cut -d, -f1 "$record" | while read -r path; do rm -f "$path"; done
+        rm -rf "$(dirname "$record")"
+    done
+done
+find . -depth -type d -empty -delete
+
+# Strip test suites, caches, type stubs, docs and extension sources
+find . -type d \( -name tests -o -name __pycache__ -o -name "*-stubs" \) -prune -exec rm -rf {} +
+find . -type f \( -name "*.pyi" -o -name "*.pyx" -o -name "*.pxd" -o -name "*.c" -o -name "*.h" -o -name "*.md" \) -delete
+rm -rf bin
+
+# Precompile with the runtime's python. Unchecked-hash pycs are loaded without
+# comparing source mtimes, which the zip does not preserve reliably anyway.
+"$PYTHON" -m compileall -q -j 0 --invalidation-mode unchecked-hash .
+
+mkdir -p out; zip -r -q "out/$FUNCTION.zip" . -x 'out/*'
+cp "out/$FUNCTION.zip" ../